@@ -87,10 +87,30 @@ WSGI_APPLICATION = 'SubCal.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+#
+# The gunicorn workers and the run_jobs worker share one SQLite file. WAL lets
+# readers carry on while one connection writes, and IMMEDIATE transactions take
+# the write lock when they begin, waiting up to the busy timeout for it, rather
+# than failing with "database is locked" when a read later needs to write.
+# Set a pragma to an empty value to keep SQLite's default.
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'SubCal.sqlite',
         'NAME': os.path.join(os.environ.get('DATABASE_DIR', BASE_DIR), 'db.sqlite3'),
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', '600')),  # Seconds each worker keeps its connection
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pragmas': {
+                'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+                'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+                'busy_timeout': os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'),  # Milliseconds to wait for a lock
+                'cache_size': os.environ.get('SQLITE_CACHE_SIZE', '-20000'),  # Pages, or KiB if negative
+                'mmap_size': os.environ.get('SQLITE_MMAP_SIZE', '134217728'),  # Bytes of the file read through mmap
+                'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+            },
+            'transaction_mode': os.environ.get('SQLITE_TRANSACTION_MODE', 'IMMEDIATE') or None,
+        },
     }
 }
 
@@ -143,3 +163,61 @@ WHITENOISE_AUTOREFRESH = True
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Renewal occurrences
+# Renewals are pre-computed for this many months either side of today
+
+RENEWAL_OCCURRENCE_MONTHS_BACK = int(os.environ.get('RENEWAL_OCCURRENCE_MONTHS_BACK', '24'))
+RENEWAL_OCCURRENCE_MONTHS_FORWARD = int(os.environ.get('RENEWAL_OCCURRENCE_MONTHS_FORWARD', '36'))
+
+
+# Subscription list
+# Sorting, filtering and paging run in the database, using the stored
+# next_billing_date that the roll_next_billing_dates command keeps current
+
+SUBSCRIPTION_LIST_PAGE_SIZE = int(os.environ.get('SUBSCRIPTION_LIST_PAGE_SIZE', '50'))  # Subscriptions per list page
+
+
+# Exchange rates
+# The overview page only reads stored rates, which are refreshed from this API
+# by the refresh_exchange_rates command or a background thread once stale
+
+EXCHANGE_RATE_API_URL = os.environ.get('EXCHANGE_RATE_API_URL', 'https://open.er-api.com/v6/latest/GBP')
+EXCHANGE_RATE_TTL = int(os.environ.get('EXCHANGE_RATE_TTL', '21600'))  # Seconds before rates are stale
+EXCHANGE_RATE_TIMEOUT = float(os.environ.get('EXCHANGE_RATE_TIMEOUT', '5'))  # Seconds per API request
+EXCHANGE_RATE_CACHE_SECONDS = int(os.environ.get('EXCHANGE_RATE_CACHE_SECONDS', '60'))  # In-process cache lifetime
+EXCHANGE_RATE_BACKGROUND_REFRESH = os.environ.get('EXCHANGE_RATE_BACKGROUND_REFRESH', 'True').lower() == 'true'
+
+
+# Cache
+# Calendar pages are cached per user and invalidated through their data version.
+# The default in-memory cache is per process; use a shared backend (e.g.
+# django.core.cache.backends.filebased.FileBasedCache or a Redis cache) so that
+# every worker and the warm_calendar_cache command share one cache.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'subcal'),
+    }
+}
+CALENDAR_CACHE_TIMEOUT = int(os.environ.get('CALENDAR_CACHE_TIMEOUT', '86400'))  # Seconds each calendar month is cached
+
+
+# CSV imports
+# Uploaded rows are staged in the database until the import is confirmed
+
+STAGED_IMPORT_MAX_AGE = int(os.environ.get('STAGED_IMPORT_MAX_AGE', '86400'))  # Seconds before unconfirmed imports are purged
+IMPORT_PREVIEW_PAGE_SIZE = int(os.environ.get('IMPORT_PREVIEW_PAGE_SIZE', '100'))  # Rows per import preview page
+
+
+# Background jobs
+# Imports and full exports are queued and run by the run_jobs worker command
+
+JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', '2'))  # Jobs each worker runs at once
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '2'))  # Seconds the worker waits for new jobs
+JOB_RESULT_MAX_AGE = int(os.environ.get('JOB_RESULT_MAX_AGE', '86400'))  # Seconds finished jobs and their files are kept
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get('JOB_HEARTBEAT_INTERVAL', '30'))  # Seconds between a worker's heartbeats
+JOB_HEARTBEAT_TIMEOUT = int(os.environ.get('JOB_HEARTBEAT_TIMEOUT', '300'))  # Seconds without a heartbeat before a job is lost
+JOB_RESULT_DIR = os.environ.get('JOB_RESULT_DIR', os.path.join(os.environ.get('DATABASE_DIR', BASE_DIR), 'job_results'))
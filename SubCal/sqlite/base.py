@@ -0,0 +1,58 @@
+"""
+SQLite database backend that tunes each connection with PRAGMA statements.
+
+Django's own SQLite backend, plus an OPTIONS['pragmas'] dictionary of PRAGMA
+names and values that are set on every new connection, in order. Empty
+values are skipped, leaving SQLite's default. Use it as the ENGINE:
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'SubCal.sqlite',
+            'OPTIONS': {
+                'pragmas': {'journal_mode': 'WAL', 'busy_timeout': '5000'},
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+"""
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+# PRAGMA statements that can be set from the settings
+PRAGMAS = frozenset([
+    'journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store',
+    'foreign_keys', 'wal_autocheckpoint', 'journal_size_limit',
+])
+
+# PRAGMA values are keywords or whole numbers, which are safe to put in the SQL
+PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        # Take the pragmas out before the rest of OPTIONS is passed to sqlite3.connect()
+        kwargs = super().get_connection_params()
+        pragmas = kwargs.pop('pragmas', None) or {}
+
+        self.pragmas = []
+        for name, value in pragmas.items():
+            value = str(value).strip()
+            if not value:
+                continue
+            if name not in PRAGMAS or not PRAGMA_VALUE.match(value):
+                raise ImproperlyConfigured(
+                    f"settings.DATABASES[{self.alias!r}]['OPTIONS']['pragmas'] sets "
+                    f"{name!r} to {value!r}. Use one of {', '.join(sorted(PRAGMAS))} "
+                    f"with a keyword or number."
+                )
+            self.pragmas.append(f'PRAGMA {name} = {value}')
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        return conn
@@ -0,0 +1,84 @@
+"""
+Benchmark backing up and restoring accounts of increasing size.
+
+Streams each account's backup archive the way the response would, keeping
+only its size, then restores it into an empty account. Reports the archive
+size, and the peak Python memory allocated and time taken for both, which
+include the overhead of tracing memory allocations. Restores also
+materialize the subscriptions' renewal occurrences, which is most of their
+time.
+
+Runs with DEBUG off, as otherwise the SQL of every insert is kept in the
+query log.
+
+    python benchmarks/bench_backup.py
+"""
+from common import create_user_with_subscriptions, print_table, test_database
+
+import tempfile
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+
+from subscriptions.backup import generate_backup, restore_backup
+
+BACKUP_SIZES = [10000, 100000]
+RESTORE_SIZES = [5000, 20000]
+
+User = get_user_model()
+
+
+def measure(func):
+    """
+    Call func once and return its result, peak traced memory in MiB and time in seconds.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak / 1024 / 1024, elapsed
+
+
+def write_backup(user, archive_file):
+    """
+    Stream a user's backup into a file, returning its size in bytes.
+    """
+    size = 0
+    for data in generate_backup(user):
+        archive_file.write(data)
+        size += len(data)
+    return size
+
+
+def main():
+    rows = []
+
+    with test_database(), override_settings(DEBUG=False):
+        for size in sorted(set(BACKUP_SIZES + RESTORE_SIZES)):
+            user = create_user_with_subscriptions(f'backup-{size}', size, seed=size, materialize=False)
+
+            with tempfile.TemporaryFile() as archive_file:
+                archive_size, backup_peak, backup_s = measure(lambda: write_backup(user, archive_file))
+                row = [size, f'{archive_size / 1024 / 1024:.1f}', f'{backup_peak:.1f}', f'{backup_s:.1f}']
+
+                if size in RESTORE_SIZES:
+                    restored_user = User.objects.create_user(username=f'restored-{size}', password='benchmark')
+                    archive_file.seek(0)
+                    results, restore_peak, restore_s = measure(lambda: restore_backup(restored_user, archive_file))
+                    assert results['subscriptions'].imported == size
+                    row += [f'{restore_peak:.1f}', f'{restore_s:.1f}']
+                else:
+                    row += ['-', '-']
+
+            rows.append(row)
+
+    print('Whole-account backup and restore')
+    print_table(['subscriptions', 'archive MiB', 'backup peak MiB', 'backup s', 'restore peak MiB', 'restore s'], rows)
+
+
+if __name__ == '__main__':
+    main()
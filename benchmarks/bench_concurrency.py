@@ -0,0 +1,126 @@
+"""
+Benchmark concurrent writes to one SQLite database from several processes.
+
+Starts worker processes, like gunicorn workers, that each add subscriptions
+in transactions which first read the user's subscriptions and then write,
+as the views and imports do. Each transaction is followed by the end-of-
+request connection check, so connections are reopened unless CONN_MAX_AGE
+keeps them. Compares Django's SQLite defaults, WAL on its own, and the
+tuned settings, counting the transactions that failed with "database is
+locked".
+
+Runs against a throw-away database in a temporary directory, as the test
+database is in memory and can't be shared between processes.
+
+    python benchmarks/bench_concurrency.py
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+WORKERS = 8
+TRANSACTIONS = 200
+
+# Environment for each configuration; empty values keep SQLite's and Django's defaults
+CONFIGURATIONS = {
+    'defaults': {
+        'SQLITE_JOURNAL_MODE': '', 'SQLITE_SYNCHRONOUS': '', 'SQLITE_BUSY_TIMEOUT': '', 'SQLITE_CACHE_SIZE': '',
+        'SQLITE_MMAP_SIZE': '', 'SQLITE_TEMP_STORE': '', 'SQLITE_TRANSACTION_MODE': '', 'DATABASE_CONN_MAX_AGE': '0',
+    },
+    'WAL only': {
+        'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': '', 'SQLITE_BUSY_TIMEOUT': '', 'SQLITE_CACHE_SIZE': '',
+        'SQLITE_MMAP_SIZE': '', 'SQLITE_TEMP_STORE': '', 'SQLITE_TRANSACTION_MODE': '', 'DATABASE_CONN_MAX_AGE': '0',
+    },
+    'tuned': {},
+}
+
+
+def worker(username):
+    """
+    Run TRANSACTIONS read-then-write transactions and print the outcome as JSON.
+    """
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SubCal.settings')
+
+    import django
+
+    django.setup()
+
+    from datetime import date
+    from decimal import Decimal
+
+    from django.contrib.auth import get_user_model
+    from django.db import OperationalError, close_old_connections, transaction
+
+    from subscriptions.models import Subscription
+
+    user = get_user_model().objects.get(username=username)
+    written = locked = 0
+    start = time.perf_counter()
+    for index in range(TRANSACTIONS):
+        try:
+            with transaction.atomic():
+                count = Subscription.objects.filter(user=user).count()
+                Subscription.objects.create(
+                    user=user, name=f'{os.getpid()}-{index}-{count}', cost=Decimal('9.99'),
+                    currency='GBP', start_date=date(2024, 1, 1)
+                )
+            written += 1
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            locked += 1
+        # What Django does at the end of every request
+        close_old_connections()
+
+    print(json.dumps({'written': written, 'locked': locked, 'seconds': time.perf_counter() - start}))
+
+
+def run(name, overrides):
+    """
+    Migrate a new database in a temporary directory and run the workers against it.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        env = {**os.environ, 'DATABASE_DIR': directory, 'DEBUG': 'False', **overrides}
+        manage = [sys.executable, str(BASE_DIR / 'manage.py')]
+        subprocess.run([*manage, 'migrate', '-v', '0'], env=env, check=True)
+        subprocess.run(
+            [*manage, 'shell', '-c',
+             "from django.contrib.auth import get_user_model; "
+             "get_user_model().objects.create_user(username='bench', password='benchmark')"],
+            env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+        start = time.perf_counter()
+        processes = [
+            subprocess.Popen([sys.executable, __file__, '--worker', 'bench'], env=env, stdout=subprocess.PIPE, text=True)
+            for _ in range(WORKERS)
+        ]
+        results = [json.loads(process.communicate()[0]) for process in processes]
+        elapsed = time.perf_counter() - start
+
+    written = sum(result['written'] for result in results)
+    locked = sum(result['locked'] for result in results)
+    return [name, written, locked, f'{locked * 100 / (WORKERS * TRANSACTIONS):.1f}', f'{elapsed:.1f}', f'{written / elapsed:.0f}']
+
+
+def main():
+    from common import print_table
+
+    rows = [run(name, overrides) for name, overrides in CONFIGURATIONS.items()]
+
+    print(f'{WORKERS} processes x {TRANSACTIONS} read-then-write transactions')
+    print_table(['settings', 'written', 'locked', 'locked %', 'seconds', 'writes/s'], rows)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--worker']:
+        worker(sys.argv[2])
+    else:
+        main()
@@ -0,0 +1,104 @@
+"""
+Benchmark re-importing a CSV of subscriptions the user already has, with
+10,000 and 100,000 existing subscriptions.
+
+Compares checking each row for a matching subscription with one query on
+its fields, which has no index to use and scans the user's subscriptions,
+against the fingerprint lookup the import engine makes once per batch.
+The per-row check is timed on the first 1,000 rows and scaled up to the
+whole file.
+
+    python benchmarks/bench_dedup.py
+"""
+from common import create_user_with_subscriptions, print_table, test_database
+
+import time
+
+from django.db import connection
+from django.test import override_settings
+
+from subscriptions.importers import import_subscriptions
+from subscriptions.models import Subscription
+
+SIZES = [10000, 100000]
+
+# Rows checked one at a time by the per-row approach
+SAMPLE_ROWS = 1000
+
+
+def export_rows(user):
+    """
+    Get the user's subscriptions as the CSV parser would return them from an export.
+    """
+    return [
+        {
+            'name': name,
+            'cost': str(cost),
+            'currency': currency,
+            'renewal_period': renewal_period,
+            'start_date': start_date,
+            'status': 'active',
+        }
+        for name, cost, currency, renewal_period, start_date in Subscription.objects.filter(user=user).values_list(
+            'name', 'cost', 'currency', 'renewal_period', 'start_date'
+        )
+    ]
+
+
+def per_row_check(user, rows):
+    """
+    Check each row for an existing subscription with the same fields.
+    """
+    return sum(
+        Subscription.objects.filter(
+            user=user,
+            name=row['name'],
+            cost=row['cost'],
+            currency=row['currency'],
+            renewal_period=row['renewal_period'],
+            start_date=row['start_date'],
+        ).exists()
+        for row in rows
+    )
+
+
+def measure(func):
+    """
+    Call func once and return its result, query count and wall-clock time in milliseconds.
+    """
+    queries = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    with connection.execute_wrapper(count_query):
+        result = func()
+    return result, queries, (time.perf_counter() - start) * 1000
+
+
+def main():
+    rows = []
+
+    with test_database(), override_settings(DEBUG=False):
+        for size in SIZES:
+            user = create_user_with_subscriptions(f'dedup-{size}', size, seed=size, materialize=False)
+            data = export_rows(user)
+
+            found, _, sample_ms = measure(lambda: per_row_check(user, data[:SAMPLE_ROWS]))
+            assert found == SAMPLE_ROWS
+            per_row_ms = sample_ms / SAMPLE_ROWS * size
+
+            result, queries, fingerprint_ms = measure(lambda: import_subscriptions(user, enumerate(data, 1)))
+            assert (result.imported, result.skipped) == (0, size)
+
+            rows.append([size, size, f'{per_row_ms:.0f}', queries, f'{fingerprint_ms:.0f}', f'{per_row_ms / fingerprint_ms:.1f}x'])
+
+    print('Re-importing existing subscriptions (per-row time scaled up from the first 1,000 rows)')
+    print_table(['rows', 'per-row queries', 'per-row ms', 'fingerprint queries', 'fingerprint ms', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    main()
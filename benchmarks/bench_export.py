@@ -0,0 +1,59 @@
+"""
+Benchmark streaming the subscriptions CSV export at 10,000, 50,000 and
+200,000 subscriptions.
+
+Reports the number of queries, the peak Python memory allocated while
+streaming the response, and the time taken, for the export view.
+
+    python benchmarks/bench_export.py
+"""
+from common import create_user_with_subscriptions, print_table, test_database
+
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from subscriptions.views import export_subscriptions_csv
+
+SIZES = [10000, 50000, 200000]
+
+
+def stream_export(request):
+    """
+    Stream the export view's response and return its size in bytes.
+    """
+    response = export_subscriptions_csv(request)
+    size = sum(len(chunk) for chunk in response.streaming_content)
+    response.close()
+    return size
+
+
+def main():
+    factory = RequestFactory()
+    rows = []
+
+    with test_database():
+        for size in SIZES:
+            user = create_user_with_subscriptions(f'export-{size}', size, seed=size, materialize=False)
+            request = factory.get('/subscriptions/export/csv/')
+            request.user = user
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                exported = stream_export(request)
+            elapsed = (time.perf_counter() - start) * 1000
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            rows.append([size, len(queries), f'{exported / 1024 / 1024:.1f}', f'{peak / 1024 / 1024:.1f}', f'{elapsed:.0f}'])
+
+    print('Subscriptions CSV export')
+    print_table(['subscriptions', 'queries', 'export MiB', 'peak MiB', 'ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark importing 1,000 and 10,000 subscriptions.
+
+Compares the old import loop, which ran get_or_create() for the category and
+create() for each row, with the bulk import engine, and reports the number
+of queries and the time taken for both.
+
+    python benchmarks/bench_import.py
+"""
+from common import print_table, test_database
+
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from subscriptions.importers import import_subscriptions
+from subscriptions.models import Category, Subscription
+
+SIZES = [1000, 10000]
+
+User = get_user_model()
+
+
+def make_rows(count, seed=0):
+    """
+    Build count random subscription rows, as the CSV parser returns them.
+    """
+    rng = random.Random(seed)
+    categories = ['Food', 'Petrol', 'Streaming', 'Software', 'Utilities', '']
+    renewal_periods = [choice for choice, _ in Subscription.RENEWAL_CHOICES]
+    currencies = [choice for choice, _ in Subscription.CURRENCY_CHOICES]
+    today = date.today()
+
+    return [
+        {
+            'name': f'Subscription {index}',
+            'category': rng.choice(categories),
+            'cost': f'{rng.randrange(100, 10000) / 100:.2f}',
+            'currency': rng.choice(currencies),
+            'renewal_period': rng.choice(renewal_periods),
+            'start_date': today - timedelta(days=rng.randrange(3650)),
+            'url': '',
+            'notes': '',
+            'status': 'active',
+            'cancellation_date': None,
+        }
+        for index in range(count)
+    ]
+
+
+def legacy_import(user, rows):
+    """
+    Import rows one at a time, as the import views used to.
+    """
+    for row in rows:
+        category = None
+        if row.get('category'):
+            category, _ = Category.objects.get_or_create(name=row['category'], user=user)
+        Subscription.objects.create(
+            name=row['name'],
+            category=category,
+            cost=row['cost'],
+            currency=row['currency'],
+            renewal_period=row['renewal_period'],
+            start_date=row['start_date'],
+            url=row['url'],
+            notes=row['notes'],
+            status=row['status'],
+            cancellation_date=row['cancellation_date'],
+            user=user
+        )
+
+
+def measure(func):
+    """
+    Call func once and return its query count and wall-clock time in milliseconds.
+    """
+    # Count with an execute wrapper, as the query log only keeps the last 9,000
+    queries = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    with connection.execute_wrapper(count_query):
+        func()
+    return queries, (time.perf_counter() - start) * 1000
+
+
+def main():
+    rows = []
+
+    with test_database():
+        for size in SIZES:
+            data = make_rows(size, seed=size)
+
+            legacy_user = User.objects.create_user(username=f'legacy-{size}', password='benchmark')
+            legacy_queries, legacy_ms = measure(lambda: legacy_import(legacy_user, data))
+
+            bulk_user = User.objects.create_user(username=f'bulk-{size}', password='benchmark')
+            bulk_queries, bulk_ms = measure(lambda: import_subscriptions(bulk_user, enumerate(data, 1)))
+
+            rows.append([size, legacy_queries, f'{legacy_ms:.0f}', bulk_queries, f'{bulk_ms:.0f}', f'{legacy_ms / bulk_ms:.1f}x'])
+
+    print('Subscriptions CSV import')
+    print_table(['rows', 'legacy queries', 'legacy ms', 'bulk queries', 'bulk ms', 'speedup'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark the subscription list at 1,000, 10,000 and 100,000 subscriptions.
+
+Renders the first page and a page 90% of the way through the list, sorted
+by name and by next billing date, and compares reading that deep page with
+OFFSET against seeking to its keyset cursor. The view also counts and
+totals every subscription, which grows with the account; the totals are
+cached until the user's data changes, so the best of the repeated renders
+is the cost of a page with the totals cached.
+
+Runs with DEBUG off, as otherwise the SQL of every query is kept in the
+query log.
+
+    python benchmarks/bench_list.py
+"""
+from common import create_user_with_subscriptions, print_table, test_database, timed
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.functions import Lower
+from django.test import RequestFactory, override_settings
+
+from subscriptions.models import Subscription
+from subscriptions.pagination import KeysetPaginator, encode_cursor
+from subscriptions.views import SubscriptionListView
+
+SIZES = [1000, 10000, 100000]
+
+SORT_KEYS = {
+    'name': Lower('name'),
+    'next_billing_date': F('next_billing_date'),
+}
+
+
+def main():
+    factory = RequestFactory()
+    view = SubscriptionListView.as_view()
+    page_size = settings.SUBSCRIPTION_LIST_PAGE_SIZE
+    rows = []
+
+    with test_database(), override_settings(DEBUG=False):
+        for size in SIZES:
+            user = create_user_with_subscriptions(f'list-{size}', size, seed=size, materialize=False)
+            queryset = Subscription.objects.filter(user=user)
+            offset = size * 9 // 10
+
+            for sort, key in SORT_KEYS.items():
+                nullable = sort == 'next_billing_date'
+                ordered = queryset.order_by(key.asc(nulls_last=True) if nullable else key.asc(), 'pk')
+
+                # The cursor the page before the deep page would link to
+                row = ordered.annotate(keyset_value=key)[offset - 1]
+                cursor = encode_cursor(row.keyset_value, row.pk)
+                paginator = KeysetPaginator(queryset, key, page_size, nullable=nullable)
+                assert [s.pk for s in paginator.page(after=cursor)] == [s.pk for s in ordered[offset:offset + page_size]]
+
+                def render(params):
+                    request = factory.get('/subscriptions/', params)
+                    request.user = user
+                    view(request).render()
+
+                rows.append([
+                    size,
+                    sort,
+                    f'{timed(lambda: list(ordered[offset:offset + page_size]), repeat=3):.1f}',
+                    f'{timed(lambda: list(paginator.page(after=cursor)), repeat=3):.1f}',
+                    f'{timed(lambda: render({"sort": sort}), repeat=3):.1f}',
+                    f'{timed(lambda: render({"sort": sort, "after": cursor}), repeat=3):.1f}',
+                ])
+
+    print(f'Subscription list pages of {page_size} (best of 3, milliseconds)')
+    print_table(['subscriptions', 'sort', 'offset page', 'keyset page', 'first page view', 'deep page view'], rows)
+
+
+if __name__ == '__main__':
+    main()
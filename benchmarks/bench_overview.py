@@ -0,0 +1,165 @@
+"""
+Benchmark the overview page for a user with 5,000 subscriptions.
+
+Compares the old approach of making a separate pass over the subscriptions
+for each breakdown (category, currency, subscription, annual totals, monthly
+billed costs and monthly costs) with the single aggregate_spending pass, and
+reports the query count and latency of the whole overview view.
+
+    python benchmarks/bench_overview.py
+"""
+from common import create_user_with_subscriptions, print_table, test_database, timed
+
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from subscriptions.exchange_rates import FALLBACK_EXCHANGE_RATES
+from subscriptions.models import Category, Subscription
+from subscriptions.overview import OverviewView
+
+SIZE = 5000
+
+
+ANNUAL_FACTORS = {'weekly': 52, 'monthly': 12, 'quarterly': 4, 'yearly': 1, 'biennial': Decimal('0.5')}
+
+
+def legacy_annual_cost(subscription):
+    """
+    Annual cost worked out in Python, as the views used to.
+    """
+    return subscription.cost * ANNUAL_FACTORS.get(subscription.renewal_period, 1)
+
+
+def legacy_monthly_cost(subscription):
+    """
+    Monthly cost worked out in Python, as the views used to.
+    """
+    return legacy_annual_cost(subscription) / 12
+
+
+def separate_passes(view, subscriptions, exchange_rates, year):
+    """
+    Build the overview breakdowns the way the view used to: one pass each,
+    recalculating the annual cost and conversion rate every time.
+    """
+    active_subscriptions = [s for s in subscriptions if s.status != 'cancelled']
+
+    def gbp_rate(currency):
+        return Decimal(str(exchange_rates.get(currency, 1.0)))
+
+    def category_name(subscription):
+        return subscription.category.name if subscription.category else 'Uncategorized'
+
+    # Category spending
+    category_spending = {category.name: {'original_cost': 0, 'original_currency': 'GBP', 'gbp_cost': 0}
+                         for category in Category.objects.all()}
+    category_spending.setdefault('Uncategorized', {'original_cost': 0, 'original_currency': 'GBP', 'gbp_cost': 0})
+    for subscription in active_subscriptions:
+        annual_cost = legacy_annual_cost(subscription)
+        totals = category_spending[category_name(subscription)]
+        totals['original_cost'] += annual_cost
+        totals['original_currency'] = subscription.currency
+        totals['gbp_cost'] += annual_cost * gbp_rate(subscription.currency)
+
+    # Currency spending and annual totals
+    for _ in range(2):
+        currency_spending = {}
+        for subscription in active_subscriptions:
+            annual_cost = legacy_annual_cost(subscription)
+            totals = currency_spending.setdefault(subscription.currency, {
+                'original_cost': 0, 'gbp_cost': 0, 'symbol': subscription.get_currency_symbol()
+            })
+            totals['original_cost'] += annual_cost
+            totals['gbp_cost'] += annual_cost * gbp_rate(subscription.currency)
+
+    # Subscription spending
+    subscription_spending = []
+    for subscription in active_subscriptions:
+        annual_cost = legacy_annual_cost(subscription)
+        subscription_spending.append({
+            'name': subscription.name,
+            'category': category_name(subscription),
+            'annual_cost': annual_cost,
+            'currency': subscription.currency,
+            'symbol': subscription.get_currency_symbol(),
+            'renewal_period': subscription.get_renewal_period_display(),
+            'gbp_cost': annual_cost * gbp_rate(subscription.currency),
+        })
+    subscription_spending.sort(key=lambda x: x['gbp_cost'], reverse=True)
+
+    # Monthly billed costs and monthly costs, checking every month
+    for monthly_subscriptions, billed in ((subscriptions, True), (active_subscriptions, False)):
+        months = {month: {'original_costs': {}, 'gbp_cost': 0, 'subscriptions': []} for month in range(1, 13)}
+        for subscription in monthly_subscriptions:
+            if billed:
+                billing_months = view.billed_months(subscription, year)
+                cost = subscription.cost
+            else:
+                billing_months = range(1, 13)
+                cost = legacy_monthly_cost(subscription)
+            gbp_cost = cost * gbp_rate(subscription.currency)
+            for month in billing_months:
+                if date(year, month, 1) < subscription.start_date.replace(day=1):
+                    continue
+                month_data = months[month]
+                month_data['original_costs'][subscription.currency] = month_data['original_costs'].get(subscription.currency, 0) + cost
+                month_data['gbp_cost'] += gbp_cost
+                month_data['subscriptions'].append({
+                    'name': subscription.name,
+                    'cost': cost,
+                    'currency': subscription.currency,
+                    'symbol': subscription.get_currency_symbol(),
+                    'gbp_cost': gbp_cost,
+                })
+
+
+def main():
+    year = date.today().year
+    factory = RequestFactory()
+
+    # Don't try to refresh the exchange rates from the rates API
+    with test_database(), override_settings(EXCHANGE_RATE_BACKGROUND_REFRESH=False):
+        user = create_user_with_subscriptions('overview', SIZE, seed=SIZE, materialize=False)
+        view = OverviewView()
+        exchange_rates = dict(FALLBACK_EXCHANGE_RATES)
+
+        def load():
+            return list(Subscription.objects.filter(user=user).select_related('category'))
+
+        def category_names():
+            return list(Category.objects.filter(user=user).values_list('name', flat=True))
+
+        subscriptions = load()
+        names = category_names()
+
+        request = factory.get('/overview/', {'year': year})
+        request.user = user
+
+        def render_overview():
+            OverviewView.as_view()(request).render()
+
+        with CaptureQueriesContext(connection) as separate_queries:
+            separate_passes(view, load(), exchange_rates, year)
+        with CaptureQueriesContext(connection) as single_queries:
+            view.aggregate_spending(load(), category_names(), exchange_rates, year)
+        with CaptureQueriesContext(connection) as view_queries:
+            render_overview()
+
+        rows = [
+            ['separate passes', len(separate_queries),
+             f'{timed(lambda: separate_passes(view, subscriptions, exchange_rates, year), repeat=3):.1f}'],
+            ['single pass', len(single_queries),
+             f'{timed(lambda: view.aggregate_spending(subscriptions, names, exchange_rates, year), repeat=3):.1f}'],
+            ['full view', len(view_queries), f'{timed(render_overview, repeat=3):.1f}'],
+        ]
+
+    print(f'Overview for {SIZE} subscriptions in {year} (best of 3, milliseconds)')
+    print_table(['approach', 'queries', 'ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
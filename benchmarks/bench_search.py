@@ -0,0 +1,105 @@
+"""
+Benchmark searching subscriptions with 100,000 and 1,000,000 rows in the table.
+
+One user owns 10,000 of the rows and everyone else's are filler. Compares
+the substring filters used on databases without FTS5, which scan the rows
+they search, with the full-text index, both for the user searching their
+list and for the admin searching every subscription. Times include
+fetching the first page of 50 matches, sorted by relevance where the index
+gives one.
+
+Runs with DEBUG off, as otherwise the SQL of every insert is kept in the
+query log.
+
+    python benchmarks/bench_search.py
+"""
+from common import print_table, test_database, timed
+
+import random
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+
+from subscriptions.models import Subscription
+from subscriptions.search import search_subscriptions
+
+SIZES = [100000, 1000000]
+USER_ROWS = 10000
+PAGE_SIZE = 50
+
+QUERIES = ['stream', 'fam', 'cloud backup']
+
+WORDS = [
+    'stream', 'music', 'video', 'cloud', 'backup', 'storage', 'news', 'games', 'fitness', 'family',
+    'premium', 'plus', 'pro', 'annual', 'shared', 'office', 'photo', 'vpn', 'mail', 'learning',
+]
+
+User = get_user_model()
+
+
+def add_subscriptions(user, count, rng):
+    """
+    Insert count subscriptions with names and notes drawn from WORDS plus random filler words.
+    """
+    batch = []
+    for index in range(count):
+        name = f'{rng.choice(WORDS).title()} {"".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=6))}'
+        notes = ' '.join(rng.choice(WORDS) if rng.random() < 0.2 else ''.join(rng.choices('abcdefghij', k=5)) for _ in range(8))
+        batch.append(Subscription(
+            user=user, name=name, notes=notes, url=f'https://{name.split()[1]}.example.com/',
+            cost=Decimal('9.99'), currency='GBP', start_date=date(2024, 1, 1)
+        ))
+        if len(batch) == 10000:
+            Subscription.objects.bulk_create(batch)
+            batch = []
+    Subscription.objects.bulk_create(batch)
+
+
+def first_page(queryset, query, user=None, fts=True):
+    """
+    Search queryset and read the first page of matches.
+    """
+    with mock.patch('subscriptions.search.fts_available', return_value=fts):
+        queryset, relevance = search_subscriptions(queryset, query, user=user)
+    if relevance is not None:
+        queryset = queryset.annotate(search_rank=relevance).order_by('search_rank', 'pk')
+    else:
+        queryset = queryset.order_by('name', 'pk')
+    return list(queryset[:PAGE_SIZE])
+
+
+def main():
+    rng = random.Random(0)
+    rows = []
+
+    with test_database(), override_settings(DEBUG=False):
+        user = User.objects.create_user(username='search-user', password='benchmark')
+        filler = User.objects.create_user(username='search-filler', password='benchmark')
+        add_subscriptions(user, USER_ROWS, rng)
+        total = USER_ROWS
+
+        for size in SIZES:
+            add_subscriptions(filler, size - total, rng)
+            total = size
+            own = Subscription.objects.filter(user=user)
+            everyone = Subscription.objects.all()
+
+            for query in QUERIES:
+                rows.append([
+                    size,
+                    query,
+                    f'{timed(lambda: first_page(own, query, user, fts=False), repeat=3):.1f}',
+                    f'{timed(lambda: first_page(own, query, user), repeat=3):.1f}',
+                    f'{timed(lambda: first_page(everyone, query, fts=False), repeat=3):.1f}',
+                    f'{timed(lambda: first_page(everyone, query), repeat=3):.1f}',
+                ])
+
+    print(f'First {PAGE_SIZE} search results (best of 3, milliseconds)')
+    print_table(['rows', 'query', 'user substring', 'user index', 'admin substring', 'admin index'], rows)
+
+
+if __name__ == '__main__':
+    main()
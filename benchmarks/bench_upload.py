@@ -0,0 +1,123 @@
+"""
+Benchmark staging uploaded subscription CSV files of 10, 50 and 100 MB.
+
+Compares the old approach of reading and decoding the whole upload,
+wrapping it in a StringIO and parsing it into a list, with streaming the
+upload through open_csv_upload() into stage_import(). Reports the peak
+Python memory allocated and the time taken for both. Times include the
+overhead of tracing memory allocations.
+
+Runs with DEBUG off, as otherwise the SQL of every insert is kept in the
+query log.
+
+    python benchmarks/bench_upload.py
+"""
+from common import print_table, test_database
+
+import csv
+import io
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.test import override_settings
+
+from subscriptions.importers import stage_import
+from subscriptions.models import StagedImport, Subscription
+from subscriptions.utils import open_csv_upload, parse_subscriptions_csv
+
+SIZES_MB = [10, 50, 100]
+
+User = get_user_model()
+
+
+def make_upload(size_mb, seed=0):
+    """
+    Write random subscription rows to a temporary upload file of about size_mb.
+    """
+    rng = random.Random(seed)
+    renewal_periods = [choice for choice, _ in Subscription.RENEWAL_CHOICES]
+    currencies = [choice for choice, _ in Subscription.CURRENCY_CHOICES]
+    today = date.today()
+
+    upload = TemporaryUploadedFile('subscriptions.csv', 'text/csv', 0, 'utf-8')
+    text = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(['name', 'category', 'cost', 'currency', 'renewal_period', 'start_date', 'url', 'notes', 'status', 'cancellation_date'])
+    index = 0
+    while text.tell() < size_mb * 1024 * 1024:
+        writer.writerow([
+            f'Subscription {index}',
+            rng.choice(['Food', 'Petrol', 'Streaming', 'Software', '']),
+            f'{rng.randrange(100, 10000) / 100:.2f}',
+            rng.choice(currencies),
+            rng.choice(renewal_periods),
+            (today - timedelta(days=rng.randrange(3650))).isoformat(),
+            f'https://example.com/{index}',
+            'Imported from the benchmark',
+            'active',
+            '',
+        ])
+        index += 1
+    text.detach()
+    upload.size = upload.file.tell()
+    return upload, index
+
+
+def legacy_parse(upload):
+    """
+    Read the whole upload into memory and parse it into a list, as the import views used to.
+    """
+    upload.seek(0)
+    file_data = upload.read().decode('utf-8')
+    csv_data = io.StringIO(file_data)
+    return len(list(parse_subscriptions_csv(csv_data)))
+
+
+def streaming_stage(user, upload):
+    """
+    Stream the upload into staged rows.
+    """
+    with open_csv_upload(upload) as csv_data:
+        _, staged = stage_import(user, 'subscriptions', parse_subscriptions_csv(csv_data))
+    return staged.imported
+
+
+def measure(func):
+    """
+    Call func once and return its result, peak traced memory in MiB and time in milliseconds.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = (time.perf_counter() - start) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak / 1024 / 1024, elapsed
+
+
+def main():
+    rows = []
+
+    with test_database(), override_settings(DEBUG=False):
+        user = User.objects.create_user(username='upload', password='benchmark')
+        for size_mb in SIZES_MB:
+            upload, row_count = make_upload(size_mb, seed=size_mb)
+
+            _, legacy_peak, legacy_ms = measure(lambda: legacy_parse(upload))
+            staged, stream_peak, stream_ms = measure(lambda: streaming_stage(user, upload))
+            assert staged == row_count
+            StagedImport.objects.all().delete()
+            upload.close()
+
+            rows.append([size_mb, row_count, f'{legacy_peak:.0f}', f'{legacy_ms:.0f}', f'{stream_peak:.1f}', f'{stream_ms:.0f}'])
+
+    print('Subscriptions CSV upload (legacy parses only; streaming parses, validates and stages)')
+    print_table(['MB', 'rows', 'legacy peak MiB', 'legacy ms', 'stream peak MiB', 'stream ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
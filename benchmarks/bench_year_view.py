@@ -0,0 +1,65 @@
+"""
+Benchmark the calendar year view at 100, 1,000 and 10,000 subscriptions.
+
+Compares the old approach of calling calculate_next_renewal_date for every
+subscription in every month (12 x N calls) with the single-pass expansion
+used by calendar_view and with reading the year back from RenewalOccurrence,
+and reports the latency of the whole year view.
+
+    python benchmarks/bench_year_view.py
+"""
+from common import create_user_with_subscriptions, print_table, test_database, timed
+
+from datetime import date
+
+from django.test import RequestFactory
+
+from subscriptions.models import Subscription
+from subscriptions.utils import calculate_next_renewal_date, occurrences_between, renewal_occurrences
+from subscriptions.views import calendar_view
+
+SIZES = [100, 1000, 10000]
+
+
+def per_month_expansion(subscriptions, year):
+    """
+    Expand a year the way the year view used to: 12 x N scalar calls.
+    """
+    renewals = []
+    for month_num in range(1, 13):
+        for subscription in subscriptions:
+            for renewal_date in calculate_next_renewal_date(subscription.start_date, subscription.renewal_period, year, month_num):
+                renewals.append((subscription, renewal_date))
+    return renewals
+
+
+def main():
+    year = date.today().year
+    factory = RequestFactory()
+    rows = []
+
+    with test_database():
+        for size in SIZES:
+            user = create_user_with_subscriptions(f'year-view-{size}', size, seed=size)
+            subscriptions = list(Subscription.objects.filter(user=user))
+
+            request = factory.get('/subscriptions/calendar/', {'view_type': 'year', 'year': year})
+            request.user = user
+
+            rows.append([
+                size,
+                f'{timed(lambda: per_month_expansion(subscriptions, year), repeat=3):.1f}',
+                f'{timed(lambda: list(occurrences_between(subscriptions, date(year, 1, 1), date(year, 12, 31))), repeat=3):.1f}',
+                f'{timed(lambda: renewal_occurrences(user, date(year, 1, 1), date(year, 12, 31)), repeat=3):.1f}',
+                f'{timed(lambda: calendar_view(request), repeat=3):.1f}',
+            ])
+
+    print(f'Year view for {year} (best of 3, milliseconds)')
+    print_table(
+        ['subscriptions', '12xN scalar', 'single pass', 'table query', 'full view'],
+        rows
+    )
+
+
+if __name__ == '__main__':
+    main()
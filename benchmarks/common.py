@@ -0,0 +1,109 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Every benchmark runs against a throw-away test database, so it never touches
+the real SubCal database. Run the scripts from the project root, e.g.:
+
+    python benchmarks/bench_year_view.py
+"""
+import os
+import random
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SubCal.settings')
+
+import django
+
+django.setup()
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from subscriptions.models import Category, Subscription
+
+User = get_user_model()
+
+
+@contextmanager
+def test_database():
+    """
+    Create a test database for the duration of the block and destroy it afterwards.
+    """
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def timed(func, repeat=5):
+    """
+    Call func several times and return the best wall-clock time in milliseconds.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def create_user_with_subscriptions(username, count, seed=0, materialize=True):
+    """
+    Create a user with count random subscriptions.
+
+    Subscriptions are inserted with bulk_create, and their renewal occurrences
+    are then materialized in one go unless materialize is False.
+    """
+    rng = random.Random(seed)
+    user = User.objects.create_user(username=username, password='benchmark')
+    categories = list(Category.objects.filter(user=user))
+    renewal_periods = [choice for choice, _ in Subscription.RENEWAL_CHOICES]
+    currencies = [choice for choice, _ in Subscription.CURRENCY_CHOICES]
+    today = date.today()
+
+    subscriptions = []
+    for index in range(count):
+        subscription = Subscription(
+            name=f'Subscription {index}',
+            category=rng.choice(categories + [None]),
+            cost=Decimal(rng.randrange(100, 10000)) / 100,
+            currency=rng.choice(currencies),
+            renewal_period=rng.choice(renewal_periods),
+            start_date=today - timedelta(days=rng.randrange(3650)),
+            user=user
+        )
+        if rng.random() < 0.1:
+            subscription.status = 'cancelled'
+            subscription.cancellation_date = subscription.start_date + timedelta(days=rng.randrange(365))
+        subscription.fingerprint = subscription.compute_fingerprint()
+        subscription.next_billing_date = subscription.compute_next_billing_date()
+        subscriptions.append(subscription)
+    Subscription.objects.bulk_create(subscriptions, batch_size=1000)
+
+    if materialize:
+        call_command('roll_renewal_occurrences', '--full', stdout=open(os.devnull, 'w'))
+
+    return user
+
+
+def print_table(headers, rows):
+    """
+    Print rows as a simple aligned text table.
+    """
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    print('  '.join(str(header).rjust(width) for header, width in zip(headers, widths)))
+    for row in rows:
+        print('  '.join(str(value).rjust(width) for value, width in zip(row, widths)))
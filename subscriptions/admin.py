@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
 from unfold.admin import ModelAdmin
 from .models import Subscription
+from .search import fts_available, search_subscriptions
 
 # Register your models here.
 @admin.register(Subscription)
@@ -8,5 +10,18 @@ class SubscriptionAdmin(ModelAdmin):
     list_display = ('name', 'cost', 'renewal_period', 'start_date', 'created_at', 'updated_at')
     list_filter = ('renewal_period', 'start_date')
     search_fields = ('name', 'notes')
+    search_help_text = 'Searches names, notes, websites and categories. Words match as prefixes.'
     date_hierarchy = 'start_date'
     readonly_fields = ('created_at', 'updated_at')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of LIKE scans of every subscription
+        if not fts_available():
+            return super().get_search_results(request, queryset, search_term)
+
+        queryset, relevance = search_subscriptions(queryset, search_term)
+
+        # Show the best matches first, unless a column was clicked to sort by
+        if relevance is not None and ORDER_VAR not in request.GET:
+            queryset = queryset.annotate(search_rank=relevance).order_by('search_rank', '-pk')
+        return queryset, False
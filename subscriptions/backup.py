@@ -0,0 +1,245 @@
+"""
+Whole-account backups, for moving a user's data between SubCal instances.
+
+A backup is a zip archive holding a manifest and one NDJSON file (one JSON
+object per line) each for the user's currencies, categories and
+subscriptions. generate_backup() builds the archive while it is streamed to
+the client, and restore_backup() reads it back one line at a time through
+the bulk import engine, so neither holds more than a batch of rows in
+memory however large the account is.
+"""
+import io
+import json
+import zipfile
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .importers import IMPORT_BATCH_SIZE, import_categories, import_currencies, import_subscriptions
+from .models import Category, Currency, Subscription
+from .utils import EXPORT_CHUNK_SIZE
+from .versioning import bulk_data_change, bump_data_version
+
+BACKUP_FORMAT = 'subcal-backup'
+BACKUP_VERSION = 1
+
+# Fields written for each record, in the order they're written
+CURRENCY_FIELDS = ['code', 'name', 'symbol', 'is_default']
+CATEGORY_FIELDS = ['id', 'name']
+SUBSCRIPTION_FIELDS = [
+    'name', 'category_id', 'cost', 'currency', 'renewal_period', 'start_date',
+    'status', 'cancellation_date', 'url', 'notes'
+]
+
+
+class ZipStream(io.RawIOBase):
+    """
+    A write-only file that keeps what's written to it until it's drained.
+
+    zipfile writes to it as it compresses, and the streaming response sends
+    whatever has built up since the last drain. It can't seek, so zipfile
+    writes each entry's sizes after its data instead of going back for them.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _records(queryset, fields, chunk_size):
+    for values in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        yield dict(zip(fields, values))
+
+
+def generate_backup(user, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Generate a backup archive of a user's data, a piece at a time.
+
+    Args:
+        user: The user to back up
+        chunk_size: Number of rows fetched from the database at a time
+
+    Returns:
+        An iterator of bytes making up the zip archive
+    """
+    currencies = Currency.objects.filter(user=user).order_by('code')
+    categories = Category.objects.filter(user=user).order_by('pk')
+    subscriptions = Subscription.objects.filter(user=user).order_by('pk')
+
+    manifest = {
+        'format': BACKUP_FORMAT,
+        'version': BACKUP_VERSION,
+        'created_at': timezone.now(),
+        'counts': {
+            'currencies': currencies.count(),
+            'categories': categories.count(),
+            'subscriptions': subscriptions.count(),
+        },
+    }
+
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('manifest.json', json.dumps(manifest, cls=DjangoJSONEncoder, indent=2))
+
+        for name, records in [
+            ('currencies.ndjson', _records(currencies, CURRENCY_FIELDS, chunk_size)),
+            ('categories.ndjson', _records(categories, CATEGORY_FIELDS, chunk_size)),
+            ('subscriptions.ndjson', _records(subscriptions, SUBSCRIPTION_FIELDS, chunk_size)),
+        ]:
+            with archive.open(name, 'w') as entry:
+                for record in records:
+                    entry.write(json.dumps(record, cls=DjangoJSONEncoder).encode('utf-8') + b'\n')
+
+                    # The compressor only writes out once it has a block
+                    if data := stream.drain():
+                        yield data
+
+    yield stream.drain()
+
+
+def read_manifest(archive):
+    """
+    Read and check the manifest of an open backup archive.
+
+    Args:
+        archive: An open zipfile.ZipFile
+
+    Returns:
+        The manifest dictionary
+
+    Raises:
+        ValueError: If the archive isn't a backup this version can restore
+    """
+    try:
+        manifest = json.loads(archive.read('manifest.json'))
+    except (KeyError, ValueError):
+        raise ValueError('This file is not a SubCal backup.')
+    if not isinstance(manifest, dict) or manifest.get('format') != BACKUP_FORMAT:
+        raise ValueError('This file is not a SubCal backup.')
+    if manifest.get('version') != BACKUP_VERSION:
+        raise ValueError(f'Backups of version {manifest.get("version")} can\'t be restored by this version of SubCal.')
+    return manifest
+
+
+def _read_records(archive, name):
+    """
+    Read the records of one of an archive's NDJSON files, one line at a time.
+
+    Yields:
+        Tuples of (line number, record dictionary)
+    """
+    try:
+        entry = archive.open(name)
+    except KeyError:
+        raise ValueError(f'The backup has no {name} file.')
+
+    with io.TextIOWrapper(entry, encoding='utf-8') as lines:
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise ValueError(f'Line {line_number} of {name} is not valid JSON.')
+            if not isinstance(record, dict):
+                raise ValueError(f'Line {line_number} of {name} is not a record.')
+            yield line_number, record
+
+
+def restore_backup(user, archive_file, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Restore a backup archive into a user's account, in one transaction.
+
+    Records are added to what the user already has: currencies and
+    categories that already exist are kept, and subscriptions the user
+    already has are skipped as duplicates, so restoring a backup twice
+    doesn't copy anything. Category ids in the backup are those of the
+    instance it came from, so each subscription is linked to the category
+    with the backed up category's name, whether restored or existing.
+
+    Args:
+        user: The user to restore the backup for
+        archive_file: A seekable binary file holding the zip archive
+        batch_size: Number of rows written per bulk_create()
+        progress: Optional function called with the number of records read so far
+
+    Returns:
+        A dictionary of ImportResults for 'currencies', 'categories' and 'subscriptions'
+
+    Raises:
+        ValueError: If the file isn't a valid backup; nothing is restored
+    """
+    try:
+        archive = zipfile.ZipFile(archive_file)
+    except zipfile.BadZipFile:
+        raise ValueError('This file is not a SubCal backup.')
+
+    results = {}
+    rows_done = 0
+    category_names = {}
+    default_code = None
+
+    def report(rows_read):
+        if progress:
+            progress(rows_done + rows_read)
+
+    def currencies():
+        nonlocal default_code
+        for line_number, record in _read_records(archive, 'currencies.ndjson'):
+            if record.get('is_default') is True:
+                default_code = record.get('code')
+            yield line_number, record
+
+    def categories():
+        for line_number, record in _read_records(archive, 'categories.ndjson'):
+            category_names[record.get('id')] = record.get('name')
+            yield line_number, record
+
+    def subscriptions():
+        for line_number, record in _read_records(archive, 'subscriptions.ndjson'):
+            yield line_number, dict(record, category=category_names.get(record.get('category_id')))
+
+    # Bump the user's data version once, for everything the restore changes
+    with archive, bulk_data_change(), transaction.atomic():
+        read_manifest(archive)
+
+        for kind, records, import_records in [
+            ('currencies', currencies(), import_currencies),
+            ('categories', categories(), import_categories),
+            ('subscriptions', subscriptions(), import_subscriptions),
+        ]:
+            result = import_records(user, records, batch_size=batch_size, progress=report)
+            results[kind] = result
+            rows_done += result.imported + result.skipped + result.error_count
+
+        # Keep the backup's default currency, even if the user already had it
+        if default_code and Currency.objects.filter(user=user, code=default_code, is_default=False).exists():
+            Currency.objects.filter(user=user, is_default=True).update(is_default=False)
+            Currency.objects.filter(user=user, code=default_code).update(is_default=True)
+            bump_data_version(user.pk)
+
+    return results
+
+
+def restore_message(results):
+    """
+    Describe what a restore brought in, e.g. for a flash message.
+    """
+    imported = ', '.join(f'{result.imported} {kind}' for kind, result in results.items())
+    message = f'Restored {imported}.'
+    skipped = sum(result.skipped for result in results.values())
+    if skipped:
+        message += f' Skipped {skipped} entries that already existed.'
+    return message
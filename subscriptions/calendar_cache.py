@@ -0,0 +1,201 @@
+"""
+Cached calendar data.
+
+The calendar's per-month structure (day -> renewal entries) is cached under
+the user, their data version, the year and month, and today's date, so it is
+only rebuilt when the user's data changes or the day rolls over. The year
+view is assembled from the same cached months.
+
+Hit and miss counts are kept in the cache, so with a shared cache backend
+they cover every process. They are shown on the admin dashboard.
+"""
+import calendar
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Subscription
+from .utils import occurrences_between, renewal_occurrences
+from .versioning import get_data_version, user_cache_key
+
+MONTH_CACHE_PREFIX = 'calendar-month'
+HITS_KEY = 'calendar-cache:hits'
+MISSES_KEY = 'calendar-cache:misses'
+
+
+class CalendarEntry:
+    """
+    A subscription renewal shown in a calendar cell.
+
+    Only carries the fields the calendar template renders, so year views with
+    many renewals don't pay for a full wrapper around each subscription.
+    """
+    __slots__ = ('pk', 'name', 'cost', 'symbol', 'renewal_period_display', 'status', 'is_past')
+
+    def __init__(self, subscription, is_past):
+        self.pk = subscription.pk
+        self.name = subscription.name
+        self.cost = subscription.cost
+        self.symbol = subscription.get_currency_symbol()
+        self.renewal_period_display = subscription.get_renewal_period_display()
+        self.status = subscription.status
+        self.is_past = is_past
+
+    def __eq__(self, other):
+        # Allow comparison with the subscription the entry was created from
+        if isinstance(other, (CalendarEntry, Subscription)):
+            return self.pk == other.pk
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+def build_month_calendar_data(renewals, months, today):
+    """
+    Bucket renewals into calendar cells.
+
+    Renewals of cancelled subscriptions are only shown on past dates.
+
+    Args:
+        renewals: Iterable of (subscription, renewal_date) tuples in date order
+        months: List of (year, month) tuples to build
+        today: The date used to decide which renewals are in the past
+
+    Returns:
+        A dictionary mapping each (year, month) to a dictionary of day -> entries
+    """
+    month_data = {
+        (year, month): {day: [] for day in range(1, calendar.monthrange(year, month)[1] + 1)}
+        for year, month in months
+    }
+
+    for subscription, renewal_date in renewals:
+        cells = month_data.get((renewal_date.year, renewal_date.month))
+        if cells is None:
+            continue
+
+        # Create a calendar entry with the subscription and is_past flag
+        is_past = renewal_date < today
+
+        # Skip cancelled subscriptions for future dates
+        if not is_past and subscription.status == 'cancelled':
+            continue
+
+        cells[renewal_date.day].append(CalendarEntry(subscription, is_past))
+
+    return month_data
+
+
+def get_calendar_months(user, months, today=None, count_lookups=True):
+    """
+    Get the calendar data of several months, from the cache where possible.
+
+    Missing months are built together in a single pass over the renewals
+    between the first and last of them, and then cached.
+
+    Args:
+        user: The user whose calendar to get
+        months: List of (year, month) tuples
+        today: The date used to decide which renewals are in the past (default: today)
+        count_lookups: Whether to add the lookups to the hit and miss counters
+
+    Returns:
+        A dictionary mapping each (year, month) to a dictionary of day -> entries
+    """
+    if today is None:
+        today = date.today()
+
+    version = get_data_version(user)
+    keys = {
+        (year, month): user_cache_key(MONTH_CACHE_PREFIX, user, year, month, today.isoformat(), version=version)
+        for year, month in months
+    }
+    cached = cache.get_many(keys.values())
+    month_data = {month: cached[key] for month, key in keys.items() if key in cached}
+    missing = [month for month in months if month not in month_data]
+
+    if count_lookups:
+        record_lookups(hits=len(month_data), misses=len(missing))
+
+    if missing:
+        first_year, first_month = min(missing)
+        last_year, last_month = max(missing)
+        first_date = date(first_year, first_month, 1)
+        last_date = date(last_year, last_month, calendar.monthrange(last_year, last_month)[1])
+
+        if len(missing) == 1:
+            # A single month is read from the materialized renewal occurrences
+            renewals = renewal_occurrences(user, first_date, last_date)
+        else:
+            # Several months are cheaper to expand in a single pass
+            subscriptions = Subscription.objects.filter(user=user).order_by('pk')
+            renewals = occurrences_between(subscriptions, first_date, last_date)
+
+        built = build_month_calendar_data(renewals, missing, today)
+        cache.set_many({keys[month]: built[month] for month in missing}, settings.CALENDAR_CACHE_TIMEOUT)
+        month_data.update(built)
+
+    return {month: month_data[month] for month in months}
+
+
+def get_month_calendar_data(user, year, month, today=None):
+    """
+    Get the calendar data of a month, from the cache where possible.
+
+    Returns:
+        A dictionary mapping each day of the month to its renewal entries
+    """
+    return get_calendar_months(user, [(year, month)], today)[(year, month)]
+
+
+def get_year_calendar_data(user, year, today=None):
+    """
+    Get the calendar data of every month of a year, from the cache where possible.
+
+    Returns:
+        A dictionary mapping each month number to a dictionary of day -> entries
+    """
+    month_data = get_calendar_months(user, [(year, month) for month in range(1, 13)], today)
+    return {month: cells for (_, month), cells in month_data.items()}
+
+
+def record_lookups(hits=0, misses=0):
+    """
+    Add to the calendar cache hit and miss counters.
+    """
+    for key, count in ((HITS_KEY, hits), (MISSES_KEY, misses)):
+        if count:
+            cache.add(key, 0, None)
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                # The counter was evicted between add() and incr()
+                cache.set(key, count, None)
+
+
+def calendar_cache_stats():
+    """
+    Get the calendar cache hit and miss counts.
+
+    Returns:
+        A dictionary with hits, misses and hit_rate (a percentage, or None
+        if there have been no lookups)
+    """
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counts.get(HITS_KEY, 0)
+    misses = counts.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits * 100 / lookups, 1) if lookups else None,
+    }
+
+
+def reset_calendar_cache_stats():
+    """
+    Reset the calendar cache hit and miss counters.
+    """
+    cache.delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,89 @@
+"""
+Conditional GET support for pages built from a user's data.
+
+Pages decorated with conditional_on_data() send an ETag and a Last-Modified
+header, and answer a matching If-None-Match or If-Modified-Since request
+with 304 Not Modified before any renewal or aggregation code runs. Both
+validators come from the user's UserDataVersion row, which is bumped on
+every change to their subscriptions, categories or currencies, including
+deletions, imports and updates that never touch a row's updated_at:
+
+- ETag: the user, their data version, the request path and parameters,
+  today's date and any pending flash messages.
+- Last-Modified: when the data version last changed, or midnight today if
+  later, as the pages show which renewals are in the past.
+"""
+import hashlib
+from datetime import date, datetime, time
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .models import UserDataVersion
+
+
+def data_version(request):
+    """
+    Get the current user's data version row.
+
+    The row is stored on the request, so the ETag and Last-Modified
+    functions share one query.
+
+    Args:
+        request: The current request
+
+    Returns:
+        The user's UserDataVersion
+    """
+    version = getattr(request, '_data_version', None)
+    if version is None:
+        version, _ = UserDataVersion.objects.get_or_create(user=request.user)
+        request._data_version = version
+    return version
+
+
+def conditional_on_data(extra_etag=None):
+    """
+    Decorate a view to answer conditional GET requests from the user's data version.
+
+    Responses are marked private and no-cache, so browsers and proxies always
+    revalidate instead of guessing how long the page stays fresh.
+
+    Args:
+        extra_etag: Optional function taking the request and returning anything
+            else the page depends on, added to the ETag
+
+    Returns:
+        A view decorator
+    """
+    def get_etag(request, *args, **kwargs):
+        parts = [
+            request.user.pk,
+            data_version(request).version,
+            request.path,
+            sorted(request.GET.lists()),
+            date.today(),
+            len(get_messages(request)),
+        ]
+        if extra_etag:
+            parts.append(extra_etag(request))
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def get_last_modified(request, *args, **kwargs):
+        start_of_today = timezone.make_aware(datetime.combine(date.today(), time.min))
+        return max(data_version(request).updated_at, start_of_today)
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=get_etag, last_modified_func=get_last_modified)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+
+    return decorator
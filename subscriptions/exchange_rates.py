@@ -0,0 +1,168 @@
+"""
+Exchange rates for converting subscription costs to GBP.
+
+Rates are fetched from the rates API by refresh_exchange_rates(), either from
+the refresh_exchange_rates management command or from a background thread
+once the stored rates are stale. Page views only call get_exchange_rates(),
+which reads an in-process cache backed by the ExchangeRateSnapshot table and
+never waits on the network.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import ExchangeRateSnapshot
+
+logger = logging.getLogger(__name__)
+
+BASE_CURRENCY = 'GBP'
+
+# Used until the first successful refresh
+FALLBACK_EXCHANGE_RATES = {
+    'GBP': 1.0,
+    'USD': 0.75,
+    'EUR': 0.85
+}
+
+_cache = {
+    'rates': None,
+    'fetched_at': None,
+    'loaded_at': None,
+    'refresh_attempted_at': None,
+}
+_lock = threading.Lock()
+
+
+def fetch_exchange_rates():
+    """
+    Fetch the latest exchange rates from the rates API.
+
+    Returns:
+        A dictionary mapping currency codes to their value in GBP
+
+    Raises:
+        requests.RequestException: If the API can't be reached in time
+        ValueError: If the API doesn't return a successful result
+    """
+    response = requests.get(settings.EXCHANGE_RATE_API_URL, timeout=settings.EXCHANGE_RATE_TIMEOUT)
+    response.raise_for_status()
+    data = response.json()
+
+    if data.get('result') != 'success':
+        raise ValueError(f"Exchange rate API returned {data.get('result')!r}")
+
+    # Invert rates to get conversion to GBP
+    return {currency: 1 / rate if rate > 0 else 0 for currency, rate in data['rates'].items()}
+
+
+def refresh_exchange_rates():
+    """
+    Fetch the latest exchange rates and store them.
+
+    Returns:
+        The updated ExchangeRateSnapshot
+    """
+    rates = fetch_exchange_rates()
+    snapshot, _ = ExchangeRateSnapshot.objects.update_or_create(
+        base_currency=BASE_CURRENCY,
+        defaults={'rates': rates, 'fetched_at': timezone.now()}
+    )
+
+    with _lock:
+        _cache['rates'] = snapshot.rates
+        _cache['fetched_at'] = snapshot.fetched_at
+        _cache['loaded_at'] = time.monotonic()
+
+    return snapshot
+
+
+def get_exchange_rates():
+    """
+    Return the stored exchange rates without making any network requests.
+
+    The stored snapshot is re-read at most every EXCHANGE_RATE_CACHE_SECONDS,
+    so rates refreshed by another process are picked up. If no snapshot has
+    been stored yet, the fallback rates are returned. If the rates are older
+    than EXCHANGE_RATE_TTL, a background refresh is started.
+
+    Returns:
+        A dictionary mapping currency codes to their value in GBP
+    """
+    now = time.monotonic()
+    with _lock:
+        loaded_at = _cache['loaded_at']
+        needs_load = loaded_at is None or now - loaded_at >= settings.EXCHANGE_RATE_CACHE_SECONDS
+
+    if needs_load:
+        snapshot = ExchangeRateSnapshot.objects.filter(base_currency=BASE_CURRENCY).first()
+        with _lock:
+            if snapshot:
+                _cache['rates'] = snapshot.rates
+                _cache['fetched_at'] = snapshot.fetched_at
+            else:
+                _cache['rates'] = dict(FALLBACK_EXCHANGE_RATES)
+                _cache['fetched_at'] = None
+            _cache['loaded_at'] = now
+
+    with _lock:
+        rates = dict(_cache['rates'])
+        fetched_at = _cache['fetched_at']
+
+    if settings.EXCHANGE_RATE_BACKGROUND_REFRESH and is_stale(fetched_at):
+        start_background_refresh()
+
+    return rates
+
+
+def is_stale(fetched_at):
+    """
+    Check if rates fetched at the given time are older than EXCHANGE_RATE_TTL.
+    """
+    return fetched_at is None or timezone.now() - fetched_at > timedelta(seconds=settings.EXCHANGE_RATE_TTL)
+
+
+def start_background_refresh():
+    """
+    Refresh the exchange rates in a background thread.
+
+    At most one refresh is attempted per EXCHANGE_RATE_CACHE_SECONDS, so a
+    slow or failing API is not hit on every page view.
+
+    Returns:
+        The started thread, or None if a refresh was attempted recently
+    """
+    now = time.monotonic()
+    with _lock:
+        attempted_at = _cache['refresh_attempted_at']
+        if attempted_at is not None and now - attempted_at < settings.EXCHANGE_RATE_CACHE_SECONDS:
+            return None
+        _cache['refresh_attempted_at'] = now
+
+    thread = threading.Thread(target=_refresh_in_background, name='exchange-rate-refresh', daemon=True)
+    thread.start()
+    return thread
+
+
+def _refresh_in_background():
+    try:
+        refresh_exchange_rates()
+    except Exception:
+        logger.warning("Background exchange rate refresh failed", exc_info=True)
+    finally:
+        # Threads get their own database connection, which must be closed here
+        connection.close()
+
+
+def clear_cache():
+    """
+    Forget the in-process exchange rates, so the next read goes to the database.
+    """
+    with _lock:
+        for key in _cache:
+            _cache[key] = None
@@ -0,0 +1,537 @@
+"""
+Bulk import engine for subscriptions, categories and currencies.
+
+Uploaded rows are staged in the database with stage_import() while the user
+previews them, and read back with staged_rows() once the import is confirmed.
+
+Rows are validated one at a time, and the valid ones are written with
+bulk_create() in batches inside a single transaction, so an import costs a
+handful of queries per batch instead of several per row. Rows that fail
+validation are skipped and reported with their row number.
+
+Subscriptions that already exist are recognised by their fingerprint (see
+subscription_fingerprint()), which is looked up with one query per batch.
+"""
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Category, Currency, RenewalOccurrence, StagedImport, Subscription, subscription_fingerprint
+from .versioning import bump_data_version
+
+# Number of rows written per bulk_create()
+IMPORT_BATCH_SIZE = 500
+
+# Number of row errors kept for reporting
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportResult:
+    """
+    The outcome of an import: how many rows were imported or skipped as
+    duplicates, and the errors of rows that couldn't be imported.
+
+    Only the first MAX_REPORTED_ERRORS errors are kept, so a large file of
+    invalid rows doesn't fill memory; error_count counts all of them.
+    """
+
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+        self.error_count = 0
+
+    def add_error(self, row_number, message):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, message))
+        self.error_count += 1
+
+    def error_summary(self, limit=5):
+        """
+        Describe the first few row errors in one line.
+        """
+        summary = '; '.join(f'row {row_number}: {message}' for row_number, message in self.errors[:limit])
+        if self.error_count > limit:
+            summary += f'; and {self.error_count - limit} more'
+        return summary
+
+    def success_message(self, noun):
+        """
+        Describe how many rows were imported and skipped, e.g. for a flash message.
+        """
+        if self.skipped > 0:
+            return f'Successfully imported {self.imported} {noun}. Skipped {self.skipped} duplicate entries.'
+        return f'Successfully imported {self.imported} {noun}.'
+
+    def error_message(self):
+        """
+        Describe the rows that couldn't be imported, or return '' if there were none.
+        """
+        if not self.error_count:
+            return ''
+        return f'{self.error_count} rows could not be imported: {self.error_summary()}'
+
+
+def batched(iterable, size):
+    """
+    Split an iterable into lists of at most size items.
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def stage_import(user, kind, rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Stage parsed CSV rows until the user confirms the import.
+
+    Rows are validated as they stream in, and the valid ones are written in
+    batches, so only one batch is held in memory at a time. Any earlier
+    import of the same kind that the user never confirmed is discarded, as
+    only the latest upload can be previewed.
+
+    Args:
+        user: The user importing the rows
+        kind: What the rows are, one of StagedImport.KIND_CHOICES
+        rows: Iterable of row dictionaries, numbered from 1 in order
+        batch_size: Number of rows written per bulk_create()
+
+    Returns:
+        A tuple of (import id, ImportResult), with the staged rows counted
+        as imported and the errors of the rows left out
+    """
+    import_id = uuid.uuid4()
+    clean_row = ROW_CLEANERS[kind]
+    result = ImportResult()
+
+    def valid_rows():
+        for row_number, row in enumerate(rows, 1):
+            try:
+                clean_row(row)
+            except ValueError as e:
+                result.add_error(row_number, str(e))
+            else:
+                yield row_number, row
+
+    with transaction.atomic():
+        StagedImport.objects.filter(user=user, kind=kind).delete()
+        for batch in batched(valid_rows(), batch_size):
+            StagedImport.objects.bulk_create([
+                StagedImport(import_id=import_id, user=user, kind=kind, row_number=row_number, data=row)
+                for row_number, row in batch
+            ])
+            result.imported += len(batch)
+
+    return import_id, result
+
+
+def staged_import(user, import_id):
+    """
+    Get the staged rows of one of a user's imports.
+    """
+    return StagedImport.objects.filter(user=user, import_id=import_id)
+
+
+def staged_rows(user, import_id, row_numbers=None, chunk_size=IMPORT_BATCH_SIZE):
+    """
+    Read back staged rows in order, for the import functions.
+
+    Args:
+        user: The user who staged the rows
+        import_id: The import the rows belong to
+        row_numbers: Optional row numbers to read instead of every row
+        chunk_size: Number of rows fetched from the database at a time
+
+    Yields:
+        Tuples of (row number, row dictionary)
+    """
+    rows = staged_import(user, import_id)
+    if row_numbers is not None:
+        rows = rows.filter(row_number__in=row_numbers)
+    yield from rows.values_list('row_number', 'data').iterator(chunk_size=chunk_size)
+
+
+def purge_staged_imports(max_age=None):
+    """
+    Delete staged imports that were never confirmed.
+
+    Args:
+        max_age: Age in seconds after which rows are deleted (default: STAGED_IMPORT_MAX_AGE)
+
+    Returns:
+        The number of rows deleted
+    """
+    if max_age is None:
+        max_age = settings.STAGED_IMPORT_MAX_AGE
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    deleted, _ = StagedImport.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+def _text(row, key):
+    value = row.get(key)
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _parse_date(value):
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _choice(row, key, field_name):
+    field = Subscription._meta.get_field(field_name)
+    value = _text(row, key)
+    if not value:
+        return field.default
+    if value not in dict(field.choices):
+        raise ValueError(f'invalid {key} "{value}"')
+    return value
+
+
+def clean_subscription_row(row):
+    """
+    Validate a subscription row and convert it to model field values.
+
+    A missing or invalid start date falls back to today, and an invalid
+    cancellation date is dropped.
+
+    Args:
+        row: Dictionary of CSV values, keyed by the export column names
+
+    Returns:
+        A tuple of (field values, category name or None)
+
+    Raises:
+        ValueError: If the row can't be imported
+    """
+    name = _text(row, 'name')
+    if not name:
+        raise ValueError('name is required')
+    if len(name) > Subscription._meta.get_field('name').max_length:
+        raise ValueError('name is too long')
+
+    try:
+        cost = Decimal(_text(row, 'cost')).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f'invalid cost "{_text(row, "cost")}"')
+    if not cost.is_finite() or cost < 0 or cost >= Decimal('1e8'):
+        raise ValueError(f'invalid cost "{_text(row, "cost")}"')
+
+    try:
+        start_date = _parse_date(row.get('start_date')) if row.get('start_date') else date.today()
+    except ValueError:
+        start_date = date.today()
+
+    try:
+        cancellation_date = _parse_date(row.get('cancellation_date')) if row.get('cancellation_date') else None
+    except ValueError:
+        cancellation_date = None
+
+    values = {
+        'name': name,
+        'cost': cost,
+        'currency': _choice(row, 'currency', 'currency'),
+        'renewal_period': _choice(row, 'renewal_period', 'renewal_period'),
+        'start_date': start_date,
+        'status': _choice(row, 'status', 'status'),
+        'cancellation_date': cancellation_date,
+        'url': _text(row, 'url') or None,
+        'notes': _text(row, 'notes') or None,
+    }
+    return values, _text(row, 'category') or None
+
+
+def row_fingerprint(values):
+    """
+    Get the fingerprint of a subscription row cleaned by clean_subscription_row().
+    """
+    return subscription_fingerprint(
+        values['name'],
+        values['cost'],
+        values['currency'],
+        values['renewal_period'],
+        values['start_date']
+    )
+
+
+def existing_fingerprints(user, fingerprints):
+    """
+    Find which of the given fingerprints belong to the user's subscriptions.
+
+    Args:
+        user: The user whose subscriptions to look in
+        fingerprints: Fingerprints to look up
+
+    Returns:
+        The set of fingerprints the user already has
+    """
+    return set(
+        Subscription.objects.filter(user=user, fingerprint__in=set(fingerprints))
+        .values_list('fingerprint', flat=True)
+    )
+
+
+def existing_subscription_rows(user, rows):
+    """
+    Find the subscription rows that the user already has, for the import preview.
+
+    Args:
+        user: The user importing the rows
+        rows: Iterable of (row number, row dictionary) tuples
+
+    Returns:
+        The set of row numbers of rows that would be skipped as duplicates
+    """
+    fingerprints = {}
+    for row_number, row in rows:
+        try:
+            values, _ = clean_subscription_row(row)
+        except ValueError:
+            continue
+        fingerprints[row_number] = row_fingerprint(values)
+
+    existing = existing_fingerprints(user, fingerprints.values())
+    return {row_number for row_number, fingerprint in fingerprints.items() if fingerprint in existing}
+
+
+def clean_category_row(row):
+    """
+    Validate a category row.
+
+    Args:
+        row: Dictionary of CSV values, keyed by the export column names
+
+    Returns:
+        The category name
+
+    Raises:
+        ValueError: If the row can't be imported
+    """
+    name = _text(row, 'name')
+    if not name:
+        raise ValueError('name is required')
+    if len(name) > Category._meta.get_field('name').max_length:
+        raise ValueError('name is too long')
+    return name
+
+
+def clean_currency_row(row):
+    """
+    Validate a currency row and convert it to model field values.
+
+    Args:
+        row: Dictionary of CSV values, keyed by the export column names
+
+    Returns:
+        A dictionary of code, name, symbol and is_default
+
+    Raises:
+        ValueError: If the row can't be imported
+    """
+    values = {name: _text(row, name) for name in ('code', 'name', 'symbol')}
+    missing = [name for name, value in values.items() if not value]
+    if missing:
+        raise ValueError(f'{", ".join(missing)} required')
+    too_long = [name for name, value in values.items() if len(value) > Currency._meta.get_field(name).max_length]
+    if too_long:
+        raise ValueError(f'{", ".join(too_long)} too long')
+    values['is_default'] = row.get('is_default') in (True, 'True', 'true', '1', 'yes', 'Yes')
+    return values
+
+
+def import_subscriptions(user, rows, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Import subscriptions for a user, skipping ones the user already has.
+
+    The user's categories are read in one query. For each batch, one query
+    finds the rows whose fingerprint matches an existing subscription, then
+    categories named in the remaining rows that don't exist yet are created
+    with one bulk_create(), followed by the subscriptions and their renewal
+    occurrences. Rows repeating an earlier row of the import are skipped
+    too, as the earlier batches are already written when a batch is checked.
+
+    Args:
+        user: The user to import the subscriptions for
+        rows: Iterable of (row number, row dictionary) tuples
+        batch_size: Number of subscriptions written per bulk_create()
+        progress: Optional function called with the number of rows read after each batch
+
+    Returns:
+        An ImportResult
+    """
+    result = ImportResult()
+    rows_read = 0
+
+    with transaction.atomic():
+        categories = {category.name: category for category in Category.objects.filter(user=user)}
+
+        for batch in batched(rows, batch_size):
+            cleaned = []
+            for row_number, row in batch:
+                try:
+                    values, category_name = clean_subscription_row(row)
+                except ValueError as e:
+                    result.add_error(row_number, str(e))
+                    continue
+                values['fingerprint'] = row_fingerprint(values)
+                cleaned.append((values, category_name))
+
+            # Leave out subscriptions the user already has, or that appear twice in the batch
+            existing = existing_fingerprints(user, [values['fingerprint'] for values, _ in cleaned])
+            new_rows = []
+            for values, category_name in cleaned:
+                if values['fingerprint'] in existing:
+                    result.skipped += 1
+                else:
+                    existing.add(values['fingerprint'])
+                    new_rows.append((values, category_name))
+            cleaned = new_rows
+
+            # Create the categories this batch needs in one go
+            new_categories = [
+                Category(name=name, user=user)
+                for name in dict.fromkeys(name for _, name in cleaned if name and name not in categories)
+            ]
+            if new_categories:
+                Category.objects.bulk_create(new_categories)
+                categories.update((category.name, category) for category in new_categories)
+
+            subscriptions = [
+                Subscription(user=user, category=categories[name] if name else None, **values)
+                for values, name in cleaned
+            ]
+            for subscription in subscriptions:
+                subscription.next_billing_date = subscription.compute_next_billing_date()
+            Subscription.objects.bulk_create(subscriptions)
+            RenewalOccurrence.materialize(subscriptions)
+            result.imported += len(subscriptions)
+            rows_read += len(batch)
+            if progress:
+                progress(rows_read)
+
+        if result.imported:
+            bump_data_version(user.pk)
+
+    return result
+
+
+def import_categories(user, rows, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Import categories for a user, skipping names the user already has.
+
+    Args:
+        user: The user to import the categories for
+        rows: Iterable of (row number, row dictionary) tuples
+        batch_size: Number of categories written per bulk_create()
+        progress: Optional function called with the number of rows read after each batch
+
+    Returns:
+        An ImportResult
+    """
+    result = ImportResult()
+    rows_read = 0
+
+    with transaction.atomic():
+        existing = set(Category.objects.filter(user=user).values_list('name', flat=True))
+
+        for batch in batched(rows, batch_size):
+            categories = []
+            for row_number, row in batch:
+                try:
+                    name = clean_category_row(row)
+                except ValueError as e:
+                    result.add_error(row_number, str(e))
+                    continue
+
+                if name in existing:
+                    result.skipped += 1
+                else:
+                    existing.add(name)
+                    categories.append(Category(name=name, user=user))
+
+            Category.objects.bulk_create(categories)
+            result.imported += len(categories)
+            rows_read += len(batch)
+            if progress:
+                progress(rows_read)
+
+        if result.imported:
+            bump_data_version(user.pk)
+
+    return result
+
+
+def import_currencies(user, rows, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Import currencies for a user, skipping codes the user already has.
+
+    If any imported currency is marked as the default, the last one becomes
+    the user's only default currency.
+
+    Args:
+        user: The user to import the currencies for
+        rows: Iterable of (row number, row dictionary) tuples
+        batch_size: Number of currencies written per bulk_create()
+        progress: Optional function called with the number of rows read after each batch
+
+    Returns:
+        An ImportResult
+    """
+    result = ImportResult()
+    rows_read = 0
+
+    with transaction.atomic():
+        existing = set(Currency.objects.filter(user=user).values_list('code', flat=True))
+        default_currency = None
+
+        for batch in batched(rows, batch_size):
+            currencies = []
+            for row_number, row in batch:
+                try:
+                    values = clean_currency_row(row)
+                except ValueError as e:
+                    result.add_error(row_number, str(e))
+                    continue
+
+                if values['code'] in existing:
+                    result.skipped += 1
+                else:
+                    existing.add(values['code'])
+                    is_default = values.pop('is_default')
+                    currency = Currency(user=user, is_default=False, **values)
+                    if is_default:
+                        default_currency = currency
+                    currencies.append(currency)
+
+            Currency.objects.bulk_create(currencies)
+            result.imported += len(currencies)
+            rows_read += len(batch)
+            if progress:
+                progress(rows_read)
+
+        # Find the new default by code, as not every database returns the
+        # primary keys of rows added with bulk_create()
+        if default_currency is not None:
+            Currency.objects.filter(user=user, is_default=True).update(is_default=False)
+            Currency.objects.filter(user=user, code=default_currency.code).update(is_default=True)
+
+        if result.imported:
+            bump_data_version(user.pk)
+
+    return result
+
+
+# Row validation for each kind of import
+ROW_CLEANERS = {
+    'subscriptions': clean_subscription_row,
+    'categories': clean_category_row,
+    'currencies': clean_currency_row,
+}
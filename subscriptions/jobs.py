@@ -0,0 +1,351 @@
+"""
+A small database-backed queue for imports and exports that are too slow to
+run inside a web request.
+
+Views queue a Job with enqueue_job() and redirect to its status page, which
+polls the job's progress. The run_jobs management command claims queued jobs
+and runs them with the handler registered for their kind. Each job records the
+worker running it, which sends heartbeats while it runs; jobs whose heartbeat
+stops because their worker stopped, e.g. on a deploy, are requeued by any worker.
+
+Imports run in a single transaction, so their progress isn't visible in the
+database until they finish. Progress is also written to the cache, which the
+progress endpoint reads first; use a cache backend shared between processes
+(see CACHE_BACKEND) to see it while an import runs.
+"""
+import logging
+import os
+import socket
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .backup import restore_backup, restore_message
+from .importers import import_categories, import_currencies, import_subscriptions, staged_import, staged_rows
+from .models import Job, Subscription, job_result_storage
+from .utils import EXPORT_CHUNK_SIZE, generate_subscriptions_csv
+
+logger = logging.getLogger(__name__)
+
+# Handler function for each kind of job
+JOB_HANDLERS = {}
+
+# Jobs lost by this many workers are failed instead of being requeued again
+MAX_JOB_ATTEMPTS = 2
+
+# SQLite allows one writer at a time, so imports run by the same worker take
+# turns rather than failing with "database is locked" when their transactions
+# both try to write
+_import_lock = threading.Lock()
+
+
+def job_handler(kind):
+    """
+    Register a function as the handler for a kind of job.
+    """
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue_job(user, kind, payload=None, total=None):
+    """
+    Queue a job for the run_jobs worker.
+
+    Args:
+        user: The user the job runs for
+        kind: What the job does, one of Job.KIND_CHOICES
+        payload: JSON-serializable arguments for the job's handler
+        total: Number of rows the job will process, if known
+
+    Returns:
+        The queued Job
+    """
+    return Job.objects.create(user=user, kind=kind, payload=payload or {}, total=total)
+
+
+def worker_name():
+    """
+    Name the current worker process by its host and process ID.
+    """
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_next_job(worker=None):
+    """
+    Claim the oldest queued job by marking it as running.
+
+    The status is only changed if the job is still queued, so workers
+    running side by side never claim the same job.
+
+    Args:
+        worker: Name of the claiming worker (default: this process)
+
+    Returns:
+        The claimed Job, or None if the queue is empty
+    """
+    worker = worker or worker_name()
+    queued = Job.objects.filter(status='queued').order_by('created_at', 'pk').values_list('pk', flat=True)
+    for job_id in queued[:10]:
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=job_id, status='queued').update(
+            status='running', started_at=now, heartbeat_at=now, worker=worker, attempts=F('attempts') + 1
+        )
+        if claimed:
+            return Job.objects.select_related('user').get(pk=job_id)
+    return None
+
+
+def send_heartbeat(worker=None):
+    """
+    Show that a worker is still running its jobs.
+
+    Args:
+        worker: Name of the worker (default: this process)
+
+    Returns:
+        The number of running jobs the heartbeat was sent for
+    """
+    return Job.objects.filter(status='running', worker=worker or worker_name()).update(heartbeat_at=timezone.now())
+
+
+def reclaim_stale_jobs(timeout=None):
+    """
+    Requeue running jobs whose worker has stopped sending heartbeats.
+
+    Such jobs were lost by a worker that stopped while running them. Imports
+    and restores run in one transaction, so nothing they did was kept and
+    they can run again. Jobs lost MAX_JOB_ATTEMPTS times are failed instead,
+    so a job that stops its worker can't keep doing so.
+
+    Args:
+        timeout: Seconds without a heartbeat after which a running job is lost
+            (default: JOB_HEARTBEAT_TIMEOUT)
+
+    Returns:
+        A tuple of (number of jobs requeued, number of jobs failed)
+    """
+    if timeout is None:
+        timeout = settings.JOB_HEARTBEAT_TIMEOUT
+    stale = Job.objects.filter(status='running', heartbeat_at__lt=timezone.now() - timedelta(seconds=timeout))
+
+    with transaction.atomic():
+        stale_ids = list(stale.values_list('pk', flat=True))
+        if not stale_ids:
+            return 0, 0
+
+        failed = stale.filter(attempts__gte=MAX_JOB_ATTEMPTS).update(
+            status='failed',
+            error='The job stopped before it finished. Please try again.',
+            finished_at=timezone.now()
+        )
+        requeued = stale.update(status='queued', progress=0, worker='', started_at=None, heartbeat_at=None)
+    cache.delete_many([progress_cache_key(job_id) for job_id in stale_ids])
+    return requeued, failed
+
+
+def run_job(job):
+    """
+    Run a claimed job with its handler and record the outcome.
+    """
+    try:
+        JOB_HANDLERS[job.kind](job)
+    except Exception as e:
+        logger.exception('Job %s (%s) failed', job.pk, job.kind)
+        job.status = 'failed'
+        job.error = str(e)
+    else:
+        job.status = 'succeeded'
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'progress', 'total', 'result', 'result_file', 'error', 'finished_at'])
+    cache.delete(progress_cache_key(job.pk))
+
+
+def run_pending_jobs():
+    """
+    Run queued jobs one after another in this thread until the queue is empty.
+
+    Returns:
+        The number of jobs run
+    """
+    count = 0
+    while (job := claim_next_job()) is not None:
+        run_job(job)
+        count += 1
+    return count
+
+
+def progress_cache_key(job_id):
+    return f'job-progress:{job_id}'
+
+
+def report_progress(job, progress, total=None):
+    """
+    Record how many rows a running job has processed.
+
+    Args:
+        job: The running Job
+        progress: Number of rows processed so far
+        total: Number of rows the job will process, if it wasn't known when queued
+    """
+    job.progress = progress
+    if total is not None:
+        job.total = total
+    cache.set(progress_cache_key(job.pk), (job.progress, job.total), settings.JOB_RESULT_MAX_AGE)
+
+    # Inside a transaction the update wouldn't be seen until the job finishes
+    if not transaction.get_connection().in_atomic_block:
+        Job.objects.filter(pk=job.pk).update(progress=job.progress, total=job.total, heartbeat_at=timezone.now())
+
+
+def get_progress(job):
+    """
+    Get a job's latest (progress, total), preferring the value in the cache.
+    """
+    if job.status == 'running':
+        cached = cache.get(progress_cache_key(job.pk))
+        if cached is not None:
+            return cached
+    return job.progress, job.total
+
+
+def purge_finished_jobs(max_age=None):
+    """
+    Delete jobs that finished more than max_age seconds ago, with their files.
+
+    Args:
+        max_age: Age in seconds after which jobs are deleted (default: JOB_RESULT_MAX_AGE)
+
+    Returns:
+        The number of jobs deleted
+    """
+    if max_age is None:
+        max_age = settings.JOB_RESULT_MAX_AGE
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+
+    deleted = 0
+    for job in Job.objects.filter(finished_at__lt=cutoff).only('pk', 'result_file').iterator():
+        if job.result_file:
+            job.result_file.delete(save=False)
+        job.delete()
+        deleted += 1
+    return deleted
+
+
+@contextmanager
+def _import_transaction(job):
+    """
+    Run a job's import in a transaction that holds the database's write lock from the start.
+    """
+    with _import_lock, transaction.atomic():
+        # Write first, so the transaction holds SQLite's write lock before it
+        # reads any rows. A read lock that later needs upgrading fails at
+        # once if another connection is already waiting to write.
+        Job.objects.filter(pk=job.pk).update(progress=0)
+        yield
+        # No heartbeat can be written while the transaction holds the lock,
+        # so commit a new one with the import before other workers look
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now())
+
+
+def _run_import(job, import_rows, noun):
+    """
+    Import the staged rows named in a job's payload, then discard them.
+    """
+    import_id = job.payload['import_id']
+    row_numbers = job.payload.get('row_numbers')
+
+    with _import_transaction(job):
+        result = import_rows(
+            job.user,
+            staged_rows(job.user, import_id, row_numbers),
+            progress=lambda rows_read: report_progress(job, rows_read)
+        )
+        staged_import(job.user, import_id).delete()
+
+    job.progress = job.total or 0
+    job.result = {
+        'imported': result.imported,
+        'skipped': result.skipped,
+        'error_count': result.error_count,
+        'message': result.success_message(noun),
+        'warning': result.error_message(),
+    }
+
+
+@job_handler('import_subscriptions')
+def run_subscriptions_import(job):
+    _run_import(job, import_subscriptions, 'subscriptions')
+
+
+@job_handler('import_categories')
+def run_categories_import(job):
+    _run_import(job, import_categories, 'categories')
+
+
+@job_handler('import_currencies')
+def run_currencies_import(job):
+    _run_import(job, import_currencies, 'currencies')
+
+
+@job_handler('export_subscriptions')
+def run_subscriptions_export(job):
+    """
+    Write all of the user's subscriptions to a CSV file for download.
+    """
+    subscriptions = Subscription.objects.filter(user=job.user).order_by(Lower('name'))
+    report_progress(job, 0, subscriptions.count())
+
+    with tempfile.TemporaryFile() as csv_file:
+        # The first line is the header, so the line number counts rows written
+        for line_number, line in enumerate(generate_subscriptions_csv(subscriptions)):
+            csv_file.write(line.encode('utf-8'))
+            if line_number and line_number % EXPORT_CHUNK_SIZE == 0:
+                report_progress(job, line_number)
+
+        csv_file.seek(0)
+        job.result_file.save(f'subscriptions-{job.pk}.csv', File(csv_file), save=False)
+
+    job.progress = job.total
+    job.result = {'message': f'Exported {job.total} subscriptions.'}
+
+
+@job_handler('restore_backup')
+def run_backup_restore(job):
+    """
+    Restore the uploaded backup archive named in the job's payload, then delete it.
+    """
+    storage = job_result_storage()
+    archive_name = job.payload['archive']
+
+    try:
+        with storage.open(archive_name, 'rb') as archive_file, _import_transaction(job):
+            results = restore_backup(
+                job.user,
+                archive_file,
+                progress=lambda rows_read: report_progress(job, rows_read)
+            )
+    finally:
+        storage.delete(archive_name)
+
+    job.progress = job.total or 0
+    job.result = {
+        'imported': sum(result.imported for result in results.values()),
+        'skipped': sum(result.skipped for result in results.values()),
+        'error_count': sum(result.error_count for result in results.values()),
+        'message': restore_message(results),
+        'warning': '; '.join(
+            f'{kind}: {result.error_message()}' for kind, result in results.items() if result.error_count
+        ),
+    }
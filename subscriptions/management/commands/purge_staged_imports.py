@@ -0,0 +1,26 @@
+"""
+Management command to delete CSV imports that were uploaded but never confirmed.
+
+    python manage.py purge_staged_imports
+
+Run it on a schedule (e.g. hourly from cron).
+"""
+from django.core.management.base import BaseCommand
+
+from subscriptions.importers import purge_staged_imports
+
+
+class Command(BaseCommand):
+    help = 'Delete staged CSV imports older than STAGED_IMPORT_MAX_AGE'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age',
+            type=int,
+            default=None,
+            help='Delete staged rows older than this many seconds (default: STAGED_IMPORT_MAX_AGE)',
+        )
+
+    def handle(self, *args, **options):
+        deleted = purge_staged_imports(options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} staged import rows.'))
@@ -0,0 +1,24 @@
+"""
+Management command to refresh the stored exchange rates from the rates API.
+
+Run it periodically, e.g. hourly from cron:
+
+    python manage.py refresh_exchange_rates
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from subscriptions.exchange_rates import refresh_exchange_rates
+
+
+class Command(BaseCommand):
+    help = 'Fetch the latest exchange rates and store them for the overview page'
+
+    def handle(self, *args, **options):
+        try:
+            snapshot = refresh_exchange_rates()
+        except Exception as e:
+            raise CommandError(f'Error refreshing exchange rates: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {len(snapshot.rates)} {snapshot.base_currency} exchange rates fetched at {snapshot.fetched_at}.'
+        ))
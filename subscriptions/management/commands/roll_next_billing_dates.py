@@ -0,0 +1,31 @@
+"""
+Management command to move stored next billing dates that have passed on to
+the next renewal.
+
+Run it nightly, e.g. from cron, just after midnight:
+
+    python manage.py roll_next_billing_dates
+
+The subscription list works out dates that have passed again when it shows
+or filters by them, so a missed run only leaves sorting by next billing date
+out of date until the next run.
+"""
+from django.core.management.base import BaseCommand
+
+from subscriptions.models import Subscription
+
+
+class Command(BaseCommand):
+    help = 'Advance next billing dates that are before today to the next renewal'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of subscriptions to update per batch (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        updated = Subscription.objects.roll_next_billing_dates(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Advanced {updated} next billing dates.'))
@@ -0,0 +1,78 @@
+"""
+Management command to roll the materialized renewal occurrence horizon forward.
+
+Run it nightly, e.g. from cron:
+
+    python manage.py roll_renewal_occurrences
+
+Each run expands from the end of the previous one, so missed nights are
+filled in. Use --full after a deploy or a change to the horizon settings to
+rebuild the whole horizon.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from subscriptions.models import RenewalOccurrence, RenewalOccurrenceHorizon, Subscription
+from subscriptions.utils import get_occurrence_horizon
+
+
+class Command(BaseCommand):
+    help = 'Drop renewal occurrences outside the horizon and add the ones that have come into it'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Expand the whole horizon instead of only its newest days',
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Number of days before the end of the previous roll to expand again (default: 7)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of subscriptions to expand per batch (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        first_date, last_date = get_occurrence_horizon()
+        rolled_to = RenewalOccurrenceHorizon.get_last_date()
+        if options['full'] or rolled_to is None:
+            expand_from = first_date
+        else:
+            # Carry on from where the previous roll stopped, however long ago that was
+            expand_from = max(first_date, min(rolled_to, last_date) - timedelta(days=options['days']))
+
+        # Drop occurrences that have fallen out of the horizon
+        deleted, _ = RenewalOccurrence.objects.filter(Q(date__lt=first_date) | Q(date__gt=last_date)).delete()
+
+        subscriptions = Subscription.objects.filter(user__isnull=False).order_by('pk')
+        expanded = 0
+        batch = []
+        for subscription in subscriptions.iterator(chunk_size=options['batch_size']):
+            batch.append(subscription)
+            if len(batch) >= options['batch_size']:
+                expanded += self.expand(batch, expand_from, last_date)
+                batch = []
+        if batch:
+            expanded += self.expand(batch, expand_from, last_date)
+        RenewalOccurrenceHorizon.set_last_date(last_date)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Horizon {first_date} to {last_date}: removed {deleted} expired occurrences, '
+            f'expanded {expanded} renewals from {expand_from}.'
+        ))
+
+    def expand(self, subscriptions, first_date, last_date):
+        """
+        Insert the renewals of a batch of subscriptions, skipping existing rows.
+        """
+        with transaction.atomic():
+            return RenewalOccurrence.materialize(subscriptions, first_date, last_date)
@@ -0,0 +1,122 @@
+"""
+Management command to run queued background imports and exports.
+
+    python manage.py run_jobs
+
+Keep one or more of these running alongside the web server (e.g. under the
+same process supervisor). Each worker claims jobs as threads in its pool
+become free, so several workers can share one queue. Every
+JOB_HEARTBEAT_INTERVAL, and on starting, a worker sends a heartbeat for the
+jobs it is running and requeues jobs without a heartbeat for longer than
+JOB_HEARTBEAT_TIMEOUT, as the worker running them must have stopped.
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+
+from subscriptions.jobs import (
+    claim_next_job, purge_finished_jobs, reclaim_stale_jobs, run_job, run_pending_jobs, send_heartbeat, worker_name,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds between purges of old finished jobs
+PURGE_INTERVAL = 600
+
+
+def run_job_in_thread(job):
+    """
+    Run a job in a pool thread, closing the thread's database connection afterwards.
+    """
+    try:
+        run_job(job)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background import and export jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=settings.JOB_WORKER_THREADS,
+            help='Number of jobs to run at once (default: JOB_WORKER_THREADS)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty instead of waiting for new jobs',
+        )
+
+    def check_jobs(self, worker):
+        """
+        Send a heartbeat for this worker's jobs and requeue jobs lost by stopped workers.
+        """
+        try:
+            send_heartbeat(worker)
+            requeued, failed = reclaim_stale_jobs()
+        except OperationalError:
+            # Another connection holds the write lock; try again next time
+            logger.warning('Worker %s could not check its jobs', worker, exc_info=True)
+            return
+        if requeued or failed:
+            self.stdout.write(f'Requeued {requeued} and failed {failed} jobs left running by a stopped worker.')
+
+    def handle(self, *args, **options):
+        threads = max(1, options['threads'])
+        worker = worker_name()
+
+        # Pick up jobs lost by workers that stopped while running them
+        self.check_jobs(worker)
+        last_check = time.monotonic()
+
+        # A single thread runs jobs in this thread, which is all --once needs
+        if threads == 1 and options['once']:
+            count = run_pending_jobs()
+            self.stdout.write(self.style.SUCCESS(f'Ran {count} jobs.'))
+            return
+
+        self.stdout.write(f'Running jobs with {threads} threads...')
+        count = 0
+        last_purge = 0
+
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='job') as executor:
+            running = set()
+            while True:
+                # Claim jobs while there are free threads
+                while len(running) < threads:
+                    close_old_connections()
+                    job = claim_next_job(worker)
+                    if job is None:
+                        break
+                    running.add(executor.submit(run_job_in_thread, job))
+                    count += 1
+
+                # Keep this worker's jobs alive and pick up jobs lost by other workers
+                if time.monotonic() - last_check > settings.JOB_HEARTBEAT_INTERVAL:
+                    close_old_connections()
+                    self.check_jobs(worker)
+                    last_check = time.monotonic()
+
+                if not running:
+                    if options['once']:
+                        break
+
+                    # Purge old jobs while the queue is idle
+                    if time.monotonic() - last_purge > PURGE_INTERVAL:
+                        purge_finished_jobs()
+                        last_purge = time.monotonic()
+
+                # Wait for a thread to free up, or for new jobs to be queued
+                if running:
+                    _, running = wait(running, timeout=settings.JOB_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(settings.JOB_POLL_INTERVAL)
+
+        self.stdout.write(self.style.SUCCESS(f'Ran {count} jobs.'))
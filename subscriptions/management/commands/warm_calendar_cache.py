@@ -0,0 +1,42 @@
+"""
+Management command to pre-warm the calendar cache after a deploy.
+
+    python manage.py warm_calendar_cache
+
+Only useful with a cache backend shared between processes (see CACHE_BACKEND).
+"""
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from subscriptions.calendar_cache import get_calendar_months
+
+
+class Command(BaseCommand):
+    help = 'Cache the calendar months around today for users with active subscriptions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=3,
+            help='Number of months either side of the current month to cache (default: 3)',
+        )
+
+    def handle(self, *args, **options):
+        today = date.today()
+        first_month = today.replace(day=1) - relativedelta(months=options['months'])
+        months = [
+            (month.year, month.month)
+            for month in (first_month + relativedelta(months=offset) for offset in range(options['months'] * 2 + 1))
+        ]
+
+        users = get_user_model().objects.filter(is_active=True, subscriptions__status='active').distinct().order_by('pk')
+        warmed = 0
+        for user in users.iterator():
+            get_calendar_months(user, months, today, count_lookups=False)
+            warmed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Cached {len(months)} calendar months for {warmed} users.'))
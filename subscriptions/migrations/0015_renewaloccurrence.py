@@ -0,0 +1,100 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:56
+
+import calendar
+from datetime import date, timedelta
+
+import django.db.models.deletion
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import migrations, models
+
+# Renewal rules as they were when this migration was written, so later changes
+# to subscriptions.utils don't change what it does
+RENEWAL_PERIOD_DAYS = {'weekly': 7}
+RENEWAL_PERIOD_MONTHS = {'monthly': 1, 'quarterly': 3, 'yearly': 12, 'biennial': 24}
+
+
+def month_index(value):
+    return value.year * 12 + value.month - 1
+
+
+def renewal_in_month(anchor_day, index):
+    year, month = divmod(index, 12)
+    return date(year, month + 1, min(anchor_day, calendar.monthrange(year, month + 1)[1]))
+
+
+def renewal_dates(subscription, first_date, last_date):
+    """
+    Yield a subscription's renewal dates between two dates, stopping at its cancellation.
+    """
+    if subscription.status == 'cancelled' and subscription.cancellation_date:
+        last_date = min(last_date, subscription.cancellation_date)
+    start_date = subscription.start_date
+
+    if subscription.renewal_period in RENEWAL_PERIOD_DAYS:
+        step = RENEWAL_PERIOD_DAYS[subscription.renewal_period]
+        renewal_date = start_date
+        if first_date > start_date:
+            renewal_date += timedelta(days=-(-(first_date - start_date).days // step) * step)
+        while renewal_date <= last_date:
+            yield renewal_date
+            renewal_date += timedelta(days=step)
+
+    elif subscription.renewal_period in RENEWAL_PERIOD_MONTHS:
+        step = RENEWAL_PERIOD_MONTHS[subscription.renewal_period]
+        periods = max(0, (month_index(first_date) - month_index(start_date)) // step)
+        while (renewal_date := renewal_in_month(start_date.day, month_index(start_date) + periods * step)) <= last_date:
+            if renewal_date >= first_date:
+                yield renewal_date
+            periods += 1
+
+
+def backfill_occurrences(apps, schema_editor):
+    """
+    Store the renewals of existing subscriptions over the horizon around today.
+    """
+    Subscription = apps.get_model('subscriptions', 'Subscription')
+    RenewalOccurrence = apps.get_model('subscriptions', 'RenewalOccurrence')
+
+    today = date.today()
+    first_date = today - relativedelta(months=getattr(settings, 'RENEWAL_OCCURRENCE_MONTHS_BACK', 24))
+    last_date = today + relativedelta(months=getattr(settings, 'RENEWAL_OCCURRENCE_MONTHS_FORWARD', 36))
+
+    batch = []
+    for subscription in Subscription.objects.filter(user__isnull=False).order_by('pk').iterator(chunk_size=1000):
+        for renewal_date in renewal_dates(subscription, first_date, last_date):
+            batch.append(RenewalOccurrence(
+                subscription_id=subscription.pk, user_id=subscription.user_id, date=renewal_date,
+                amount=subscription.cost, currency=subscription.currency
+            ))
+        if len(batch) >= 1000:
+            RenewalOccurrence.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    RenewalOccurrence.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0014_alter_category_user_alter_currency_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenewalOccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('currency', models.CharField(max_length=3)),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renewal_occurrences', to='subscriptions.subscription')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renewal_occurrences', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'date'], name='subscriptio_user_id_0849b0_idx')],
+                'unique_together': {('subscription', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_occurrences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:53
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0017_userdataversion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('import_id', models.UUIDField()),
+                ('kind', models.CharField(choices=[('subscriptions', 'Subscriptions'), ('categories', 'Categories'), ('currencies', 'Currencies')], max_length=20)),
+                ('row_number', models.PositiveIntegerField()),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_imports', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['import_id', 'row_number'],
+                'indexes': [models.Index(fields=['created_at'], name='staged_import_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('import_id', 'row_number'), name='unique_staged_import_row')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:56
+
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copy of subscriptions.models.subscription_fingerprint, as migrations
+# must not import from the app's current code
+def subscription_fingerprint(name, cost, currency, renewal_period, start_date):
+    parts = [
+        ' '.join(str(name).split()).casefold(),
+        str(Decimal(str(cost)).quantize(Decimal('0.01'))),
+        str(currency),
+        str(renewal_period),
+        str(start_date)[:10],
+    ]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def fill_fingerprints(apps, schema_editor):
+    """
+    Work out the fingerprint of existing subscriptions, a batch at a time.
+    """
+    Subscription = apps.get_model('subscriptions', 'Subscription')
+
+    batch = []
+    for subscription in Subscription.objects.only('name', 'cost', 'currency', 'renewal_period', 'start_date').iterator(chunk_size=1000):
+        subscription.fingerprint = subscription_fingerprint(
+            subscription.name,
+            subscription.cost,
+            subscription.currency,
+            subscription.renewal_period,
+            subscription.start_date
+        )
+        batch.append(subscription)
+        if len(batch) == 1000:
+            Subscription.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+    Subscription.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0019_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', 'fingerprint'], name='subscription_fingerprint_idx'),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+    ]
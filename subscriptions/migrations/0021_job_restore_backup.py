@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0020_subscription_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('import_subscriptions', 'Import subscriptions'), ('import_categories', 'Import categories'), ('import_currencies', 'Import currencies'), ('export_subscriptions', 'Export subscriptions'), ('restore_backup', 'Restore backup')], max_length=30),
+        ),
+    ]
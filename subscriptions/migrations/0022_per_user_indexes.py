@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:50
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0021_job_restore_backup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='currency',
+            index=models.Index(fields=['user', 'is_default'], name='currency_user_default_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', 'status'], name='subscription_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', 'start_date'], name='subscription_user_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', 'renewal_period'], name='subscription_user_renewal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(models.F('user'), django.db.models.functions.text.Lower('name'), name='subscription_user_name_idx'),
+        ),
+    ]
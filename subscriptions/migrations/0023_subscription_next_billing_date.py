@@ -0,0 +1,89 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:54
+
+import calendar
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of subscriptions.utils.get_next_billing_date and the renewal
+# rules it used, so that this migration runs the same code whatever the app's
+# current code does
+RENEWAL_PERIOD_DAYS = {'weekly': 7}
+RENEWAL_PERIOD_MONTHS = {'monthly': 1, 'quarterly': 3, 'yearly': 12, 'biennial': 24}
+
+
+def month_index(value):
+    return value.year * 12 + value.month - 1
+
+
+def renewal_in_month(anchor_day, index):
+    year, month = divmod(index, 12)
+    return date(year, month + 1, min(anchor_day, calendar.monthrange(year, month + 1)[1]))
+
+
+def next_renewal_on_or_after(start_date, renewal_period, on_or_after):
+    if on_or_after <= start_date:
+        return start_date
+
+    if renewal_period in RENEWAL_PERIOD_DAYS:
+        step = RENEWAL_PERIOD_DAYS[renewal_period]
+        periods = -(-(on_or_after - start_date).days // step)
+        return start_date + timedelta(days=periods * step)
+
+    step = RENEWAL_PERIOD_MONTHS[renewal_period]
+    start_index = month_index(start_date)
+    periods = -(-(month_index(on_or_after) - start_index) // step)
+    renewal_date = renewal_in_month(start_date.day, start_index + periods * step)
+    if renewal_date < on_or_after:
+        renewal_date = renewal_in_month(start_date.day, start_index + (periods + 1) * step)
+    return renewal_date
+
+
+def get_next_billing_date(subscription, today):
+    """
+    Get a subscription's next renewal on or after today, or None once it has been cancelled.
+    """
+    if subscription.status == 'cancelled' and subscription.cancellation_date and today > subscription.cancellation_date:
+        return None
+    if subscription.renewal_period not in RENEWAL_PERIOD_DAYS and subscription.renewal_period not in RENEWAL_PERIOD_MONTHS:
+        return subscription.start_date
+    return next_renewal_on_or_after(subscription.start_date, subscription.renewal_period, today)
+
+
+def fill_next_billing_dates(apps, schema_editor):
+    """
+    Work out the next billing date of existing subscriptions, a batch at a time.
+    """
+    Subscription = apps.get_model('subscriptions', 'Subscription')
+    today = date.today()
+
+    batch = []
+    for subscription in Subscription.objects.only('start_date', 'renewal_period', 'status', 'cancellation_date').iterator(chunk_size=1000):
+        subscription.next_billing_date = get_next_billing_date(subscription, today)
+        batch.append(subscription)
+        if len(batch) == 1000:
+            Subscription.objects.bulk_update(batch, ['next_billing_date'])
+            batch = []
+    Subscription.objects.bulk_update(batch, ['next_billing_date'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0022_per_user_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='next_billing_date',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', 'next_billing_date'], name='subscription_user_next_idx'),
+        ),
+        migrations.RunPython(fill_next_billing_dates, migrations.RunPython.noop),
+    ]
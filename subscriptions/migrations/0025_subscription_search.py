@@ -0,0 +1,118 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The category name of a subscription row, for the triggers below
+CATEGORY_NAME = "coalesce((SELECT name FROM subscriptions_category WHERE id = new.category_id), '')"
+
+INDEX_NEW_ROW = f"""
+    INSERT INTO subscriptions_subscription_fts (rowid, name, notes, url, category, user_id)
+    VALUES (new.id, new.name, coalesce(new.notes, ''), coalesce(new.url, ''), {CATEGORY_NAME}, coalesce(new.user_id, ''));
+"""
+
+CREATE_SEARCH = [
+    """
+    CREATE VIRTUAL TABLE subscriptions_subscription_fts USING fts5(
+        name, notes, url, category, user_id,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    # Rank name matches highest and leave the owner out of the score
+    """
+    INSERT INTO subscriptions_subscription_fts (subscriptions_subscription_fts, rank)
+    VALUES ('rank', 'bm25(10.0, 1.0, 2.0, 3.0, 0.0)')
+    """,
+    f"""
+    CREATE TRIGGER subscriptions_subscription_fts_insert AFTER INSERT ON subscriptions_subscription BEGIN
+        {INDEX_NEW_ROW}
+    END
+    """,
+    # Only changes to searched columns touch the index, not e.g. rolling next billing dates
+    f"""
+    CREATE TRIGGER subscriptions_subscription_fts_update
+    AFTER UPDATE OF name, notes, url, category_id, user_id ON subscriptions_subscription BEGIN
+        DELETE FROM subscriptions_subscription_fts WHERE rowid = old.id;
+        {INDEX_NEW_ROW}
+    END
+    """,
+    """
+    CREATE TRIGGER subscriptions_subscription_fts_delete AFTER DELETE ON subscriptions_subscription BEGIN
+        DELETE FROM subscriptions_subscription_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER subscriptions_category_fts_rename AFTER UPDATE OF name ON subscriptions_category BEGIN
+        UPDATE subscriptions_subscription_fts SET category = new.name
+        WHERE rowid IN (SELECT id FROM subscriptions_subscription WHERE category_id = new.id);
+    END
+    """,
+    """
+    INSERT INTO subscriptions_subscription_fts (rowid, name, notes, url, category, user_id)
+    SELECT s.id, s.name, coalesce(s.notes, ''), coalesce(s.url, ''), coalesce(c.name, ''), coalesce(s.user_id, '')
+    FROM subscriptions_subscription s LEFT JOIN subscriptions_category c ON c.id = s.category_id
+    """,
+]
+
+DROP_SEARCH = [
+    'DROP TRIGGER IF EXISTS subscriptions_category_fts_rename',
+    'DROP TRIGGER IF EXISTS subscriptions_subscription_fts_delete',
+    'DROP TRIGGER IF EXISTS subscriptions_subscription_fts_update',
+    'DROP TRIGGER IF EXISTS subscriptions_subscription_fts_insert',
+    'DROP TABLE IF EXISTS subscriptions_subscription_fts',
+]
+
+
+def has_fts5(connection):
+    """
+    Check whether an SQLite database was built with FTS5.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+
+def create_search(apps, schema_editor):
+    """
+    Create and fill the full-text search table, on SQLite builds that have FTS5.
+
+    Other databases search with substring filters instead.
+    """
+    if schema_editor.connection.vendor != 'sqlite' or not has_fts5(schema_editor.connection):
+        return
+    for sql in CREATE_SEARCH:
+        schema_editor.execute(sql)
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SEARCH:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0024_subscription_user_cost_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubscriptionSearch',
+            fields=[
+                ('subscription', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='subscriptions.subscription')),
+                ('name', models.TextField()),
+                ('notes', models.TextField()),
+                ('url', models.TextField()),
+                ('category', models.TextField()),
+                ('user_id', models.TextField()),
+                ('document', models.TextField(db_column='subscriptions_subscription_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'subscriptions_subscription_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search, drop_search),
+    ]
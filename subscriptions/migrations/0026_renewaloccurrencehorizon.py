@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0025_subscription_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenewalOccurrenceHorizon',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_date', models.DateField()),
+                ('rolled_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -1,6 +1,15 @@
-from django.db import models
+import hashlib
+import os
+from datetime import date
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Lower
 from django.utils import timezone
 from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.serializers.json import DjangoJSONEncoder
 
 # Create your models here.
 class Category(models.Model):
@@ -46,6 +55,144 @@ class Currency(models.Model):
     class Meta:
         verbose_name_plural = "Currencies"
         unique_together = ['code', 'user']  # Code must be unique per user
+        indexes = [
+            models.Index(fields=['user', 'is_default'], name='currency_user_default_idx'),
+        ]
+
+
+# Number of times a subscription is paid per year, by renewal period
+ANNUAL_COST_FACTORS = {
+    'weekly': Decimal('52'),
+    'monthly': Decimal('12'),
+    'quarterly': Decimal('4'),
+    'yearly': Decimal('1'),
+    'biennial': Decimal('0.5'),
+}
+
+
+def normalized_cost(cost, renewal_period):
+    """
+    Work out the annual and monthly cost of a subscription.
+
+    Subscriptions with an unknown renewal period are treated as yearly.
+
+    Args:
+        cost: The cost of each renewal
+        renewal_period: The renewal period, e.g. 'monthly'
+
+    Returns:
+        A tuple of the annual cost and the monthly cost, as Decimals
+    """
+    annual_cost = Decimal(str(cost)) * ANNUAL_COST_FACTORS.get(renewal_period, Decimal('1'))
+    return annual_cost, annual_cost / 12
+
+
+def subscription_fingerprint(name, cost, currency, renewal_period, start_date):
+    """
+    Hash the fields that identify a subscription, to spot duplicates.
+
+    Names are compared ignoring case and repeated whitespace, and costs to
+    the penny, so the same subscription imported twice gets the same
+    fingerprint however its CSV was edited in between.
+
+    Returns:
+        A 64 character hex digest
+    """
+    parts = [
+        ' '.join(str(name).split()).casefold(),
+        str(Decimal(str(cost)).quantize(Decimal('0.01'))),
+        str(currency),
+        str(renewal_period),
+        str(start_date)[:10],
+    ]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+class SubscriptionQuerySet(models.QuerySet):
+    def cost_totals(self, *fields):
+        """
+        Sum the annual and monthly costs, grouped by the given fields.
+
+        Only the grouping fields, cost and renewal period are read, and the
+        costs are summed with Decimal arithmetic, as SQLite would sum them as
+        floats.
+
+        Args:
+            *fields: Fields to group by, e.g. 'currency' or 'category__name'
+
+        Returns:
+            A list of dictionaries with the grouping fields, annual_total and
+            monthly_total, ordered by the grouping fields
+        """
+        totals = {}
+        for *group, cost, renewal_period in self.order_by(*fields).values_list(*fields, 'cost', 'renewal_period'):
+            annual_cost, monthly_cost = normalized_cost(cost, renewal_period)
+            group_totals = totals.setdefault(tuple(group), {
+                **dict(zip(fields, group)),
+                'annual_total': Decimal('0'),
+                'monthly_total': Decimal('0'),
+            })
+            group_totals['annual_total'] += annual_cost
+            group_totals['monthly_total'] += monthly_cost
+        return list(totals.values())
+
+    def renewing_between(self, first_date, last_date):
+        """
+        Filter to subscriptions that next renew between two dates, inclusive.
+
+        Stored next billing dates are compared in the database. Dates before
+        first_date, which the roll_next_billing_dates command hasn't moved on
+        yet, are worked out again here instead, without saving them.
+
+        Args:
+            first_date: The first date of the window, usually today
+            last_date: The last date of the window
+
+        Returns:
+            The filtered queryset
+        """
+        passed = self.filter(next_billing_date__lt=first_date).only(
+            'start_date', 'renewal_period', 'status', 'cancellation_date'
+        )
+        renewing_ids = []
+        for subscription in passed:
+            next_date = subscription.compute_next_billing_date(first_date)
+            if next_date is not None and first_date <= next_date <= last_date:
+                renewing_ids.append(subscription.pk)
+        return self.filter(Q(next_billing_date__range=(first_date, last_date)) | Q(pk__in=renewing_ids))
+
+    def roll_next_billing_dates(self, today=None, batch_size=1000):
+        """
+        Move stored next billing dates that have passed on to the next renewal.
+
+        Only rows whose next_billing_date is before today are read, through
+        the next_billing_date index, so a run costs little when few dates
+        have passed. Cancelled subscriptions get None once their
+        cancellation date has passed.
+
+        Args:
+            today: The date to roll forward to (default: today)
+            batch_size: Number of rows read and updated at a time
+
+        Returns:
+            The number of subscriptions updated
+        """
+        today = today or date.today()
+        stale = self.filter(next_billing_date__lt=today).order_by('pk').only(
+            'start_date', 'renewal_period', 'status', 'cancellation_date', 'next_billing_date'
+        )
+
+        updated = 0
+        batch = []
+        for subscription in stale.iterator(chunk_size=batch_size):
+            subscription.next_billing_date = subscription.compute_next_billing_date(today)
+            batch.append(subscription)
+            if len(batch) >= batch_size:
+                updated += self.bulk_update(batch, ['next_billing_date'])
+                batch = []
+        if batch:
+            updated += self.bulk_update(batch, ['next_billing_date'])
+        return updated
 
 
 class Subscription(models.Model):
@@ -91,12 +238,90 @@ class Subscription(models.Model):
         null=True,
         blank=True
     )
+    fingerprint = models.CharField(max_length=64, blank=True, editable=False)
+    next_billing_date = models.DateField(null=True, blank=True, editable=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = SubscriptionQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        from .versioning import bulk_data_change
+
+        self.fingerprint = self.compute_fingerprint()
+        self.next_billing_date = self.compute_next_billing_date()
+
+        # Commit the row and its occurrences together, and bump the owner's data
+        # version only once both are written, so nothing is cached under the new
+        # version from the old occurrences
+        with transaction.atomic(), bulk_data_change():
+            super().save(*args, **kwargs)
+            self.refresh_renewal_occurrences()
+
+    def compute_fingerprint(self):
+        """
+        Get the fingerprint of this subscription's name, cost, currency,
+        renewal period and start date.
+
+        save() stores it automatically; set it yourself when creating
+        subscriptions with bulk_create().
+        """
+        return subscription_fingerprint(self.name, self.cost, self.currency, self.renewal_period, self.start_date)
+
+    def compute_next_billing_date(self, today=None):
+        """
+        Get the date this subscription next renews on or after today.
+
+        save() stores it as next_billing_date, and the roll_next_billing_dates
+        command moves stored dates on once they pass; set it yourself when
+        creating subscriptions with bulk_create().
+        """
+        from .utils import get_next_billing_date
+        return get_next_billing_date(self, today)
+
     def get_currency_symbol(self):
         return self.CURRENCY_SYMBOLS.get(self.currency, '$')
 
+    @property
+    def annual_cost(self):
+        """The cost of this subscription over a year."""
+        return normalized_cost(self.cost, self.renewal_period)[0]
+
+    @property
+    def monthly_cost(self):
+        """The cost of this subscription over an average month."""
+        return normalized_cost(self.cost, self.renewal_period)[1]
+
+    def refresh_renewal_occurrences(self):
+        """
+        Bring the materialized renewal occurrences of this subscription up to date.
+
+        Only the difference is written: occurrences that no longer apply are
+        deleted, changed costs are updated in place and missing dates are inserted.
+        """
+        from .utils import get_occurrence_horizon, iter_subscription_renewals
+
+        occurrences = RenewalOccurrence.objects.filter(subscription=self)
+
+        # Subscriptions without an owner never appear in a user's calendar
+        if self.user_id is None:
+            occurrences.delete()
+            return
+
+        first_date, last_date = get_occurrence_horizon()
+        renewal_dates = list(iter_subscription_renewals(self, first_date, last_date))
+
+        occurrences.exclude(date__in=renewal_dates).delete()
+        occurrences.exclude(amount=self.cost, currency=self.currency, user_id=self.user_id).update(
+            amount=self.cost,
+            currency=self.currency,
+            user_id=self.user_id
+        )
+        RenewalOccurrence.objects.bulk_create(
+            [RenewalOccurrence.for_subscription(self, renewal_date) for renewal_date in renewal_dates],
+            ignore_conflicts=True
+        )
+
     def cancel(self, cancellation_date=None):
         """
         Cancel the subscription and set the cancellation date.
@@ -124,3 +349,307 @@ class Subscription(models.Model):
     def __str__(self):
         status_str = f" [CANCELLED]" if self.is_cancelled() else ""
         return f"{self.name}{status_str} ({self.get_currency_symbol()}{self.cost} {self.get_renewal_period_display()})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'fingerprint'], name='subscription_fingerprint_idx'),
+            models.Index(fields=['user', 'status'], name='subscription_user_status_idx'),
+            models.Index(fields=['user', 'start_date'], name='subscription_user_start_idx'),
+            models.Index(fields=['user', 'renewal_period'], name='subscription_user_renewal_idx'),
+            models.Index(F('user'), Lower('name'), name='subscription_user_name_idx'),  # Sorting by name
+            models.Index(fields=['user', 'next_billing_date'], name='subscription_user_next_idx'),
+            models.Index(fields=['user', 'cost'], name='subscription_user_cost_idx'),
+        ]
+
+
+class RenewalOccurrence(models.Model):
+    """
+    A single renewal of a subscription, pre-computed over a rolling horizon.
+
+    Rows are kept in step with their subscription by Subscription.save() and
+    the horizon is moved forward by the roll_renewal_occurrences command.
+    """
+    subscription = models.ForeignKey(Subscription, on_delete=models.CASCADE, related_name='renewal_occurrences')
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='renewal_occurrences',
+    )
+    date = models.DateField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3)
+
+    @classmethod
+    def for_subscription(cls, subscription, renewal_date):
+        """
+        Build an unsaved occurrence of a subscription on a renewal date.
+        """
+        return cls(
+            subscription=subscription,
+            user_id=subscription.user_id,
+            date=renewal_date,
+            amount=subscription.cost,
+            currency=subscription.currency
+        )
+
+    @classmethod
+    def materialize(cls, subscriptions, first_date=None, last_date=None):
+        """
+        Insert the occurrences of subscriptions that were saved without save(),
+        e.g. by bulk_create(), skipping occurrences that already exist.
+
+        Args:
+            subscriptions: Saved Subscription objects
+            first_date: First date to expand from (default: start of the horizon)
+            last_date: Last date to expand to (default: end of the horizon)
+
+        Returns:
+            The number of occurrences expanded
+        """
+        from .utils import get_occurrence_horizon, occurrences_between
+
+        horizon_first, horizon_last = get_occurrence_horizon()
+        occurrences = [
+            cls.for_subscription(subscription, renewal_date)
+            for subscription, renewal_date in occurrences_between(
+                [subscription for subscription in subscriptions if subscription.user_id is not None],
+                first_date or horizon_first,
+                last_date or horizon_last
+            )
+        ]
+        cls.objects.bulk_create(occurrences, batch_size=1000, ignore_conflicts=True)
+        return len(occurrences)
+
+    def __str__(self):
+        return f"{self.subscription.name} on {self.date}"
+
+    class Meta:
+        unique_together = ['subscription', 'date']  # One occurrence per subscription per day
+        indexes = [
+            models.Index(fields=['user', 'date']),
+        ]
+
+
+class RenewalOccurrenceHorizon(models.Model):
+    """
+    The last date the roll_renewal_occurrences command expanded renewals to.
+
+    There is only ever one row. The next roll expands from this date, so days
+    are filled in even when nightly runs were missed.
+    """
+    last_date = models.DateField()
+    rolled_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def get_last_date(cls):
+        """
+        Get the end of the last roll, or None if the horizon was never rolled.
+        """
+        return cls.objects.filter(pk=1).values_list('last_date', flat=True).first()
+
+    @classmethod
+    def set_last_date(cls, last_date):
+        """
+        Record the end of a roll.
+        """
+        cls.objects.update_or_create(pk=1, defaults={'last_date': last_date})
+
+    def __str__(self):
+        return f"Renewal occurrences rolled to {self.last_date}"
+
+
+class FullTextMatch(models.Lookup):
+    """
+    The FTS5 MATCH operator, e.g. filter(document__match='"netf"*').
+    """
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', (*lhs_params, *rhs_params)
+
+
+class SubscriptionSearch(models.Model):
+    """
+    A subscription's row in the full-text search table.
+
+    The table is an FTS5 virtual table, created and kept in step with
+    Subscription by triggers rather than by Django, and only exists on
+    SQLite builds with FTS5; see search.py. Filter on document__match and
+    read rank in the same query, which is how FTS5 gives a match's bm25
+    score.
+    """
+    subscription = models.OneToOneField(
+        Subscription,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        related_name='search_entry',
+    )
+    name = models.TextField()
+    notes = models.TextField()
+    url = models.TextField()
+    category = models.TextField()
+    user_id = models.TextField()
+    # FTS5's hidden columns: the table itself, for MATCH, and the match's rank
+    document = models.TextField(db_column='subscriptions_subscription_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'subscriptions_subscription_fts'
+
+
+SubscriptionSearch._meta.get_field('document').register_lookup(FullTextMatch)
+
+
+class ExchangeRateSnapshot(models.Model):
+    """
+    The latest exchange rates into a base currency, as fetched from the rates API.
+
+    Rates are stored as the value of one unit of each currency in the base
+    currency, which is what the overview page multiplies costs by.
+    """
+    base_currency = models.CharField(max_length=3, unique=True)
+    rates = models.JSONField()
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.base_currency} rates at {self.fetched_at}"
+
+
+class UserDataVersion(models.Model):
+    """
+    A counter that goes up every time a user's subscriptions, categories or
+    currencies change.
+
+    Cache keys for pages built from a user's data include the version, so a
+    change makes every cached entry for that user unreachable at once.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='data_version',
+    )
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user} data version {self.version}"
+
+
+class StagedImport(models.Model):
+    """
+    One row of an uploaded CSV file, staged between the import preview and
+    the user confirming the import.
+
+    The rows of an upload share an import_id. They are deleted once the
+    import is confirmed, and the purge_staged_imports command deletes rows
+    of imports that were never confirmed.
+    """
+    KIND_CHOICES = [
+        ('subscriptions', 'Subscriptions'),
+        ('categories', 'Categories'),
+        ('currencies', 'Currencies'),
+    ]
+
+    import_id = models.UUIDField()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='staged_imports',
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    row_number = models.PositiveIntegerField()
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['import_id', 'row_number']
+        constraints = [
+            models.UniqueConstraint(fields=['import_id', 'row_number'], name='unique_staged_import_row'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='staged_import_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Row {self.row_number} of {self.kind} import {self.import_id}"
+
+
+class JobResultStorage(FileSystemStorage):
+    """
+    Storage for the files produced by background jobs, in JOB_RESULT_DIR
+    rather than with the static and media files, so they are only served
+    through the job download view.
+    """
+
+    @property
+    def base_location(self):
+        return settings.JOB_RESULT_DIR
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+def job_result_storage():
+    return JobResultStorage()
+
+
+class Job(models.Model):
+    """
+    A background import or export, queued by a request and run by the
+    run_jobs worker so large files don't tie up a web worker.
+    """
+    KIND_CHOICES = [
+        ('import_subscriptions', 'Import subscriptions'),
+        ('import_categories', 'Import categories'),
+        ('import_currencies', 'Import currencies'),
+        ('export_subscriptions', 'Export subscriptions'),
+        ('restore_backup', 'Restore backup'),
+    ]
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='jobs',
+    )
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    payload = models.JSONField(default=dict, blank=True)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    result_file = models.FileField(upload_to='jobs/', storage=job_result_storage, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)  # Times a worker has claimed the job
+    worker = models.CharField(max_length=100, blank=True)  # Host and process ID of the worker running the job
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # When the worker last showed it was still running
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_status_created_idx'),
+        ]
+
+    def is_finished(self):
+        """
+        Check if the job has succeeded or failed.
+        """
+        return self.status in ('succeeded', 'failed')
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.user} ({self.get_status_display()})"
@@ -1,13 +1,17 @@
 from django.views.generic import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from .models import Subscription, Category, Currency
-import requests
-import json
+from .exchange_rates import get_exchange_rates
+from .conditional import conditional_on_data
+from django.utils.decorators import method_decorator
 from decimal import Decimal
 from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 
 
+@method_decorator(conditional_on_data(
+    extra_etag=lambda request: sorted(get_exchange_rates().items())
+), name='get')
 class OverviewView(LoginRequiredMixin, TemplateView):
     template_name = 'subscriptions/overview.html'
 
@@ -29,62 +33,18 @@ class OverviewView(LoginRequiredMixin, TemplateView):
         context['selected_year'] = selected_year
         context['current_year'] = current_year
 
-        # Get all subscriptions for the current user
-        subscriptions = Subscription.objects.filter(user=self.request.user)
+        # Get all subscriptions for the current user, with their categories
+        subscriptions = Subscription.objects.filter(user=self.request.user).select_related('category')
 
-        # Get active subscriptions for cost calculations
-        active_subscriptions = [s for s in subscriptions if not (hasattr(s, 'status') and s.status == 'cancelled')]
+        # Get the names of the current user's categories
+        category_names = Category.objects.filter(user=self.request.user).order_by('pk').values_list('name', flat=True)
 
         # Get exchange rates from API
         exchange_rates = self.get_exchange_rates()
 
-        # Calculate spending by category
-        category_spending = self.calculate_category_spending(active_subscriptions, exchange_rates)
-        context['category_spending'] = category_spending
-
-        # Calculate spending by currency
-        currency_spending = self.calculate_currency_spending(active_subscriptions, exchange_rates)
-        context['currency_spending'] = currency_spending
-
-        # Calculate spending by subscription
-        subscription_spending = self.calculate_subscription_spending(active_subscriptions, exchange_rates)
-        context['subscription_spending'] = subscription_spending
-
-        # Calculate annual cost totals and grand total in GBP
-        annual_cost_totals = {}
-        grand_total_gbp = Decimal('0.0')
-
-        for subscription in active_subscriptions:
-            currency = subscription.currency
-            annual_cost = self.calculate_annual_cost(subscription)
-
-            # Initialize currency if not present
-            if currency not in annual_cost_totals:
-                annual_cost_totals[currency] = {
-                    'original_cost': Decimal('0.0'),
-                    'symbol': subscription.get_currency_symbol(),
-                    'gbp_cost': Decimal('0.0')
-                }
-
-            # Add to totals
-            annual_cost_totals[currency]['original_cost'] += annual_cost
-
-            # Convert to GBP and add to GBP total
-            gbp_rate = exchange_rates.get(currency, 1.0)
-            gbp_cost = annual_cost * Decimal(str(gbp_rate))
-            annual_cost_totals[currency]['gbp_cost'] += gbp_cost
-            grand_total_gbp += gbp_cost
-
-        context['annual_cost_totals'] = annual_cost_totals
-        context['grand_total_gbp'] = grand_total_gbp
-
-        # Calculate monthly billed costs for bar graph (only subscriptions billed in that month)
-        monthly_billed_costs = self.calculate_monthly_billed_costs(subscriptions, exchange_rates, selected_year)
-        context['monthly_billed_costs'] = monthly_billed_costs
-
-        # Calculate monthly costs for bar graph (all active subscriptions)
-        monthly_costs = self.calculate_monthly_costs(active_subscriptions, exchange_rates, selected_year)
-        context['monthly_costs'] = monthly_costs
+        # Calculate spending by category, currency and subscription, annual
+        # totals and the monthly bar graphs in a single pass
+        context.update(self.aggregate_spending(subscriptions, category_names, exchange_rates, selected_year))
 
         # Add exchange rates to context
         context['exchange_rates'] = exchange_rates
@@ -95,337 +55,211 @@ class OverviewView(LoginRequiredMixin, TemplateView):
         return context
 
     def get_exchange_rates(self):
-        """Get exchange rates from an online API"""
-        try:
-            # Using ExchangeRate-API (free tier)
-            response = requests.get('https://open.er-api.com/v6/latest/GBP')
-            data = response.json()
-
-            if data['result'] == 'success':
-                rates = data['rates']
-                # Invert rates to get conversion to GBP
-                gbp_rates = {}
-                for currency, rate in rates.items():
-                    gbp_rates[currency] = 1 / rate if rate > 0 else 0
-
-                return gbp_rates
-            else:
-                # Fallback to hardcoded rates if API fails
-                return {
-                    'GBP': 1.0,
-                    'USD': 0.75,
-                    'EUR': 0.85
-                }
-        except Exception as e:
-            # Fallback to hardcoded rates if API fails
-            return {
-                'GBP': 1.0,
-                'USD': 0.75,
-                'EUR': 0.85
-            }
-
-    def calculate_category_spending(self, subscriptions, exchange_rates):
-        """Calculate spending by category with conversion to GBP"""
-        # Initialize with all categories from the database
-        category_spending = {}
-        for category in Category.objects.all():
-            category_spending[category.name] = {
-                'original_cost': 0,
-                'original_currency': 'GBP',  # Default currency
-                'gbp_cost': 0
-            }
+        """Get exchange rates from the stored snapshot, without waiting on the rates API"""
+        return get_exchange_rates()
+
+    def aggregate_spending(self, subscriptions, category_names, exchange_rates, year=None):
+        """
+        Calculate every spending breakdown shown on the overview in one pass.
+
+        Annual cost, monthly cost and their GBP conversions are worked out once
+        per subscription and added to each breakdown. Cancelled subscriptions
+        only count towards the monthly billed costs, up to their cancellation.
+
+        Args:
+            subscriptions: The user's subscriptions, including cancelled ones,
+                with their categories selected
+            category_names: Names of the user's categories, all shown even if unused
+            exchange_rates: Dictionary mapping currency codes to their value in GBP
+            year: The year to calculate the monthly graphs for (default: current year)
+
+        Returns:
+            A dictionary with category_spending, currency_spending,
+            subscription_spending, annual_cost_totals, grand_total_gbp,
+            monthly_billed_costs and monthly_costs
+        """
+        # Use current year if not specified
+        if year is None:
+            year = date.today().year
 
-        # Add 'Uncategorized' category
-        if 'Uncategorized' not in category_spending:
-            category_spending['Uncategorized'] = {
+        # Initialize with all of the user's categories, plus 'Uncategorized'
+        category_spending = {}
+        for category_name in [*category_names, 'Uncategorized']:
+            category_spending.setdefault(category_name, {
                 'original_cost': 0,
                 'original_currency': 'GBP',  # Default currency
                 'gbp_cost': 0
-            }
-
-        # Calculate spending for each subscription
-        for subscription in subscriptions:
-            category_name = subscription.category.name if subscription.category else 'Uncategorized'
-
-            # Calculate annual cost
-            annual_cost = self.calculate_annual_cost(subscription)
-
-            # Convert to GBP
-            gbp_rate = exchange_rates.get(subscription.currency, 1.0)
-            gbp_cost = annual_cost * Decimal(str(gbp_rate))
+            })
 
-            # Update category total
-            category_spending[category_name]['original_cost'] += annual_cost
-            category_spending[category_name]['original_currency'] = subscription.currency
-            category_spending[category_name]['gbp_cost'] += gbp_cost
+        currency_spending = {}
+        subscription_spending = []
+        annual_cost_totals = {}
+        grand_total_gbp = Decimal('0.0')
 
-        return category_spending
+        # Initialize both monthly graphs for all 12 months of the specified year
+        month_keys = []
+        monthly_billed_costs = {}
+        monthly_costs = {}
+        for month in range(1, 13):
+            month_date = date(year, month, 1)
+            month_key = month_date.strftime('%Y-%m')
+            month_keys.append(month_key)
+            for monthly in (monthly_billed_costs, monthly_costs):
+                monthly[month_key] = {
+                    'name': month_date.strftime('%b %Y'),
+                    'original_costs': {},
+                    'gbp_cost': 0,
+                    'subscriptions': []  # Store subscription details for tooltip
+                }
 
-    def calculate_currency_spending(self, subscriptions, exchange_rates):
-        """Calculate spending by currency with conversion to GBP"""
-        currency_spending = {}
+        # Conversion rates and symbols only need looking up once per currency
+        gbp_rates = {}
+        symbols = {}
 
         for subscription in subscriptions:
             currency = subscription.currency
+            if currency not in gbp_rates:
+                gbp_rates[currency] = Decimal(str(exchange_rates.get(currency, 1.0)))
+                symbols[currency] = subscription.get_currency_symbol()
+            gbp_rate = gbp_rates[currency]
+            symbol = symbols[currency]
+            cost = subscription.cost
+
+            # Monthly billed costs include cancelled subscriptions
+            billed_months = self.billed_months(subscription, year)
+            if billed_months:
+                gbp_full_cost = cost * gbp_rate
+                for month in billed_months:
+                    month_data = monthly_billed_costs[month_keys[month - 1]]
+                    month_data['original_costs'][currency] = month_data['original_costs'].get(currency, 0) + cost
+                    month_data['gbp_cost'] += gbp_full_cost
+                    month_data['subscriptions'].append({
+                        'name': subscription.name,
+                        'cost': cost,
+                        'currency': currency,
+                        'symbol': symbol,
+                        'gbp_cost': gbp_full_cost
+                    })
+
+            # Everything else only counts active subscriptions
+            if subscription.status == 'cancelled':
+                continue
 
-            # Calculate annual cost
-            annual_cost = self.calculate_annual_cost(subscription)
+            annual_cost = subscription.annual_cost
+            gbp_cost = annual_cost * gbp_rate
+            category_name = subscription.category.name if subscription.category else 'Uncategorized'
 
-            # Convert to GBP
-            gbp_rate = exchange_rates.get(currency, 1.0)
-            gbp_cost = annual_cost * Decimal(str(gbp_rate))
+            # Update category total
+            category_totals = category_spending.setdefault(category_name, {'original_cost': 0, 'gbp_cost': 0})
+            category_totals['original_cost'] += annual_cost
+            category_totals['original_currency'] = currency
+            category_totals['gbp_cost'] += gbp_cost
 
             # Add to currency total
             if currency not in currency_spending:
                 currency_spending[currency] = {
                     'original_cost': 0,
                     'gbp_cost': 0,
-                    'symbol': subscription.get_currency_symbol()
+                    'symbol': symbol
+                }
+                annual_cost_totals[currency] = {
+                    'original_cost': Decimal('0.0'),
+                    'symbol': symbol,
+                    'gbp_cost': Decimal('0.0')
                 }
-
             currency_spending[currency]['original_cost'] += annual_cost
             currency_spending[currency]['gbp_cost'] += gbp_cost
+            annual_cost_totals[currency]['original_cost'] += annual_cost
+            annual_cost_totals[currency]['gbp_cost'] += gbp_cost
+            grand_total_gbp += gbp_cost
 
-        return currency_spending
-
-    def calculate_monthly_billed_costs(self, subscriptions, exchange_rates, year=None):
-        """Calculate monthly costs for bar graph for a specific year, only including subscriptions billed in that month"""
-        # Use current year if not specified
-        if year is None:
-            year = date.today().year
-
-        # Initialize monthly costs for all 12 months of the specified year
-        monthly_billed_costs = {}
-
-        for month in range(1, 13):
-            month_date = date(year, month, 1)
-            month_key = month_date.strftime('%Y-%m')
-            month_name = month_date.strftime('%b %Y')
-
-            monthly_billed_costs[month_key] = {
-                'name': month_name,
-                'original_costs': {},
-                'gbp_cost': 0,
-                'date': month_date,  # Store the actual date for comparison
-                'subscriptions': []  # Store subscription details for tooltip
-            }
-
-        # Calculate costs for each subscription
-        for subscription in subscriptions:
-            currency = subscription.currency
-            cost = subscription.cost
-            start_date = subscription.start_date
-            name = subscription.name
-            renewal_period = subscription.renewal_period
+            # Add to subscription spending list
+            subscription_spending.append({
+                'name': subscription.name,
+                'category': category_name,
+                'annual_cost': annual_cost,
+                'currency': currency,
+                'symbol': symbol,
+                'renewal_period': subscription.get_renewal_period_display(),
+                'gbp_cost': gbp_cost
+            })
 
-            # Skip if subscription starts after the end of the year
-            if start_date.year > year:
+            # Add the monthly cost to every month from the subscription start date
+            if subscription.start_date.year > year:
                 continue
-
-            # Determine billing months based on renewal period and start date
-            billing_months = []
-
-            if renewal_period == 'weekly':
-                # For weekly, bill every month (approximation)
-                billing_months = list(range(1, 13))
-            elif renewal_period == 'monthly':
-                # For monthly, bill on the same day each month
-                billing_months = list(range(1, 13))
-            elif renewal_period == 'quarterly':
-                # For quarterly, bill every 3 months from start date
-                start_month = start_date.month
-                for i in range(4):  # 4 quarters in a year
-                    month = ((start_month - 1 + i * 3) % 12) + 1
-                    if start_date.year < year or (start_date.year == year and start_month <= month):
-                        billing_months.append(month)
-            elif renewal_period == 'yearly':
-                # For yearly, bill once a year on the start month
-                if start_date.year < year or start_date.year == year:
-                    billing_months.append(start_date.month)
-            elif renewal_period == 'biennial':
-                # For biennial, bill every 2 years on the start month
-                if start_date.year < year and (year - start_date.year) % 2 == 0:
-                    billing_months.append(start_date.month)
-                elif start_date.year == year:
-                    billing_months.append(start_date.month)
-
-            # Calculate full cost (not monthly cost)
-            full_cost = subscription.cost
-
-            # Convert to GBP
-            gbp_rate = exchange_rates.get(currency, 1.0)
-            gbp_full_cost = full_cost * Decimal(str(gbp_rate))
-
-            # Add to monthly costs only for billing months
-            for month in billing_months:
-                month_date = date(year, month, 1)
-                month_key = month_date.strftime('%Y-%m')
-
-                # Skip if month is before subscription start date
-                if month_date.replace(day=1) < start_date.replace(day=1):
-                    continue
-
-                # Skip if subscription is cancelled and month is after cancellation date
-                if hasattr(subscription, 'status') and subscription.status == 'cancelled' and subscription.cancellation_date:
-                    if month_date.replace(day=1) > subscription.cancellation_date.replace(day=1):
-                        continue
-
-                # Initialize currency if not present
-                if currency not in monthly_billed_costs[month_key]['original_costs']:
-                    monthly_billed_costs[month_key]['original_costs'][currency] = 0
-
-                # Add costs for this month
-                monthly_billed_costs[month_key]['original_costs'][currency] += full_cost
-                monthly_billed_costs[month_key]['gbp_cost'] += gbp_full_cost
-
-                # Add subscription details for tooltip
-                monthly_billed_costs[month_key]['subscriptions'].append({
-                    'name': name,
-                    'cost': full_cost,
-                    'currency': currency,
-                    'symbol': subscription.get_currency_symbol(),
-                    'gbp_cost': gbp_full_cost
-                })
-
-        # Remove the date field as it's not needed in the template
-        for month_data in monthly_billed_costs.values():
-            del month_data['date']
-
-        return monthly_billed_costs
-
-    def calculate_monthly_costs(self, subscriptions, exchange_rates, year=None):
-        """Calculate monthly costs for bar graph for a specific year, including all active subscriptions"""
-        # Use current year if not specified
-        if year is None:
-            year = date.today().year
-
-        # Initialize monthly costs for all 12 months of the specified year
-        monthly_costs = {}
-
-        for month in range(1, 13):
-            month_date = date(year, month, 1)
-            month_key = month_date.strftime('%Y-%m')
-            month_name = month_date.strftime('%b %Y')
-
-            monthly_costs[month_key] = {
-                'name': month_name,
-                'original_costs': {},
-                'gbp_cost': 0,
-                'date': month_date,  # Store the actual date for comparison
-                'subscriptions': []  # Store subscription details for tooltip
-            }
-
-        # Calculate costs for each subscription
-        for subscription in subscriptions:
-            currency = subscription.currency
-            cost = subscription.cost
-            start_date = subscription.start_date
-            name = subscription.name
-
-            # Calculate monthly cost based on renewal period
-            monthly_cost = self.calculate_monthly_cost(subscription)
-
-            # Convert to GBP
-            gbp_rate = exchange_rates.get(currency, 1.0)
-            gbp_monthly_cost = monthly_cost * Decimal(str(gbp_rate))
-
-            # Add to monthly costs only for months after the subscription start date
-            for month_key, month_data in monthly_costs.items():
-                # Skip months before the subscription start date
-                if month_data['date'].replace(day=1) < start_date.replace(day=1):
-                    continue
-
-                # Skip if subscription is cancelled and month is after cancellation date
-                if hasattr(subscription, 'status') and subscription.status == 'cancelled' and subscription.cancellation_date:
-                    if month_data['date'].replace(day=1) > subscription.cancellation_date.replace(day=1):
-                        continue
-
-                # Initialize currency if not present
-                if currency not in month_data['original_costs']:
-                    month_data['original_costs'][currency] = 0
-
-                # Add costs for this month
-                month_data['original_costs'][currency] += monthly_cost
+            first_month = subscription.start_date.month if subscription.start_date.year == year else 1
+            monthly_cost = subscription.monthly_cost
+            gbp_monthly_cost = monthly_cost * gbp_rate
+            for month_key in month_keys[first_month - 1:]:
+                month_data = monthly_costs[month_key]
+                month_data['original_costs'][currency] = month_data['original_costs'].get(currency, 0) + monthly_cost
                 month_data['gbp_cost'] += gbp_monthly_cost
-
-                # Add subscription details for tooltip
                 month_data['subscriptions'].append({
-                    'name': name,
+                    'name': subscription.name,
                     'cost': monthly_cost,
                     'currency': currency,
-                    'symbol': subscription.get_currency_symbol(),
+                    'symbol': symbol,
                     'gbp_cost': gbp_monthly_cost
                 })
 
-        # Remove the date field as it's not needed in the template
-        for month_data in monthly_costs.values():
-            del month_data['date']
-
-        return monthly_costs
-
-    def calculate_annual_cost(self, subscription):
-        """Calculate annual cost based on renewal period"""
-        cost = subscription.cost
-
-        if subscription.renewal_period == 'weekly':
-            return cost * 52  # 52 weeks in a year
-        elif subscription.renewal_period == 'monthly':
-            return cost * 12  # 12 months in a year
-        elif subscription.renewal_period == 'quarterly':
-            return cost * 4   # 4 quarters in a year
-        elif subscription.renewal_period == 'biennial':
-            return cost / 2   # Half the cost per year
-        else:  # yearly
-            return cost
-
-    def calculate_monthly_cost(self, subscription):
-        """Calculate monthly cost based on renewal period"""
-        cost = subscription.cost
-
-        if subscription.renewal_period == 'weekly':
-            return cost * 52 / 12  # 52 weeks / 12 months
-        elif subscription.renewal_period == 'monthly':
-            return cost
-        elif subscription.renewal_period == 'quarterly':
-            return cost / 3  # 1 quarter = 3 months
-        elif subscription.renewal_period == 'yearly':
-            return cost / 12  # 1 year = 12 months
-        elif subscription.renewal_period == 'biennial':
-            return cost / 24  # 2 years = 24 months
-        else:
-            return cost  # Default to the cost as is
-
-    def calculate_subscription_spending(self, subscriptions, exchange_rates):
-        """Calculate spending by subscription with conversion to GBP"""
-        subscription_spending = []
-
-        for subscription in subscriptions:
-            # Get subscription details
-            name = subscription.name
-            category = subscription.category.name if subscription.category else 'Uncategorized'
-            currency = subscription.currency
-            symbol = subscription.get_currency_symbol()
-            renewal_period = subscription.get_renewal_period_display()
-
-            # Calculate annual cost
-            annual_cost = self.calculate_annual_cost(subscription)
+        # Sort by GBP cost (highest first)
+        subscription_spending.sort(key=lambda x: x['gbp_cost'], reverse=True)
 
-            # Convert to GBP
-            gbp_rate = exchange_rates.get(currency, 1.0)
-            gbp_cost = annual_cost * Decimal(str(gbp_rate))
+        return {
+            'category_spending': category_spending,
+            'currency_spending': currency_spending,
+            'subscription_spending': subscription_spending,
+            'annual_cost_totals': annual_cost_totals,
+            'grand_total_gbp': grand_total_gbp,
+            'monthly_billed_costs': monthly_billed_costs,
+            'monthly_costs': monthly_costs,
+        }
+
+    def billed_months(self, subscription, year):
+        """
+        Get the months of a year in which a subscription is billed.
+
+        Weekly and monthly subscriptions are billed every month. Months before
+        the subscription started, or after it was cancelled, are left out.
+
+        Args:
+            subscription: The subscription to check
+            year: The year to check
+
+        Returns:
+            A sorted list of month numbers (1-12)
+        """
+        start_date = subscription.start_date
+        renewal_period = subscription.renewal_period
+
+        # Skip if subscription starts after the end of the year
+        if start_date.year > year:
+            return []
+
+        if renewal_period in ('weekly', 'monthly'):
+            # Bill every month (approximation for weekly)
+            months = range(1, 13)
+        elif renewal_period == 'quarterly':
+            # Bill every 3 months from the start month
+            months = sorted(((start_date.month - 1 + i * 3) % 12) + 1 for i in range(4))
+        elif renewal_period == 'yearly':
+            # Bill once a year on the start month
+            months = [start_date.month]
+        elif renewal_period == 'biennial' and (year - start_date.year) % 2 == 0:
+            # Bill every 2 years on the start month
+            months = [start_date.month]
+        else:
+            return []
 
-            # Add to subscription spending list
-            subscription_spending.append({
-                'name': name,
-                'category': category,
-                'annual_cost': annual_cost,
-                'currency': currency,
-                'symbol': symbol,
-                'renewal_period': renewal_period,
-                'gbp_cost': gbp_cost
-            })
+        # Skip months before the subscription start date
+        first_month = start_date.month if start_date.year == year else 1
 
-        # Sort by GBP cost (highest first)
-        subscription_spending.sort(key=lambda x: x['gbp_cost'], reverse=True)
+        # Skip months after the cancellation date of cancelled subscriptions
+        last_month = 12
+        if subscription.status == 'cancelled' and subscription.cancellation_date:
+            if subscription.cancellation_date.year < year:
+                return []
+            if subscription.cancellation_date.year == year:
+                last_month = subscription.cancellation_date.month
 
-        return subscription_spending
+        return [month for month in months if first_month <= month <= last_month]
@@ -0,0 +1,173 @@
+"""
+Keyset pagination, for lists too long to page through with OFFSET.
+
+A page ends with a cursor holding the sort value and primary key of its
+last row, and the next page is the rows that sort after it. With an index
+on the sort key the database seeks straight to the cursor instead of
+stepping over every earlier row, so the hundredth page of a long list
+costs the same as the first.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+def encode_cursor(value, pk):
+    """
+    Encode a row's sort value and primary key as an opaque, URL-safe cursor.
+    """
+    data = json.dumps([value, pk], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by encode_cursor().
+
+    Returns:
+        A tuple of (sort value, primary key); dates and decimals come back as strings
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor.')
+    if not isinstance(data, list) or len(data) != 2 or type(data[1]) is not int:
+        raise ValueError('Invalid cursor.')
+    return data[0], data[1]
+
+
+class KeysetPage:
+    """
+    One page of a keyset-paginated list, with cursors for the pages either side.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Page through a queryset in the order of one sort key, with the primary
+    key breaking ties.
+
+    Rows whose sort key is NULL always come last, in primary key order.
+    They're read with a query of their own once the other rows run out, as
+    an OR across both would stop the database seeking to the cursor.
+
+    Args:
+        queryset: The rows to page through
+        key: Expression to sort by, e.g. F('cost') or Lower('name')
+        per_page: Number of rows on each page
+        descending: Whether to sort from the highest value down
+        nullable: Whether the sort key can be NULL
+    """
+
+    def __init__(self, queryset, key, per_page, descending=False, nullable=False):
+        self.queryset = queryset.annotate(keyset_value=key)
+        self.per_page = per_page
+        self.descending = descending
+        self.nullable = nullable
+
+    def page(self, after=None, before=None):
+        """
+        Get the page of rows after one cursor, or before another, or the first page.
+
+        Raises:
+            ValueError: If a cursor is malformed or doesn't suit the sort key
+        """
+        try:
+            if before:
+                rows = self._walk(decode_cursor(before), backwards=True, limit=self.per_page + 1)
+                has_previous = len(rows) > self.per_page
+                rows = rows[:self.per_page][::-1]
+                has_next = bool(rows) and bool(self._walk(self._key(rows[-1]), backwards=False, limit=1))
+            else:
+                cursor = decode_cursor(after) if after else None
+                rows = self._walk(cursor, backwards=False, limit=self.per_page + 1)
+                has_next = len(rows) > self.per_page
+                rows = rows[:self.per_page]
+                has_previous = bool(rows) and cursor is not None and bool(
+                    self._walk(self._key(rows[0]), backwards=True, limit=1)
+                )
+        except (ValidationError, TypeError):
+            # Raised when filtering on a cursor value the sort field can't hold
+            raise ValueError('Invalid cursor.')
+
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(*self._key(rows[-1])) if has_next else None,
+            previous_cursor=encode_cursor(*self._key(rows[0])) if has_previous else None,
+        )
+
+    def _key(self, row):
+        return row.keyset_value, row.pk
+
+    def _walk(self, cursor, backwards, limit):
+        """
+        Read up to limit rows from the cursor on, in sort order or against it.
+        """
+        # Rows with a value come before the NULLs, so walking backwards starts with the NULLs
+        segments = [False, True] if self.nullable else [None]
+        if backwards:
+            segments.reverse()
+        if cursor is not None and self.nullable:
+            segments = segments[segments.index(cursor[0] is None):]
+
+        descending = self.descending != backwards
+        rows = []
+        for is_null in segments:
+            queryset = self.queryset
+            if is_null is not None:
+                queryset = queryset.filter(keyset_value__isnull=is_null)
+
+            # Only the segment the cursor is in starts part way through
+            if cursor is not None and is_null == segments[0]:
+                queryset = self._after(queryset, cursor, descending)
+
+            if descending:
+                queryset = queryset.order_by('-keyset_value', '-pk')
+            else:
+                queryset = queryset.order_by('keyset_value', 'pk')
+
+            rows += queryset[:limit - len(rows)]
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def _after(self, queryset, cursor, descending):
+        """
+        Filter the rows of one segment to those that sort after the cursor.
+        """
+        value, pk = cursor
+        lookup = 'lt' if descending else 'gt'
+        if value is None:
+            return queryset.filter(**{f'pk__{lookup}': pk})
+
+        # The inclusive bound lets the database seek to the cursor, the OR only sorts out its ties
+        return queryset.filter(**{f'keyset_value__{lookup}e': value}).filter(
+            Q(**{f'keyset_value__{lookup}': value}) | Q(**{f'pk__{lookup}': pk})
+        )
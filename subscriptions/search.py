@@ -0,0 +1,101 @@
+"""
+Full-text search of subscriptions.
+
+On SQLite, an FTS5 table mirrors each subscription's name, notes, URL and
+category name, kept up to date by triggers (see migration 0025), so rows
+written with bulk_create() or update() are indexed too. Searches join it
+through the SubscriptionSearch model and are ranked with bm25, weighting
+matches in the name above the category, URL and notes. Every word matches
+as a prefix, so "netf" finds Netflix.
+
+The table also indexes each row's owner, and searches match it along with
+the words, so FTS5 intersects them in the index instead of finding every
+user's matches first. Other databases fall back to case-insensitive
+substring filters, which scan the user's subscriptions.
+"""
+import re
+
+from django.db import connection
+from django.db.models import F, Q
+
+SEARCH_TABLE = 'subscriptions_subscription_fts'
+
+# Columns the user's words are matched against
+SEARCH_COLUMNS = ['name', 'notes', 'url', 'category']
+
+# Searches with more words than this only use the first ones
+MAX_SEARCH_WORDS = 10
+
+_available = {}
+
+
+def search_words(query):
+    """
+    Split a search query into the words it matches.
+    """
+    return re.findall(r'\w+', query or '')[:MAX_SEARCH_WORDS]
+
+
+def fts_available():
+    """
+    Check whether the database has the FTS5 search table.
+
+    The migration only creates it on SQLite builds with FTS5, so this is
+    checked once per database.
+    """
+    key = connection.settings_dict['NAME']
+    if key not in _available:
+        _available[key] = connection.vendor == 'sqlite' and SEARCH_TABLE in connection.introspection.table_names()
+    return _available[key]
+
+
+def match_expression(words, user=None):
+    """
+    Build an FTS5 MATCH expression finding rows with every word as a prefix.
+
+    Each word is quoted, so nothing the user types is read as FTS5 syntax.
+
+    Args:
+        words: Words from search_words()
+        user: Optional user whose subscriptions are searched
+
+    Returns:
+        The MATCH expression string
+    """
+    terms = ' '.join(f'"{word}"*' for word in words)
+    expression = f'{{{" ".join(SEARCH_COLUMNS)}}}: ({terms})'
+    if user is not None:
+        expression = f'user_id: "{user.pk}" AND {expression}'
+    return expression
+
+
+def search_subscriptions(queryset, query, user=None):
+    """
+    Filter subscriptions to those matching a search query.
+
+    Args:
+        queryset: The subscriptions to search
+        query: What the user typed
+        user: Optional owner of every subscription in queryset, which lets
+            the search table skip other users' rows
+
+    Returns:
+        A tuple of (filtered queryset, relevance expression), where the
+        expression sorts the best matches first, or None on databases
+        without full-text search
+    """
+    words = search_words(query)
+    if not words:
+        return queryset, None
+
+    if not fts_available():
+        for word in words:
+            queryset = queryset.filter(
+                Q(name__icontains=word) | Q(notes__icontains=word) | Q(url__icontains=word)
+                | Q(category__name__icontains=word)
+            )
+        return queryset, None
+
+    # Join each subscription to its row of the search table, whose rank is the match's bm25 score
+    queryset = queryset.filter(search_entry__document__match=match_expression(words, user))
+    return queryset, F('search_entry__rank')
@@ -0,0 +1,26 @@
+"""
+Signal handlers for the subscriptions app.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Currency, Subscription
+from .versioning import bump_data_version
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Currency)
+@receiver(post_delete, sender=Subscription)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Currency)
+def bump_owner_data_version(sender, instance, **kwargs):
+    """
+    Signal handler to invalidate the owner's cached pages when their data changes.
+
+    Args:
+        sender: The model class that sent the signal
+        instance: The instance that was saved or deleted
+        **kwargs: Additional keyword arguments
+    """
+    bump_data_version(instance.user_id)
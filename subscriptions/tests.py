@@ -1,12 +1,53 @@
 from django.test import TestCase, Client
 from django.urls import reverse, resolve
 from django.utils import timezone
-from django.core.exceptions import ValidationError
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.conf import settings
 from django.contrib.messages import get_messages
-from subscriptions.models import Category, Currency, Subscription
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.db.models.functions import Lower
+from subscriptions.models import (
+    Category, Currency, Subscription, RenewalOccurrence, RenewalOccurrenceHorizon, ExchangeRateSnapshot, UserDataVersion, StagedImport, Job,
+    subscription_fingerprint, job_result_storage
+)
+from subscriptions import exchange_rates
+from subscriptions.versioning import get_data_version, bump_data_version, bulk_data_change, user_cache_key
 from subscriptions import views
-from subscriptions.utils import calculate_next_renewal_date, is_renewal_date
+from subscriptions import calendar_cache
+from subscriptions import backup
+from subscriptions import importers
+from subscriptions import jobs
+from subscriptions import versioning
+from subscriptions import pagination
+from subscriptions.search import search_subscriptions
+from subscriptions.overview import OverviewView
+from SubCal.sqlite.base import DatabaseWrapper as SqliteDatabaseWrapper
+from subscriptions.utils import (
+    calculate_next_renewal_date, is_renewal_date, get_next_billing_date,
+    next_renewal_on_or_after, renewal_dates_between, is_renewal_on, occurrences_between,
+    batch_renewal_dates, subscription_columns, get_occurrence_horizon, renewal_occurrences
+)
+from subscriptions import utils
+from unittest import mock, skipIf
+import requests
+import random
+import re
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from datetime import date, datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from decimal import Decimal
 import calendar
 
 
@@ -492,6 +533,7 @@ class CalendarViewTest(TestCase):
 
     def setUp(self):
         """Set up test data."""
+        cache.clear()
         self.client = Client()
         self.url = reverse('subscription-calendar')
         self.category = Category.objects.create(name="Entertainment")
@@ -1088,6 +1130,2302 @@ class UtilsTest(TestCase):
         ))
 
 
+class RecurrenceEngineTest(TestCase):
+    """Tests for the closed-form recurrence engine."""
+
+    def test_weekly_subscription_started_long_ago(self):
+        """Test that weekly renewals are found without stepping from the start date."""
+        start_date = date(2015, 1, 5)  # A Monday
+        self.assertEqual(next_renewal_on_or_after(start_date, 'weekly', date(2025, 6, 1)), date(2025, 6, 2))
+        self.assertTrue(is_renewal_on(start_date, 'weekly', date(2025, 6, 2)))
+        self.assertFalse(is_renewal_on(start_date, 'weekly', date(2025, 6, 3)))
+
+    def test_end_of_month_clamping(self):
+        """Test that clamped renewals return to the anchor day in longer months."""
+        renewal_dates = renewal_dates_between(date(2023, 1, 31), 'monthly', date(2023, 1, 1), date(2023, 5, 31))
+        self.assertEqual(renewal_dates, [
+            date(2023, 1, 31),
+            date(2023, 2, 28),
+            date(2023, 3, 31),
+            date(2023, 4, 30),
+            date(2023, 5, 31),
+        ])
+
+    def test_next_renewal_on_or_after(self):
+        """Test next_renewal_on_or_after for each renewal period."""
+        start_date = date(2023, 1, 31)
+        self.assertEqual(next_renewal_on_or_after(start_date, 'monthly', date(2023, 2, 1)), date(2023, 2, 28))
+        self.assertEqual(next_renewal_on_or_after(start_date, 'quarterly', date(2023, 5, 1)), date(2023, 7, 31))
+        self.assertEqual(next_renewal_on_or_after(start_date, 'yearly', date(2023, 2, 1)), date(2024, 1, 31))
+        self.assertEqual(next_renewal_on_or_after(start_date, 'biennial', date(2023, 2, 1)), date(2025, 1, 31))
+
+        # A renewal on the given date is returned as-is
+        self.assertEqual(next_renewal_on_or_after(start_date, 'quarterly', date(2023, 4, 30)), date(2023, 4, 30))
+
+        # Dates before the start date return the start date
+        self.assertEqual(next_renewal_on_or_after(start_date, 'monthly', date(2022, 6, 1)), start_date)
+
+        # Unknown renewal periods have no renewals
+        self.assertIsNone(next_renewal_on_or_after(start_date, 'daily', date(2023, 2, 1)))
+
+    def test_operations_agree(self):
+        """Test that range, membership and next-renewal queries agree day by day."""
+        first_date = date(2023, 12, 1)
+        last_date = date(2025, 3, 31)
+        for renewal_period, _ in Subscription.RENEWAL_CHOICES:
+            for start_date in [date(2020, 2, 29), date(2023, 1, 31), date(2024, 12, 15)]:
+                renewal_dates = renewal_dates_between(start_date, renewal_period, first_date, last_date)
+
+                current_date = first_date
+                expected = []
+                while current_date <= last_date:
+                    if is_renewal_on(start_date, renewal_period, current_date):
+                        expected.append(current_date)
+                    current_date += timedelta(days=1)
+
+                self.assertEqual(renewal_dates, expected, f"{renewal_period} from {start_date}")
+                for renewal_date, following_date in zip(renewal_dates, renewal_dates[1:]):
+                    self.assertEqual(
+                        next_renewal_on_or_after(start_date, renewal_period, renewal_date + timedelta(days=1)),
+                        following_date
+                    )
+
+    def test_get_next_billing_date(self):
+        """Test get_next_billing_date uses the recurrence engine."""
+        subscription = Subscription(
+            name="Quarterly",
+            cost=29.99,
+            currency="USD",
+            renewal_period="quarterly",
+            start_date=date(2015, 11, 30)
+        )
+        with mock.patch('subscriptions.utils.date') as mock_date:
+            mock_date.today.return_value = date(2025, 3, 1)
+            mock_date.side_effect = lambda *args, **kwargs: date(*args, **kwargs)
+            self.assertEqual(get_next_billing_date(subscription), date(2025, 5, 30))
+
+            # Cancelled subscriptions have no next billing date after cancellation
+            subscription.status = 'cancelled'
+            subscription.cancellation_date = date(2025, 2, 1)
+            self.assertIsNone(get_next_billing_date(subscription))
+
+
+class OccurrencesBetweenTest(TestCase):
+    """Tests for the occurrences_between generator."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.weekly = Subscription(name="Weekly", cost=1, renewal_period="weekly", start_date=date(2024, 1, 3))
+        self.monthly = Subscription(name="Monthly", cost=10, renewal_period="monthly", start_date=date(2023, 5, 31))
+        self.yearly = Subscription(name="Yearly", cost=100, renewal_period="yearly", start_date=date(2020, 2, 10))
+
+    def test_yields_pairs_in_date_order(self):
+        """Test that renewals from all subscriptions are merged in date order."""
+        occurrences = list(occurrences_between(
+            [self.yearly, self.monthly, self.weekly], date(2024, 2, 1), date(2024, 2, 29)
+        ))
+        self.assertEqual(occurrences, [
+            (self.weekly, date(2024, 2, 7)),
+            (self.yearly, date(2024, 2, 10)),
+            (self.weekly, date(2024, 2, 14)),
+            (self.weekly, date(2024, 2, 21)),
+            (self.weekly, date(2024, 2, 28)),
+            (self.monthly, date(2024, 2, 29)),
+        ])
+
+    def test_first_only(self):
+        """Test that first_only yields a single renewal per subscription."""
+        occurrences = list(occurrences_between(
+            [self.weekly, self.monthly], date(2024, 2, 1), date(2024, 3, 31), first_only=True
+        ))
+        self.assertEqual(occurrences, [
+            (self.weekly, date(2024, 2, 7)),
+            (self.monthly, date(2024, 2, 29)),
+        ])
+
+    def test_cancelled_subscription_stops_at_cancellation_date(self):
+        """Test that no renewals are yielded after the cancellation date."""
+        self.weekly.status = 'cancelled'
+        self.weekly.cancellation_date = date(2024, 2, 14)
+        occurrences = list(occurrences_between([self.weekly], date(2024, 2, 1), date(2024, 2, 29)))
+        self.assertEqual([renewal_date for _, renewal_date in occurrences], [date(2024, 2, 7), date(2024, 2, 14)])
+
+
+@skipIf(utils.np is None, "NumPy is not installed")
+class BatchRenewalDatesTest(TestCase):
+    """Differential tests for the NumPy batch renewal expansion."""
+
+    def setUp(self):
+        """Set up randomized subscriptions."""
+        rng = random.Random(20240229)
+        renewal_periods = [choice for choice, _ in Subscription.RENEWAL_CHOICES]
+        self.subscriptions = []
+        for index in range(600):
+            subscription = Subscription(
+                name=f"Subscription {index}",
+                cost=1,
+                renewal_period=rng.choice(renewal_periods),
+                start_date=date(2012, 1, 1) + timedelta(days=rng.randrange(5000))
+            )
+            if rng.random() < 0.2:
+                subscription.status = 'cancelled'
+                subscription.cancellation_date = subscription.start_date + timedelta(days=rng.randrange(2000))
+            self.subscriptions.append(subscription)
+
+        self.ranges = [
+            (date(2024, 1, 1), date(2024, 12, 31)),
+            (date(2024, 2, 1), date(2024, 2, 29)),
+            (date(2023, 2, 1), date(2023, 2, 28)),
+            (date(2011, 6, 1), date(2013, 6, 30)),
+            (date(2025, 3, 31), date(2025, 3, 31)),
+        ]
+
+    def test_matches_scalar_functions(self):
+        """Test that batch_renewal_dates matches renewal_dates_between for every subscription."""
+        columns = subscription_columns(self.subscriptions)
+        for first_date, last_date in self.ranges:
+            indices, dates = batch_renewal_dates(
+                columns['start_dates'], columns['period_codes'], columns['anchor_days'], first_date, last_date
+            )
+            batch = {}
+            for index, renewal_date in zip(indices.tolist(), dates.astype(object)):
+                batch.setdefault(index, []).append(renewal_date)
+
+            for index, subscription in enumerate(self.subscriptions):
+                expected = renewal_dates_between(
+                    subscription.start_date, subscription.renewal_period, first_date, last_date
+                )
+                self.assertEqual(batch.get(index, []), expected, f"{subscription.renewal_period} from {subscription.start_date}")
+
+    def test_occurrences_between_batch_path(self):
+        """Test that occurrences_between gives the same result with and without the batch path."""
+        for first_date, last_date in self.ranges:
+            with mock.patch('subscriptions.utils.BATCH_RENEWAL_THRESHOLD', len(self.subscriptions) + 1):
+                scalar = list(occurrences_between(self.subscriptions, first_date, last_date))
+            with mock.patch('subscriptions.utils.BATCH_RENEWAL_THRESHOLD', 1):
+                batch = list(occurrences_between(self.subscriptions, first_date, last_date))
+            self.assertEqual(batch, scalar)
+
+
+class UpcomingRenewalsViewTest(TestCase):
+    """Tests for the upcoming renewals window on the home page."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        today = datetime.now().date()
+        self.soon = Subscription.objects.create(
+            name="Soon", cost=5, currency="USD", renewal_period="yearly",
+            start_date=today + timedelta(days=3), user=self.user
+        )
+        self.later = Subscription.objects.create(
+            name="Later", cost=5, currency="USD", renewal_period="yearly",
+            start_date=today + timedelta(days=20), user=self.user
+        )
+
+    def test_default_window(self):
+        """Test that the home page looks two weeks ahead by default."""
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['upcoming_days'], 14)
+        upcoming = [item['subscription'] for item in response.context['upcoming_subscriptions']]
+        self.assertEqual(upcoming, [self.soon])
+
+    def test_configurable_window(self):
+        """Test that a longer window includes later renewals."""
+        response = self.client.get(reverse('home'), {'days': 30})
+        self.assertEqual(response.context['upcoming_days'], 30)
+        upcoming = [item['subscription'] for item in response.context['upcoming_subscriptions']]
+        self.assertEqual(upcoming, [self.soon, self.later])
+
+    def test_invalid_window_falls_back_to_default(self):
+        """Test that unsupported windows fall back to two weeks."""
+        for days in ['365', 'abc']:
+            response = self.client.get(reverse('home'), {'days': days})
+            self.assertEqual(response.context['upcoming_days'], 14)
+
+
+class RenewalOccurrenceTest(TestCase):
+    """Tests for the materialized RenewalOccurrence table."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.today = date.today()
+        self.subscription = Subscription.objects.create(
+            name="Netflix",
+            cost=9.99,
+            currency="USD",
+            renewal_period="monthly",
+            start_date=self.today - timedelta(days=400),
+            user=self.user
+        )
+        RenewalOccurrenceHorizon.set_last_date(get_occurrence_horizon()[1])
+
+    def expected_dates(self, subscription):
+        first_date, last_date = get_occurrence_horizon()
+        return renewal_dates_between(subscription.start_date, subscription.renewal_period, first_date, last_date)
+
+    def stored_dates(self, subscription):
+        return list(subscription.renewal_occurrences.order_by('date').values_list('date', flat=True))
+
+    def test_save_materializes_horizon(self):
+        """Test that saving a subscription stores its renewals over the horizon."""
+        self.assertEqual(self.stored_dates(self.subscription), self.expected_dates(self.subscription))
+        occurrence = self.subscription.renewal_occurrences.first()
+        self.assertEqual(occurrence.user, self.user)
+        self.assertEqual(occurrence.currency, "USD")
+
+    def test_save_updates_changed_fields(self):
+        """Test that changing the schedule and cost updates the stored occurrences."""
+        self.subscription.renewal_period = 'quarterly'
+        self.subscription.cost = 25
+        self.subscription.save()
+        self.assertEqual(self.stored_dates(self.subscription), self.expected_dates(self.subscription))
+        self.assertFalse(self.subscription.renewal_occurrences.exclude(amount=25).exists())
+
+    def test_cancel_and_reactivate(self):
+        """Test that cancelling drops later renewals and reactivating restores them."""
+        self.subscription.cancel()
+        self.assertFalse(self.subscription.renewal_occurrences.filter(date__gt=self.today).exists())
+        self.assertTrue(self.subscription.renewal_occurrences.filter(date__lte=self.today).exists())
+
+        self.subscription.reactivate()
+        self.assertEqual(self.stored_dates(self.subscription), self.expected_dates(self.subscription))
+
+    def test_delete_removes_occurrences(self):
+        """Test that deleting a subscription deletes its occurrences."""
+        self.subscription.delete()
+        self.assertFalse(RenewalOccurrence.objects.exists())
+
+    def test_renewal_occurrences_query_count(self):
+        """Test that ranges inside the horizon are answered with a fixed number of queries."""
+        first_date = self.today
+        last_date = self.today + timedelta(days=60)
+        with self.assertNumQueries(3):  # horizon, occurrences, subscriptions
+            renewals = renewal_occurrences(self.user, first_date, last_date)
+        self.assertEqual(
+            [renewal_date for _, renewal_date in renewals],
+            renewal_dates_between(self.subscription.start_date, 'monthly', first_date, last_date)
+        )
+
+    def test_renewal_occurrences_outside_horizon(self):
+        """Test that ranges outside the horizon fall back to computing renewals."""
+        first_date = self.today + timedelta(days=365 * 10)
+        last_date = first_date + timedelta(days=60)
+        renewals = renewal_occurrences(self.user, first_date, last_date)
+        self.assertEqual(
+            [renewal_date for _, renewal_date in renewals],
+            renewal_dates_between(self.subscription.start_date, 'monthly', first_date, last_date)
+        )
+
+    def test_renewal_occurrences_before_roll(self):
+        """Test that renewals are computed while the table hasn't been rolled up to the range."""
+        first_date = self.today
+        last_date = self.today + timedelta(days=60)
+        expected = renewal_dates_between(self.subscription.start_date, 'monthly', first_date, last_date)
+        RenewalOccurrence.objects.all().delete()
+
+        for rolled_to in [None, self.today + timedelta(days=30)]:
+            with self.subTest(rolled_to=rolled_to):
+                RenewalOccurrenceHorizon.objects.all().delete()
+                if rolled_to:
+                    RenewalOccurrenceHorizon.set_last_date(rolled_to)
+                renewals = renewal_occurrences(self.user, first_date, last_date)
+                self.assertEqual([renewal_date for _, renewal_date in renewals], expected)
+
+    def test_calendar_and_day_views(self):
+        """Test that the calendar and day views read renewals from the table."""
+        self.client.login(username='testuser', password='testpass123')
+        renewal_date = next_renewal_on_or_after(self.subscription.start_date, 'monthly', self.today)
+
+        response = self.client.get(reverse('subscription-calendar'), {'month': renewal_date.month, 'year': renewal_date.year})
+        self.assertIn(self.subscription, response.context['calendar_data'][renewal_date.day])
+
+        response = self.client.get(reverse('subscription-day', args=[renewal_date.year, renewal_date.month, renewal_date.day]))
+        self.assertEqual(response.context['subscriptions'], [self.subscription])
+
+    def test_roll_command(self):
+        """Test that the roll command drops expired rows and restores missing ones."""
+        RenewalOccurrence.objects.create(
+            subscription=self.subscription, user=self.user, date=date(2000, 1, 1), amount=1, currency="USD"
+        )
+        RenewalOccurrence.objects.filter(date__gt=self.today).delete()
+
+        call_command('roll_renewal_occurrences', '--full', stdout=io.StringIO())
+        self.assertEqual(self.stored_dates(self.subscription), self.expected_dates(self.subscription))
+
+    def test_roll_after_missed_days(self):
+        """Test that a roll fills in every day since the previous one, not only the last week."""
+        _, last_date = get_occurrence_horizon()
+        rolled_to = last_date - timedelta(days=60)
+        RenewalOccurrenceHorizon.set_last_date(rolled_to)
+        RenewalOccurrence.objects.filter(date__gt=rolled_to).delete()
+
+        call_command('roll_renewal_occurrences', stdout=io.StringIO())
+        self.assertEqual(self.stored_dates(self.subscription), self.expected_dates(self.subscription))
+        self.assertEqual(RenewalOccurrenceHorizon.get_last_date(), last_date)
+
+    def test_first_roll_expands_whole_horizon(self):
+        """Test that without a previous roll the whole horizon is expanded."""
+        RenewalOccurrenceHorizon.objects.all().delete()
+        RenewalOccurrence.objects.all().delete()
+        call_command('roll_renewal_occurrences', stdout=io.StringIO())
+        self.assertEqual(self.stored_dates(self.subscription), self.expected_dates(self.subscription))
+
+
+class YearCalendarViewTest(TestCase):
+    """Tests for the year view of the calendar."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.year = date.today().year
+        self.quarterly = Subscription.objects.create(
+            name="Quarterly", cost=30, currency="USD", renewal_period="quarterly",
+            start_date=date(self.year - 1, 1, 31), user=self.user
+        )
+        self.weekly = Subscription.objects.create(
+            name="Weekly", cost=3, currency="USD", renewal_period="weekly",
+            start_date=date(self.year - 1, 12, 29), user=self.user
+        )
+
+    def test_renewals_bucketed_by_month_and_day(self):
+        """Test that every renewal of the year lands in its month and day cell."""
+        response = self.client.get(reverse('subscription-calendar'), {'view_type': 'year', 'year': self.year})
+        year_calendar = response.context['year_calendar']
+        self.assertEqual([month_data['month_num'] for month_data in year_calendar], list(range(1, 13)))
+
+        for month_data in year_calendar:
+            month_num = month_data['month_num']
+            last_day = calendar.monthrange(self.year, month_num)[1]
+            self.assertEqual(sorted(month_data['calendar_data']), list(range(1, last_day + 1)))
+            for subscription in [self.quarterly, self.weekly]:
+                expected = calculate_next_renewal_date(subscription.start_date, subscription.renewal_period, self.year, month_num)
+                actual = [
+                    day for day, entries in month_data['calendar_data'].items()
+                    if subscription in entries
+                ]
+                self.assertEqual(actual, [renewal_date.day for renewal_date in expected])
+
+    def test_query_count_does_not_depend_on_months(self):
+        """Test that the year view expands renewals with a fixed number of queries."""
+        url = reverse('subscription-calendar')
+        self.client.get(url, {'view_type': 'year', 'year': self.year})
+        cache.clear()
+        with self.assertNumQueries(5):  # session, user, validators, data version, subscriptions
+            self.client.get(url, {'view_type': 'year', 'year': self.year})
+        with self.assertNumQueries(4):  # session, user, validators, data version
+            self.client.get(url, {'view_type': 'year', 'year': self.year})
+
+
+class CalendarEntryTest(TestCase):
+    """Tests for the calendar cell entries."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.subscription = Subscription.objects.create(
+            name="Spotify", cost=10.99, currency="EUR", renewal_period="monthly",
+            start_date=date.today().replace(day=1), user=self.user
+        )
+
+    def test_entry_carries_rendered_fields_only(self):
+        """Test that entries are slotted and compare equal to their subscription."""
+        entry = calendar_cache.CalendarEntry(self.subscription, is_past=True)
+        self.assertFalse(hasattr(entry, '__dict__'))
+        self.assertEqual(entry.pk, self.subscription.pk)
+        self.assertEqual(entry.symbol, "€")
+        self.assertEqual(entry.renewal_period_display, "Monthly")
+        self.assertTrue(entry.is_past)
+        self.assertEqual(entry, self.subscription)
+
+    def test_month_view_renders_entries(self):
+        """Test that the month view renders the entry fields."""
+        response = self.client.get(reverse('subscription-calendar'))
+        entries = response.context['calendar_data'][1]
+        self.assertIsInstance(entries[0], calendar_cache.CalendarEntry)
+        self.assertContains(response, reverse('subscription-detail', args=[self.subscription.pk]))
+        self.assertContains(response, "€10.99 (Monthly)")
+
+
+class StubRatesHandler(BaseHTTPRequestHandler):
+    """A stub of the exchange rate API that serves a configurable payload."""
+
+    payload = {}
+    delay = 0
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        body = json.dumps(self.payload).encode('utf-8')
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up waiting
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ExchangeRateTest(TestCase):
+    """Tests for the stored exchange rates, run against a local stub of the rates API."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubRatesHandler)
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.api_url = f'http://127.0.0.1:{cls.server.server_port}/v6/latest/GBP'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        """Point the rates API at the stub server and start from an empty cache."""
+        StubRatesHandler.payload = {'result': 'success', 'rates': {'GBP': 1, 'USD': 1.25, 'EUR': 1.2}}
+        StubRatesHandler.delay = 0
+        settings_override = override_settings(
+            EXCHANGE_RATE_API_URL=self.api_url,
+            EXCHANGE_RATE_TIMEOUT=0.5,
+            EXCHANGE_RATE_BACKGROUND_REFRESH=False
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        exchange_rates.clear_cache()
+        self.addCleanup(exchange_rates.clear_cache)
+
+    def test_refresh_stores_inverted_rates(self):
+        """Test that refreshing stores the value of each currency in GBP."""
+        snapshot = exchange_rates.refresh_exchange_rates()
+        self.assertEqual(snapshot.base_currency, 'GBP')
+        rates = exchange_rates.get_exchange_rates()
+        self.assertEqual(rates['GBP'], 1.0)
+        self.assertAlmostEqual(rates['USD'], 0.8)
+        self.assertEqual(ExchangeRateSnapshot.objects.count(), 1)
+
+    def test_cold_start_uses_fallback_without_network(self):
+        """Test that reading rates with no snapshot returns the fallback seed."""
+        with mock.patch('subscriptions.exchange_rates.requests.get', side_effect=AssertionError("network used")):
+            self.assertEqual(exchange_rates.get_exchange_rates(), exchange_rates.FALLBACK_EXCHANGE_RATES)
+
+    def test_failed_refresh_keeps_previous_snapshot(self):
+        """Test that an unsuccessful API result doesn't replace stored rates."""
+        exchange_rates.refresh_exchange_rates()
+        StubRatesHandler.payload = {'result': 'error'}
+        with self.assertRaises(ValueError):
+            exchange_rates.refresh_exchange_rates()
+        exchange_rates.clear_cache()
+        self.assertAlmostEqual(exchange_rates.get_exchange_rates()['USD'], 0.8)
+
+    def test_slow_api_times_out(self):
+        """Test that a slow API fails after the configured timeout instead of hanging."""
+        StubRatesHandler.delay = 2
+        started = time.monotonic()
+        with self.assertRaises(requests.RequestException):
+            exchange_rates.refresh_exchange_rates()
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_stale_rates_start_background_refresh(self):
+        """Test that only stale rates trigger a background refresh."""
+        exchange_rates.refresh_exchange_rates()
+        with override_settings(EXCHANGE_RATE_BACKGROUND_REFRESH=True), \
+                mock.patch('subscriptions.exchange_rates.start_background_refresh') as start_refresh:
+            exchange_rates.get_exchange_rates()
+            start_refresh.assert_not_called()
+
+            ExchangeRateSnapshot.objects.update(fetched_at=timezone.now() - timedelta(days=2))
+            exchange_rates.clear_cache()
+            exchange_rates.get_exchange_rates()
+            start_refresh.assert_called_once()
+
+    def test_background_refresh_is_rate_limited(self):
+        """Test that at most one background refresh is attempted per cache period."""
+        with mock.patch('subscriptions.exchange_rates.refresh_exchange_rates') as refresh:
+            thread = exchange_rates.start_background_refresh()
+            thread.join()
+            self.assertIsNone(exchange_rates.start_background_refresh())
+        refresh.assert_called_once()
+
+    def test_overview_reads_stored_rates(self):
+        """Test that the overview page uses stored rates and makes no API request."""
+        exchange_rates.refresh_exchange_rates()
+        exchange_rates.clear_cache()
+        User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        with mock.patch('subscriptions.exchange_rates.requests.get', side_effect=AssertionError("network used")):
+            response = self.client.get(reverse('overview'))
+        self.assertAlmostEqual(response.context['exchange_rates']['USD'], 0.8)
+
+    def test_refresh_command(self):
+        """Test the refresh_exchange_rates management command."""
+        out = io.StringIO()
+        call_command('refresh_exchange_rates', stdout=out)
+        self.assertIn('Stored 3 GBP exchange rates', out.getvalue())
+
+
+@override_settings(EXCHANGE_RATE_BACKGROUND_REFRESH=False)
+class OverviewAggregationTest(TestCase):
+    """Tests for the single-pass overview aggregation."""
+
+    def setUp(self):
+        """Set up test data."""
+        exchange_rates.clear_cache()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.rates = {'GBP': 1.0, 'USD': 0.5, 'EUR': 0.8}
+        food = Category.objects.get(user=self.user, name='Food')
+        self.monthly = Subscription.objects.create(
+            name='Netflix', category=food, cost=Decimal('10.00'), currency='USD',
+            renewal_period='monthly', start_date=date(2025, 3, 15), user=self.user
+        )
+        self.quarterly = Subscription.objects.create(
+            name='Magazine', cost=Decimal('30.00'), currency='GBP',
+            renewal_period='quarterly', start_date=date(2024, 11, 1), user=self.user
+        )
+        self.biennial = Subscription.objects.create(
+            name='Domain', cost=Decimal('48.00'), currency='EUR',
+            renewal_period='biennial', start_date=date(2023, 6, 1), user=self.user
+        )
+        self.cancelled = Subscription.objects.create(
+            name='Gym', cost=Decimal('20.00'), currency='GBP', renewal_period='monthly',
+            start_date=date(2024, 1, 1), status='cancelled', cancellation_date=date(2025, 4, 10),
+            user=self.user
+        )
+
+    def aggregate(self, year=2025):
+        subscriptions = Subscription.objects.filter(user=self.user)
+        category_names = Category.objects.filter(user=self.user).values_list('name', flat=True)
+        return OverviewView().aggregate_spending(subscriptions, category_names, self.rates, year)
+
+    def billed_names(self, year):
+        return [[s['name'] for s in month['subscriptions']] for month in self.aggregate(year)['monthly_billed_costs'].values()]
+
+    def test_annual_breakdowns(self):
+        """Test the category, currency and subscription breakdowns of annual costs."""
+        result = self.aggregate()
+        self.assertEqual(result['category_spending']['Food']['original_cost'], Decimal('120.00'))
+        self.assertEqual(result['category_spending']['Food']['gbp_cost'], Decimal('60.00'))
+        self.assertEqual(result['category_spending']['Uncategorized']['original_cost'], Decimal('144.00'))
+        self.assertEqual(result['currency_spending']['GBP']['original_cost'], Decimal('120.00'))
+        self.assertEqual(result['annual_cost_totals']['EUR']['gbp_cost'], Decimal('19.20'))
+        self.assertEqual(result['grand_total_gbp'], Decimal('199.20'))
+        self.assertEqual([s['name'] for s in result['subscription_spending']], ['Magazine', 'Netflix', 'Domain'])
+
+    def test_cancelled_subscriptions_only_billed(self):
+        """Test that cancelled subscriptions are billed up to their cancellation month only."""
+        result = self.aggregate()
+        self.assertNotIn('Gym', [s['name'] for s in result['subscription_spending']])
+        billed = {key: [s['name'] for s in month['subscriptions']] for key, month in result['monthly_billed_costs'].items()}
+        self.assertIn('Gym', billed['2025-04'])
+        self.assertNotIn('Gym', billed['2025-05'])
+        costs = {key: [s['name'] for s in month['subscriptions']] for key, month in result['monthly_costs'].items()}
+        self.assertNotIn('Gym', costs['2025-01'])
+
+    def test_monthly_billed_costs(self):
+        """Test the months each renewal period is billed in."""
+        result = self.aggregate()
+        billed = {key: [s['name'] for s in month['subscriptions']] for key, month in result['monthly_billed_costs'].items()}
+        self.assertNotIn('Netflix', billed['2025-02'])
+        self.assertIn('Netflix', billed['2025-03'])
+        self.assertEqual([key for key, names in billed.items() if 'Magazine' in names],
+                         ['2025-02', '2025-05', '2025-08', '2025-11'])
+        self.assertEqual([key for key, names in billed.items() if 'Domain' in names], ['2025-06'])
+        self.assertFalse(any('Domain' in names for names in self.billed_names(2024)))
+        self.assertEqual(result['monthly_billed_costs']['2025-06']['gbp_cost'], Decimal('43.40'))
+
+    def test_monthly_costs(self):
+        """Test that monthly costs start from the subscription start month."""
+        result = self.aggregate()
+        self.assertEqual(result['monthly_costs']['2025-02']['original_costs'], {'GBP': Decimal('10.00'), 'EUR': Decimal('2.00')})
+        self.assertEqual(result['monthly_costs']['2025-03']['original_costs']['USD'], Decimal('10.00'))
+        self.assertEqual(result['monthly_costs']['2025-03']['gbp_cost'], Decimal('16.60'))
+
+    def test_overview_view_uses_aggregation(self):
+        """Test that the overview view puts every breakdown in its context."""
+        response = self.client.get(reverse('overview'), {'year': 2025})
+        self.assertEqual(response.status_code, 200)
+        for key in ['category_spending', 'currency_spending', 'subscription_spending', 'annual_cost_totals',
+                    'grand_total_gbp', 'monthly_billed_costs', 'monthly_costs']:
+            self.assertIn(key, response.context)
+        self.assertEqual(len(response.context['monthly_costs']), 12)
+
+    def test_overview_query_count(self):
+        """Test that the overview makes the same number of queries however many subscriptions there are."""
+        self.client.get(reverse('overview'))
+        with self.assertNumQueries(5):  # session, user, validators, categories, subscriptions
+            self.client.get(reverse('overview'))
+
+        petrol = Category.objects.get(user=self.user, name='Petrol')
+        for index in range(20):
+            Subscription.objects.create(
+                name=f'Extra {index}', category=petrol, cost=Decimal('5.00'), currency='GBP',
+                renewal_period='monthly', start_date=date(2024, 1, 1), user=self.user
+            )
+        with self.assertNumQueries(5):  # session, user, validators, categories, subscriptions
+            self.client.get(reverse('overview'))
+
+    def test_overview_only_shows_own_categories(self):
+        """Test that other users' categories aren't included in the category spending."""
+        other_user = User.objects.create_user(username='otheruser', password='testpass123')
+        Category.objects.create(name='Other Category', user=other_user)
+        response = self.client.get(reverse('overview'))
+        self.assertNotIn('Other Category', response.context['category_spending'])
+        self.assertIn('Petrol', response.context['category_spending'])
+        self.assertIn('Uncategorized', response.context['category_spending'])
+
+
+class NormalizedCostTest(TestCase):
+    """Tests for the annual and monthly cost annotations."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        food = Category.objects.get(user=self.user, name='Food')
+        for name, period, cost, currency in [
+            ('Weekly', 'weekly', '10.00', 'GBP'),
+            ('Monthly', 'monthly', '10.00', 'GBP'),
+            ('Quarterly', 'quarterly', '10.00', 'USD'),
+            ('Yearly', 'yearly', '120.00', 'USD'),
+            ('Biennial', 'biennial', '15.00', 'EUR'),
+        ]:
+            Subscription.objects.create(
+                name=name, category=food if currency == 'GBP' else None, cost=Decimal(cost),
+                currency=currency, renewal_period=period, start_date=date(2024, 1, 1), user=self.user
+            )
+        Subscription.objects.create(
+            name='Cancelled', cost=Decimal('99.00'), currency='GBP', renewal_period='monthly',
+            start_date=date(2024, 1, 1), status='cancelled', cancellation_date=date(2024, 6, 1), user=self.user
+        )
+
+    def test_normalized_cost(self):
+        """Test the annual and monthly cost of each renewal period."""
+        costs = {s.name: (s.annual_cost, s.monthly_cost) for s in Subscription.objects.filter(user=self.user)}
+        self.assertEqual(costs['Weekly'], (Decimal('520'), Decimal('520') / 12))
+        self.assertEqual(costs['Monthly'], (Decimal('120'), Decimal('10')))
+        self.assertEqual(costs['Quarterly'], (Decimal('40'), Decimal('10') / 3))
+        self.assertEqual(costs['Yearly'], (Decimal('120'), Decimal('10')))
+        self.assertEqual(costs['Biennial'], (Decimal('7.5'), Decimal('0.625')))
+
+    def test_normalized_cost_matches_decimal_formulas(self):
+        """Test that normalized costs match the Decimal formulas the views used before, exactly."""
+        def old_annual_cost(cost, renewal_period):
+            if renewal_period == 'weekly':
+                return cost * 52
+            elif renewal_period == 'monthly':
+                return cost * 12
+            elif renewal_period == 'quarterly':
+                return cost * 4
+            elif renewal_period == 'biennial':
+                return cost / 2
+            return cost
+
+        def old_monthly_cost(cost, renewal_period):
+            if renewal_period == 'weekly':
+                return cost * 52 / 12
+            elif renewal_period == 'monthly':
+                return cost
+            elif renewal_period == 'quarterly':
+                return cost / 3
+            elif renewal_period == 'yearly':
+                return cost / 12
+            elif renewal_period == 'biennial':
+                return cost / 24
+            return cost
+
+        Subscription.objects.filter(user=self.user).delete()
+        costs = ['0.01', '0.07', '1.10', '9.99', '10.00', '12.34', '33.33', '99999999.99']
+        for cost in costs:
+            for period, _ in Subscription.RENEWAL_CHOICES:
+                Subscription.objects.create(
+                    name=f'{period} {cost}', cost=Decimal(cost), currency='GBP', renewal_period=period,
+                    start_date=date(2024, 1, 1), user=self.user
+                )
+
+        annual_total = monthly_total = Decimal('0')
+        for subscription in Subscription.objects.filter(user=self.user):
+            old_annual = old_annual_cost(subscription.cost, subscription.renewal_period)
+            old_monthly = old_monthly_cost(subscription.cost, subscription.renewal_period)
+            self.assertEqual(subscription.annual_cost, old_annual, subscription.name)
+            self.assertEqual(subscription.monthly_cost, old_monthly, subscription.name)
+            annual_total += old_annual
+            monthly_total += old_monthly
+
+        totals = Subscription.objects.filter(user=self.user).cost_totals('currency')
+        self.assertEqual(totals, [{'currency': 'GBP', 'annual_total': annual_total, 'monthly_total': monthly_total}])
+
+    def test_cost_totals(self):
+        """Test that cost totals are grouped from a single query."""
+        active = Subscription.objects.filter(user=self.user, status='active')
+        with self.assertNumQueries(1):
+            by_currency = {t['currency']: t['annual_total'] for t in active.cost_totals('currency')}
+        self.assertEqual(by_currency, {'EUR': Decimal('7.5'), 'GBP': Decimal('640'), 'USD': Decimal('160')})
+
+        by_category = {t['category__name']: t['monthly_total'] for t in active.cost_totals('category__name')}
+        self.assertEqual(by_category['Food'], Decimal('520') / 12 + Decimal('10'))
+        self.assertEqual(by_category[None], Decimal('10') / 3 + Decimal('10') + Decimal('0.625'))
+
+    def test_subscription_list_annual_totals(self):
+        """Test that the subscription list sums annual costs of active subscriptions by currency."""
+        response = self.client.get(reverse('subscription-list'))
+        annual_totals = response.context['annual_totals']
+        self.assertEqual(annual_totals['GBP'], {'total': Decimal('640'), 'symbol': '£'})
+        self.assertEqual(annual_totals['USD']['total'], Decimal('160'))
+
+    def test_profile_monthly_costs(self):
+        """Test that the profile page uses 52/12 weeks per month."""
+        response = self.client.get(reverse('profile'))
+        monthly_costs = response.context['user_profile'].total_monthly_cost
+        self.assertEqual(monthly_costs['GBP'], Decimal('520') / 12 + Decimal('10'))
+        self.assertEqual(monthly_costs['EUR'], Decimal('0.625'))
+
+
+class UserDataVersionTest(TestCase):
+    """Tests for the per-user data version counter."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other_user = User.objects.create_user(username='otheruser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.version = get_data_version(self.user)
+
+    def assertBumped(self, times=1):
+        self.assertEqual(get_data_version(self.user), self.version + times)
+        self.version += times
+
+    def test_subscription_changes_bump_version(self):
+        """Test that saving and deleting a subscription bumps the version."""
+        subscription = Subscription.objects.create(
+            name='Netflix', cost=Decimal('9.99'), renewal_period='monthly',
+            start_date=date(2024, 1, 1), user=self.user
+        )
+        self.assertBumped()
+        subscription.cancel()
+        self.assertBumped()
+        subscription.delete()
+        self.assertBumped()
+
+    def test_subscription_save_bumps_after_occurrences(self):
+        """Test that saving a subscription bumps the version after its occurrences are rewritten."""
+        subscription = Subscription.objects.create(
+            name='Netflix', cost=Decimal('9.99'), renewal_period='monthly',
+            start_date=date(2024, 1, 1), user=self.user
+        )
+        self.assertBumped()
+
+        amounts = []
+        bump = versioning.bump_data_version
+
+        def record_amounts(user_id):
+            amounts.append(set(subscription.renewal_occurrences.values_list('amount', flat=True)))
+            bump(user_id)
+
+        subscription.cost = Decimal('12.99')
+        with mock.patch('subscriptions.versioning.bump_data_version', side_effect=record_amounts):
+            subscription.save()
+        self.assertEqual(amounts, [{Decimal('12.99')}])
+        self.assertBumped()
+
+    def test_failed_subscription_save_rolls_back(self):
+        """Test that a save whose occurrences can't be written leaves the row and version unchanged."""
+        subscription = Subscription.objects.create(
+            name='Netflix', cost=Decimal('9.99'), renewal_period='monthly',
+            start_date=date(2024, 1, 1), user=self.user
+        )
+        self.assertBumped()
+
+        subscription.name = 'Disney+'
+        with mock.patch.object(Subscription, 'refresh_renewal_occurrences', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                subscription.save()
+        self.assertEqual(Subscription.objects.get(pk=subscription.pk).name, 'Netflix')
+        self.assertBumped(0)
+
+    def test_category_and_currency_changes_bump_version(self):
+        """Test that saving and deleting categories and currencies bumps the version."""
+        category = Category.objects.create(name='Streaming', user=self.user)
+        self.assertBumped()
+        category.delete()
+        self.assertBumped()
+        currency = Currency.objects.get(user=self.user, code='USD')
+        currency.name = 'Dollar'
+        currency.save()
+        self.assertBumped()
+
+    def test_other_users_version_unchanged(self):
+        """Test that changes only bump the owner's version."""
+        other_version = get_data_version(self.other_user)
+        Category.objects.create(name='Streaming', user=self.user)
+        self.assertEqual(get_data_version(self.other_user), other_version)
+
+    def test_bulk_data_change_bumps_once(self):
+        """Test that changes inside bulk_data_change bump each user's version once."""
+        with bulk_data_change():
+            for index in range(5):
+                Category.objects.create(name=f'Category {index}', user=self.user)
+            with bulk_data_change():
+                bump_data_version(self.user.pk)
+            self.assertEqual(get_data_version(self.user), self.version)
+        self.assertBumped()
+
+    def test_bump_without_version_row(self):
+        """Test that bumping a user who has never read their version writes nothing."""
+        UserDataVersion.objects.filter(user=self.user).delete()
+        bump_data_version(self.user.pk)
+        self.assertFalse(UserDataVersion.objects.filter(user=self.user).exists())
+        self.assertEqual(get_data_version(self.user), 0)
+
+    def test_import_bumps_version_once(self):
+        """Test that importing categories from CSV bumps the version once."""
+        import_id, _ = importers.stage_import(self.user, 'categories', [{'name': 'Imported 1'}, {'name': 'Imported 2'}])
+        self.client.post(reverse('import-categories-csv'), {'from_preview': '1', 'import_all': '1', 'import_id': import_id})
+        jobs.run_pending_jobs()
+        self.assertTrue(Category.objects.filter(user=self.user, name='Imported 2').exists())
+        self.assertBumped()
+
+    def test_user_cache_key(self):
+        """Test that cache keys change when the user's data changes."""
+        key = user_cache_key('calendar-month', self.user, 2025, 3)
+        self.assertEqual(key, f'calendar-month:{self.user.pk}:{self.version}:2025:3')
+        Category.objects.create(name='Streaming', user=self.user)
+        self.assertNotEqual(user_cache_key('calendar-month', self.user, 2025, 3), key)
+
+
+class CalendarCacheTest(TestCase):
+    """Tests for the cached calendar months."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.today = date(2025, 3, 10)
+        self.subscription = Subscription.objects.create(
+            name='Netflix', cost=Decimal('9.99'), currency='GBP', renewal_period='monthly',
+            start_date=date(2024, 1, 15), user=self.user
+        )
+
+    def test_month_cached_until_data_changes(self):
+        """Test that a month is built once and rebuilt after the user's data changes."""
+        data = calendar_cache.get_month_calendar_data(self.user, 2025, 3, self.today)
+        self.assertEqual(data[15], [self.subscription])
+        self.assertEqual(calendar_cache.calendar_cache_stats(), {'hits': 0, 'misses': 1, 'hit_rate': 0.0})
+
+        with self.assertNumQueries(1):  # data version
+            calendar_cache.get_month_calendar_data(self.user, 2025, 3, self.today)
+        self.assertEqual(calendar_cache.calendar_cache_stats()['hits'], 1)
+
+        self.subscription.start_date = date(2024, 1, 20)
+        self.subscription.save()
+        data = calendar_cache.get_month_calendar_data(self.user, 2025, 3, self.today)
+        self.assertEqual(data[15], [])
+        self.assertEqual(data[20], [self.subscription])
+
+    def test_month_rebuilt_next_day(self):
+        """Test that renewals move into the past when the day rolls over."""
+        data = calendar_cache.get_month_calendar_data(self.user, 2025, 3, date(2025, 3, 15))
+        self.assertFalse(data[15][0].is_past)
+        data = calendar_cache.get_month_calendar_data(self.user, 2025, 3, date(2025, 3, 16))
+        self.assertTrue(data[15][0].is_past)
+
+    def test_year_assembled_from_cached_months(self):
+        """Test that the year view reuses months cached by the month view and caches the rest."""
+        calendar_cache.get_month_calendar_data(self.user, 2025, 3, self.today)
+        calendar_cache.reset_calendar_cache_stats()
+
+        year_data = calendar_cache.get_year_calendar_data(self.user, 2025, self.today)
+        self.assertEqual(sorted(year_data), list(range(1, 13)))
+        self.assertEqual([month for month, days in year_data.items() if days[15]], list(range(1, 13)))
+        self.assertEqual(calendar_cache.calendar_cache_stats(), {'hits': 1, 'misses': 11, 'hit_rate': 8.3})
+
+        calendar_cache.get_year_calendar_data(self.user, 2025, self.today)
+        self.assertEqual(calendar_cache.calendar_cache_stats()['hits'], 13)
+
+    def test_cancelled_future_renewals_hidden(self):
+        """Test that cancelled subscriptions only show past renewals."""
+        self.subscription.cancel()
+        self.subscription.cancellation_date = date(2025, 6, 1)
+        self.subscription.save()
+        year_data = calendar_cache.get_year_calendar_data(self.user, 2025, self.today)
+        self.assertEqual(year_data[2][15], [self.subscription])
+        self.assertEqual(year_data[4][15], [])
+
+    def test_warm_calendar_cache_command(self):
+        """Test that the warm command caches the months around today for active users."""
+        out = io.StringIO()
+        call_command('warm_calendar_cache', stdout=out)
+        self.assertIn('Cached 7 calendar months for 1 users', out.getvalue())
+        self.assertEqual(calendar_cache.calendar_cache_stats()['misses'], 0)
+
+        today = date.today()
+        calendar_cache.get_month_calendar_data(self.user, today.year, today.month, today)
+        self.assertEqual(calendar_cache.calendar_cache_stats(), {'hits': 1, 'misses': 0, 'hit_rate': 100.0})
+
+
+@override_settings(EXCHANGE_RATE_BACKGROUND_REFRESH=False)
+class ConditionalGetTest(TestCase):
+    """Tests for ETag and Last-Modified handling on data pages."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        exchange_rates.clear_cache()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.subscription = Subscription.objects.create(
+            name='Netflix', cost=Decimal('9.99'), currency='GBP', renewal_period='monthly',
+            start_date=date(2024, 1, 15), user=self.user
+        )
+
+    def assertNotModified(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        with self.assertNumQueries(3):  # session, user, validators
+            response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_pages_answer_not_modified(self):
+        """Test that unchanged pages are answered with 304 Not Modified."""
+        self.assertNotModified(reverse('subscription-list'))
+        self.assertNotModified(reverse('subscription-calendar'), {'view_type': 'year', 'year': 2025})
+        self.assertNotModified(reverse('overview'))
+        self.assertNotModified(reverse('export-subscriptions-csv'))
+
+    def test_changes_give_new_etag(self):
+        """Test that editing or deleting a subscription changes the ETag."""
+        url = reverse('subscription-list')
+        etag = self.assertNotModified(url)
+
+        self.subscription.cost = Decimal('10.99')
+        self.subscription.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.subscription.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_depends_on_params_and_user(self):
+        """Test that ETags differ between request parameters and users."""
+        url = reverse('subscription-calendar')
+        month_etag = self.client.get(url, {'year': 2025, 'month': 3})['ETag']
+        self.assertNotEqual(self.client.get(url, {'year': 2025, 'month': 4})['ETag'], month_etag)
+
+        User.objects.create_user(username='otheruser', password='testpass123')
+        self.client.login(username='otheruser', password='testpass123')
+        self.assertEqual(self.client.get(url, {'year': 2025, 'month': 3}, HTTP_IF_NONE_MATCH=month_etag).status_code, 200)
+
+    def test_category_rename_changes_export(self):
+        """Test that renaming a category changes the subscription export's ETag."""
+        category = Category.objects.get(user=self.user, name='Food')
+        self.subscription.category = category
+        self.subscription.save()
+        url = reverse('export-subscriptions-csv')
+        etag = self.assertNotModified(url)
+        category.name = 'Groceries'
+        category.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_if_modified_since(self):
+        """Test that Last-Modified is honoured when no ETag is sent."""
+        url = reverse('subscription-list')
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def backdate_data_version(self):
+        """Move the last change back a minute, as Last-Modified only has whole seconds"""
+        get_data_version(self.user)
+        UserDataVersion.objects.filter(user=self.user).update(updated_at=timezone.now() - timedelta(minutes=1))
+
+    def test_category_delete_changes_pages(self):
+        """Test that deleting a category, which clears its subscriptions' category, is not answered with 304."""
+        category = Category.objects.get(user=self.user, name='Food')
+        self.subscription.category = category
+        self.subscription.save()
+        self.backdate_data_version()
+        urls = [reverse('overview'), reverse('export-subscriptions-csv')]
+        validators = [(url, self.assertNotModified(url), self.client.get(url)['Last-Modified']) for url in urls]
+
+        category.delete()
+        for url, etag, last_modified in validators:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_if_modified_since_after_delete(self):
+        """Test that deleting a subscription changes Last-Modified."""
+        self.backdate_data_version()
+        url = reverse('subscription-list')
+        last_modified = self.client.get(url)['Last-Modified']
+        self.subscription.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_new_category_changes_list(self):
+        """Test that adding a category changes the subscription list, which offers it as a filter."""
+        url = reverse('subscription-list')
+        etag = self.assertNotModified(url)
+        Category.objects.create(name='Streaming', user=self.user)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Streaming')
+
+
+class CsvExportTest(TestCase):
+    """Tests for the streaming CSV exports."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other_user = User.objects.create_user(username='otheruser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        food = Category.objects.get(user=self.user, name='Food')
+        Subscription.objects.create(
+            name='Netflix', category=food, cost=Decimal('9.99'), currency='GBP', renewal_period='monthly',
+            start_date=date(2024, 1, 15), url='https://netflix.com', user=self.user
+        )
+        Subscription.objects.create(
+            name='Gym', cost=Decimal('20.00'), currency='GBP', renewal_period='monthly',
+            start_date=date(2024, 1, 1), status='cancelled', cancellation_date=date(2024, 6, 1), user=self.user
+        )
+        Category.objects.create(name='Other Users Category', user=self.other_user)
+
+    def get_csv(self, url_name):
+        response = self.client.get(reverse(url_name))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        return b''.join(response.streaming_content).decode('utf-8').splitlines()
+
+    def test_export_subscriptions(self):
+        """Test that subscriptions are exported with their category names."""
+        lines = self.get_csv('export-subscriptions-csv')
+        self.assertEqual(lines[0], 'name,category,cost,currency,renewal_period,start_date,url,notes,status,cancellation_date')
+        self.assertEqual(lines[1], 'Gym,,20.00,GBP,monthly,2024-01-01,,,cancelled,2024-06-01')
+        self.assertEqual(lines[2], 'Netflix,Food,9.99,GBP,monthly,2024-01-15,https://netflix.com,,active,')
+
+    def test_export_query_count_is_fixed(self):
+        """Test that exports use the same number of queries however many rows there are."""
+        for index in range(20):
+            Subscription.objects.create(
+                name=f'Extra {index}', category=Category.objects.get(user=self.user, name='Petrol'),
+                cost=Decimal('5.00'), renewal_period='monthly', start_date=date(2024, 1, 1), user=self.user
+            )
+        get_data_version(self.user)  # Created by the user's first page view
+        with self.assertNumQueries(4):  # session, user, validators, rows
+            lines = self.get_csv('export-subscriptions-csv')
+        self.assertEqual(len(lines), 23)
+
+    def test_export_categories_and_currencies_for_user_only(self):
+        """Test that category and currency exports only include the user's own rows."""
+        categories = self.get_csv('export-categories-csv')
+        self.assertEqual(categories, ['name', 'Computer', 'Food', 'Mobile', 'Petrol', 'Shopping'])
+        currencies = self.get_csv('export-currencies-csv')
+        self.assertEqual(currencies, ['code,name,symbol,is_default', 'EUR,Euro,€,False', 'GBP,British Pound,£,True', 'USD,US Dollar,$,False'])
+
+    def test_export_requires_login(self):
+        """Test that anonymous users are redirected to log in."""
+        self.client.logout()
+        response = self.client.get(reverse('export-categories-csv'))
+        self.assertEqual(response.status_code, 302)
+
+
+class ImportEngineTest(TestCase):
+    """Tests for the bulk import engine."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other_user = User.objects.create_user(username='otheruser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+
+    def subscription_rows(self, count, category='Streaming', renewal_period='monthly'):
+        return [
+            (index + 1, {
+                'name': f'Subscription {index}', 'category': category, 'cost': '9.99', 'currency': 'GBP',
+                'renewal_period': renewal_period, 'start_date': '2024-01-15', 'url': '', 'notes': '',
+                'status': 'active', 'cancellation_date': None
+            })
+            for index in range(count)
+        ]
+
+    def test_import_subscriptions(self):
+        """Test that rows are imported with their fields, categories and renewal occurrences."""
+        result = importers.import_subscriptions(self.user, self.subscription_rows(3))
+        self.assertEqual(result.imported, 3)
+        self.assertEqual(result.errors, [])
+        subscription = Subscription.objects.get(user=self.user, name='Subscription 0')
+        self.assertEqual(subscription.cost, Decimal('9.99'))
+        self.assertEqual(subscription.start_date, date(2024, 1, 15))
+        self.assertEqual(subscription.category.name, 'Streaming')
+        self.assertEqual(Category.objects.filter(user=self.user, name='Streaming').count(), 1)
+        self.assertTrue(RenewalOccurrence.objects.filter(subscription=subscription).exists())
+
+    def test_import_subscriptions_query_count_is_fixed(self):
+        """Test that a batch costs the same number of queries however many rows it has."""
+        # savepoint, categories, fingerprints, subscriptions, occurrences, data version, release
+        with self.assertNumQueries(7):
+            importers.import_subscriptions(self.user, self.subscription_rows(5, 'Food', 'yearly'))
+        rows = [(row_number, dict(row, cost='4.99')) for row_number, row in self.subscription_rows(15, 'Streaming', 'yearly')]
+        with self.assertNumQueries(8):  # plus the new category
+            importers.import_subscriptions(self.user, rows)
+        self.assertEqual(Subscription.objects.filter(user=self.user).count(), 20)
+
+    def test_fingerprint(self):
+        """Test that the fingerprint is saved and ignores case, spacing and cost formatting."""
+        subscription = Subscription.objects.create(
+            user=self.user, name='Netflix', cost=Decimal('9.99'), currency='GBP',
+            renewal_period='monthly', start_date=date(2024, 1, 15)
+        )
+        self.assertEqual(len(subscription.fingerprint), 64)
+        self.assertEqual(
+            subscription.fingerprint,
+            subscription_fingerprint('  netflix ', '9.990', 'GBP', 'monthly', '2024-01-15')
+        )
+        self.assertNotEqual(
+            subscription.fingerprint,
+            subscription_fingerprint('Netflix', '9.99', 'GBP', 'monthly', '2024-01-16')
+        )
+
+        subscription.cost = Decimal('10.99')
+        subscription.save()
+        self.assertEqual(
+            Subscription.objects.get(pk=subscription.pk).fingerprint,
+            subscription_fingerprint('Netflix', '10.99', 'GBP', 'monthly', '2024-01-15')
+        )
+
+    def test_reimport_skips_existing_subscriptions(self):
+        """Test that importing the same rows again skips them as duplicates."""
+        importers.import_subscriptions(self.user, self.subscription_rows(3))
+        rows = self.subscription_rows(4)
+        rows[0][1]['name'] = 'SUBSCRIPTION 0'
+        result = importers.import_subscriptions(self.user, rows)
+        self.assertEqual((result.imported, result.skipped), (1, 3))
+        self.assertEqual(result.success_message('subscriptions'), 'Successfully imported 1 subscriptions. Skipped 3 duplicate entries.')
+        self.assertEqual(Subscription.objects.filter(user=self.user).count(), 4)
+
+    def test_import_skips_repeated_rows(self):
+        """Test that rows repeated within an import are only imported once, in the same or a later batch."""
+        rows = self.subscription_rows(3) + self.subscription_rows(3)
+        result = importers.import_subscriptions(self.user, rows, batch_size=4)
+        self.assertEqual((result.imported, result.skipped), (3, 3))
+
+    def test_duplicates_are_per_user(self):
+        """Test that another user's identical subscriptions don't count as duplicates."""
+        importers.import_subscriptions(self.other_user, self.subscription_rows(2))
+        result = importers.import_subscriptions(self.user, self.subscription_rows(2))
+        self.assertEqual((result.imported, result.skipped), (2, 0))
+
+    def test_import_subscriptions_in_batches(self):
+        """Test that rows are written in batches of the given size."""
+        result = importers.import_subscriptions(self.user, self.subscription_rows(25), batch_size=10)
+        self.assertEqual(result.imported, 25)
+        self.assertEqual(Category.objects.filter(user=self.user, name='Streaming').count(), 1)
+
+    def test_import_subscriptions_reports_row_errors(self):
+        """Test that invalid rows are skipped and reported with their row numbers."""
+        rows = self.subscription_rows(4)
+        rows[1][1]['name'] = ''
+        rows[2][1]['cost'] = 'free'
+        rows[3][1]['renewal_period'] = 'daily'
+        result = importers.import_subscriptions(self.user, rows)
+        self.assertEqual(result.imported, 1)
+        self.assertEqual(result.errors, [
+            (2, 'name is required'), (3, 'invalid cost "free"'), (4, 'invalid renewal_period "daily"')
+        ])
+
+    def test_reported_errors_are_capped(self):
+        """Test that only the first errors are kept, while all are counted."""
+        rows = [(index + 1, {'name': '', 'cost': '1'}) for index in range(importers.MAX_REPORTED_ERRORS + 20)]
+        result = importers.import_subscriptions(self.user, rows)
+        self.assertEqual(len(result.errors), importers.MAX_REPORTED_ERRORS)
+        self.assertEqual(result.error_count, importers.MAX_REPORTED_ERRORS + 20)
+        self.assertTrue(result.error_summary().endswith(f'; and {importers.MAX_REPORTED_ERRORS + 15} more'))
+
+    def test_import_subscriptions_defaults(self):
+        """Test that blank choices use the model defaults and bad dates fall back."""
+        rows = [(1, {'name': 'Minimal', 'cost': '5', 'start_date': 'soon', 'cancellation_date': 'never'})]
+        importers.import_subscriptions(self.user, rows)
+        subscription = Subscription.objects.get(user=self.user, name='Minimal')
+        self.assertEqual(subscription.currency, 'USD')
+        self.assertEqual(subscription.renewal_period, 'monthly')
+        self.assertEqual(subscription.status, 'active')
+        self.assertEqual(subscription.start_date, date.today())
+        self.assertIsNone(subscription.cancellation_date)
+        self.assertIsNone(subscription.category)
+
+    def test_import_subscriptions_bumps_version(self):
+        """Test that an import bumps the user's data version."""
+        version = get_data_version(self.user)
+        importers.import_subscriptions(self.user, self.subscription_rows(3))
+        self.assertEqual(get_data_version(self.user), version + 1)
+
+    def test_import_categories_skips_duplicates(self):
+        """Test that existing and repeated category names are skipped."""
+        rows = enumerate([{'name': 'Food'}, {'name': 'Travel'}, {'name': 'Travel'}, {'name': ''}], 1)
+        with self.assertNumQueries(5):  # savepoint, existing names, insert, data version, release
+            result = importers.import_categories(self.user, rows)
+        self.assertEqual((result.imported, result.skipped), (1, 2))
+        self.assertEqual(result.errors, [(4, 'name is required')])
+        self.assertEqual(Category.objects.filter(user=self.user, name='Travel').count(), 1)
+
+    def test_import_currencies_for_user(self):
+        """Test that currencies are imported for the user, skipping only the user's own codes."""
+        Currency.objects.filter(user=self.other_user, code='EUR').delete()
+        rows = enumerate([
+            {'code': 'GBP', 'name': 'British Pound', 'symbol': '£', 'is_default': False},
+            {'code': 'JPY', 'name': 'Japanese Yen', 'symbol': '¥', 'is_default': True},
+        ], 1)
+        result = importers.import_currencies(self.other_user, rows)
+        self.assertEqual((result.imported, result.skipped), (1, 1))
+        yen = Currency.objects.get(code='JPY')
+        self.assertEqual(yen.user, self.other_user)
+        self.assertEqual(list(Currency.objects.filter(user=self.other_user, is_default=True)), [yen])
+        self.assertTrue(Currency.objects.get(user=self.user, code='GBP').is_default)
+
+    def test_import_default_currency_without_returned_pks(self):
+        """Test that the imported default is set on databases that don't return bulk-created primary keys."""
+        rows = enumerate([{'code': 'JPY', 'name': 'Japanese Yen', 'symbol': '¥', 'is_default': True}], 1)
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert',
+                               new_callable=mock.PropertyMock, return_value=False):
+            importers.import_currencies(self.user, rows)
+        defaults = Currency.objects.filter(user=self.user, is_default=True).values_list('code', flat=True)
+        self.assertEqual(list(defaults), ['JPY'])
+
+    def test_import_selected_from_preview(self):
+        """Test that the preview page imports only the selected rows."""
+        import_id, _ = importers.stage_import(self.user, 'subscriptions', [
+            {'name': 'Netflix', 'category': 'Streaming', 'cost': '9.99', 'currency': 'GBP',
+             'renewal_period': 'monthly', 'start_date': '2024-01-15', 'status': 'active'},
+            {'name': 'Spotify', 'category': 'Streaming', 'cost': '10.99', 'currency': 'GBP',
+             'renewal_period': 'monthly', 'start_date': '2024-02-01', 'status': 'active'},
+        ])
+        response = self.client.post(reverse('import-subscriptions-csv'), {
+            'from_preview': '1', 'import_selected': '1', 'import_id': import_id,
+            'selected_subscriptions': ['2', '3', '7', 'x']
+        })
+        job = Job.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('job-detail', args=[job.pk]), fetch_redirect_response=False)
+        self.assertEqual(job.total, 1)
+        jobs.run_pending_jobs()
+        self.assertEqual(list(Subscription.objects.filter(user=self.user).values_list('name', flat=True)), ['Spotify'])
+        job.refresh_from_db()
+        self.assertEqual(job.result['message'], 'Successfully imported 1 subscriptions.')
+
+
+class StagedImportTest(TestCase):
+    """Tests for staging uploaded CSV rows between the preview and the import."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other_user = User.objects.create_user(username='otheruser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+
+    def upload(self, url_name, content, name='import.csv'):
+        csv_file = io.BytesIO(content.encode('utf-8'))
+        csv_file.name = name
+        return self.client.post(reverse(url_name), {'csv_file': csv_file})
+
+    def test_upload_stages_rows(self):
+        """Test that an upload stages its rows and redirects to the preview, leaving the session alone."""
+        response = self.upload(
+            'import-subscriptions-csv',
+            'name,category,cost,currency,renewal_period,start_date,url,notes,status,cancellation_date\n'
+            'Netflix,Streaming,9.99,GBP,monthly,2024-01-15,,,active,\n'
+        )
+        staged = StagedImport.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('import-preview', args=[staged.import_id]), fetch_redirect_response=False)
+        self.assertEqual(staged.kind, 'subscriptions')
+        self.assertEqual(staged.row_number, 1)
+        self.assertEqual(staged.data['start_date'], '2024-01-15')
+        self.assertEqual(staged.data['cost'], '9.99')
+        self.assertFalse(any('preview' in key for key in self.client.session.keys()))
+
+    def test_upload_stages_valid_rows_only(self):
+        """Test that invalid rows are reported on upload and keep their row numbers."""
+        response = self.upload('import-currencies-csv', 'code,name,symbol,is_default\nJPY,Japanese Yen,¥,False\n,Nameless,?,False\nCHF,Swiss Franc,F,True\n')
+        self.assertEqual(list(StagedImport.objects.values_list('row_number', 'data__code')), [(1, 'JPY'), (3, 'CHF')])
+        message_texts = [str(message) for message in get_messages(response.wsgi_request)]
+        self.assertIn('1 rows will not be imported: row 2: code required', message_texts)
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+    def test_upload_streams_from_temporary_file(self):
+        """Test that uploads written to a temporary file are parsed in batches."""
+        rows = ''.join(f'Category {n}\n' for n in range(1, 1201))
+        with mock.patch.object(StagedImport.objects, 'bulk_create', wraps=StagedImport.objects.bulk_create) as bulk_create:
+            self.upload('import-categories-csv', 'name\n' + rows)
+        self.assertEqual(StagedImport.objects.count(), 1200)
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [500, 500, 200])
+
+    def test_upload_with_invalid_encoding(self):
+        """Test that a file that isn't UTF-8 is rejected without staging any rows."""
+        csv_file = io.BytesIO(b'name\nCaf\xe9\n')
+        csv_file.name = 'import.csv'
+        response = self.client.post(reverse('import-categories-csv'), {'csv_file': csv_file})
+        self.assertFalse(StagedImport.objects.exists())
+        message_texts = [str(message) for message in get_messages(response.wsgi_request)]
+        self.assertTrue(message_texts[0].startswith('Error importing CSV file:'))
+
+    def test_upload_replaces_unconfirmed_import(self):
+        """Test that a new upload discards the user's earlier unconfirmed import of the same kind."""
+        self.upload('import-categories-csv', 'name\nOld\n')
+        self.upload('import-categories-csv', 'name\nNew 1\nNew 2\n')
+        self.assertEqual(list(StagedImport.objects.values_list('data__name', flat=True)), ['New 1', 'New 2'])
+
+    @override_settings(IMPORT_PREVIEW_PAGE_SIZE=2)
+    def test_preview_is_paginated(self):
+        """Test that the preview shows one page of staged rows at a time."""
+        import_id, _ = importers.stage_import(self.user, 'categories', [{'name': f'Category {n}'} for n in range(1, 6)])
+        with self.assertNumQueries(4):  # session, user, count, page
+            response = self.client.get(reverse('import-preview', args=[import_id]), {'page': 2})
+        self.assertEqual([row['name'] for row in response.context['categories']], ['Category 3', 'Category 4'])
+        self.assertEqual(response.context['total_rows'], 5)
+        self.assertContains(response, 'value="3" id="category-3"')
+        self.assertContains(response, 'Page 2 of 3')
+
+    def test_preview_marks_existing_subscriptions(self):
+        """Test that the preview marks rows matching the user's subscriptions, which can't be selected."""
+        Subscription.objects.create(
+            user=self.user, name='Netflix', cost=Decimal('9.99'), currency='GBP',
+            renewal_period='monthly', start_date=date(2024, 1, 15)
+        )
+        row = {'name': 'Netflix', 'cost': '9.99', 'currency': 'GBP', 'renewal_period': 'monthly', 'start_date': '2024-01-15'}
+        import_id, _ = importers.stage_import(self.user, 'subscriptions', [row, dict(row, name='Spotify')])
+        with self.assertNumQueries(5):  # session, user, count, page, fingerprints
+            response = self.client.get(reverse('import-preview', args=[import_id]))
+        self.assertEqual([row['exists'] for row in response.context['subscriptions']], [True, False])
+        self.assertEqual(response.context['existing_count'], 1)
+        self.assertContains(response, 'Already exists', count=1)
+        self.assertNotContains(response, 'value="1" id="subscription-1"')
+        self.assertContains(response, 'value="2" id="subscription-2"')
+
+    def test_preview_of_other_user_import(self):
+        """Test that users can't preview each other's imports."""
+        import_id, _ = importers.stage_import(self.other_user, 'categories', [{'name': 'Private'}])
+        response = self.client.get(reverse('import-preview', args=[import_id]))
+        self.assertRedirects(response, reverse('settings'), fetch_redirect_response=False)
+
+    def test_confirm_imports_and_clears_rows(self):
+        """Test that confirming imports the staged rows by id and deletes them."""
+        import_id, _ = importers.stage_import(self.user, 'categories', [{'name': 'Travel'}, {'name': 'Food'}])
+        response = self.client.post(reverse('import-categories-csv'), {
+            'from_preview': '1', 'import_all': '1', 'import_id': import_id
+        })
+        job = Job.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('job-detail', args=[job.pk]), fetch_redirect_response=False)
+        self.assertFalse(Category.objects.filter(user=self.user, name='Travel').exists())
+        jobs.run_pending_jobs()
+        self.assertTrue(Category.objects.filter(user=self.user, name='Travel').exists())
+        self.assertFalse(StagedImport.objects.exists())
+        job.refresh_from_db()
+        self.assertEqual(job.result['message'], 'Successfully imported 1 categories. Skipped 1 duplicate entries.')
+
+    def test_confirm_other_user_import(self):
+        """Test that users can't confirm each other's imports."""
+        import_id, _ = importers.stage_import(self.other_user, 'categories', [{'name': 'Private'}])
+        self.client.post(reverse('import-categories-csv'), {'from_preview': '1', 'import_all': '1', 'import_id': import_id})
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(StagedImport.objects.count(), 1)
+
+    def test_confirm_expired_import(self):
+        """Test that confirming a purged or invalid import shows an error."""
+        for import_id in ['not-a-uuid', '6f1d3c1e-4d0b-4f7e-9a43-0d2f3c6c1b7a']:
+            response = self.client.post(reverse('import-currencies-csv'), {
+                'from_preview': '1', 'import_all': '1', 'import_id': import_id
+            })
+            message_texts = [str(message) for message in get_messages(response.wsgi_request)]
+            self.assertIn('This import has expired. Please upload the CSV file again.', message_texts)
+
+    def test_purge_staged_imports(self):
+        """Test that the purge command only deletes expired staged rows."""
+        importers.stage_import(self.user, 'categories', [{'name': 'Old'}])
+        StagedImport.objects.update(created_at=timezone.now() - timedelta(days=2))
+        importers.stage_import(self.user, 'subscriptions', [{'name': 'New', 'cost': '1.00'}])
+        out = io.StringIO()
+        call_command('purge_staged_imports', stdout=out)
+        self.assertIn('Deleted 1 staged import rows.', out.getvalue())
+        self.assertEqual(list(StagedImport.objects.values_list('kind', flat=True)), ['subscriptions'])
+
+
+class JobQueueTest(TestCase):
+    """Tests for the background job queue."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other_user = User.objects.create_user(username='otheruser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.result_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.result_dir.cleanup)
+        settings_override = override_settings(JOB_RESULT_DIR=self.result_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+    def queue_import(self, user, names):
+        import_id, staged = importers.stage_import(user, 'categories', [{'name': name} for name in names])
+        return jobs.enqueue_job(user, 'import_categories', {'import_id': str(import_id), 'row_numbers': None}, total=staged.imported)
+
+    def test_claim_marks_job_running(self):
+        """Test that jobs are claimed oldest first, and only once."""
+        first = self.queue_import(self.user, ['Travel'])
+        second = self.queue_import(self.other_user, ['Travel'])
+        claimed = jobs.claim_next_job()
+        self.assertEqual(claimed, first)
+        self.assertEqual(claimed.status, 'running')
+        self.assertIsNotNone(claimed.started_at)
+        self.assertEqual(jobs.claim_next_job(), second)
+        self.assertIsNone(jobs.claim_next_job())
+
+    def test_run_jobs_command(self):
+        """Test that the worker command runs queued jobs until the queue is empty."""
+        job = self.queue_import(self.user, ['Travel', 'Food'])
+        out = io.StringIO()
+        call_command('run_jobs', '--once', '--threads', '1', stdout=out)
+        self.assertIn('Ran 1 jobs.', out.getvalue())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual((job.progress, job.total), (2, 2))
+        self.assertEqual(job.result['imported'], 1)
+        self.assertEqual(job.result['skipped'], 1)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_failed_job_keeps_staged_rows(self):
+        """Test that a failing job is marked failed and its import rolled back."""
+        job = self.queue_import(self.user, ['Travel'])
+        with mock.patch.object(importers.Category.objects, 'bulk_create', side_effect=RuntimeError('disk full')):
+            jobs.run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.error, 'disk full')
+        self.assertEqual(StagedImport.objects.filter(user=self.user).count(), 1)
+
+    def test_export_job(self):
+        """Test that an export job writes a CSV file the user can download."""
+        Subscription.objects.create(
+            name='Netflix', cost=Decimal('9.99'), currency='GBP', renewal_period='monthly',
+            start_date=date(2024, 1, 15), user=self.user
+        )
+        response = self.client.post(reverse('export-subscriptions-job'))
+        job = Job.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('job-detail', args=[job.pk]), fetch_redirect_response=False)
+
+        jobs.run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual(job.result['message'], 'Exported 1 subscriptions.')
+
+        response = self.client.get(reverse('job-download', args=[job.pk]))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="subscriptions.csv"')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        response.close()
+        self.assertEqual(lines[1], 'Netflix,,9.99,GBP,monthly,2024-01-15,,,active,')
+
+    def test_progress_endpoint(self):
+        """Test that the progress endpoint reports the job's status as JSON."""
+        job = self.queue_import(self.user, ['Travel', 'Food', 'Music', 'Games'])
+        url = reverse('job-progress', args=[job.pk])
+        self.assertEqual(self.client.get(url).json()['status'], 'queued')
+
+        job = jobs.claim_next_job()
+        jobs.report_progress(job, 1)
+        status = self.client.get(url).json()
+        self.assertEqual((status['status'], status['progress'], status['total'], status['percent']), ('running', 1, 4, 25))
+
+        jobs.run_job(job)
+        status = self.client.get(url).json()
+        self.assertTrue(status['finished'])
+        self.assertEqual(status['percent'], 100)
+        self.assertEqual(status['message'], 'Successfully imported 3 categories. Skipped 1 duplicate entries.')
+        self.assertIsNone(status['download_url'])
+
+    def test_jobs_are_private(self):
+        """Test that users can't see or download each other's jobs."""
+        job = self.queue_import(self.other_user, ['Travel'])
+        for url_name in ['job-detail', 'job-progress', 'job-download']:
+            self.assertEqual(self.client.get(reverse(url_name, args=[job.pk])).status_code, 404)
+
+    def test_reclaim_stale_jobs(self):
+        """Test that jobs whose worker stopped sending heartbeats are requeued, then failed if lost again."""
+        job = self.queue_import(self.user, ['Travel'])
+        recent = self.queue_import(self.other_user, ['Travel'])
+        jobs.claim_next_job('stopped:1')
+        jobs.claim_next_job('stopped:1')
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=2))
+
+        out = io.StringIO()
+        call_command('run_jobs', '--once', '--threads', '1', stdout=out)
+        self.assertIn('Requeued 1 and failed 0 jobs', out.getvalue())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.worker), ('succeeded', 2, jobs.worker_name()))
+        recent.refresh_from_db()
+        self.assertEqual(recent.status, 'running')
+
+        Job.objects.filter(pk=recent.pk).update(heartbeat_at=timezone.now() - timedelta(hours=2), attempts=jobs.MAX_JOB_ATTEMPTS)
+        self.assertEqual(jobs.reclaim_stale_jobs(), (0, 1))
+        recent.refresh_from_db()
+        self.assertEqual(recent.status, 'failed')
+        self.assertIsNotNone(recent.finished_at)
+        self.assertEqual(StagedImport.objects.filter(user=self.other_user).count(), 1)
+
+    def test_heartbeat_keeps_long_job_running(self):
+        """Test that a job running for long is kept while its worker sends heartbeats."""
+        job = self.queue_import(self.user, ['Travel'])
+        other = self.queue_import(self.other_user, ['Travel'])
+        self.assertEqual(jobs.claim_next_job('worker-a:1').worker, 'worker-a:1')
+        jobs.claim_next_job('worker-b:2')
+        long_ago = timezone.now() - timedelta(hours=2)
+        Job.objects.update(started_at=long_ago, heartbeat_at=long_ago)
+
+        self.assertEqual(jobs.send_heartbeat('worker-a:1'), 1)
+        self.assertEqual(jobs.reclaim_stale_jobs(), (1, 0))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), ('running', 'worker-a:1'))
+        other.refresh_from_db()
+        self.assertEqual((other.status, other.worker, other.heartbeat_at), ('queued', '', None))
+
+    def test_import_commits_heartbeat(self):
+        """Test that an import commits a fresh heartbeat, as none can be written while it runs."""
+        job = self.queue_import(self.user, ['Travel'])
+        job = jobs.claim_next_job()
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=2))
+        jobs.run_job(job)
+        job.refresh_from_db()
+        self.assertGreater(job.heartbeat_at, timezone.now() - timedelta(minutes=1))
+
+    def test_purge_finished_jobs(self):
+        """Test that old finished jobs are deleted with their files."""
+        Subscription.objects.create(name='Netflix', cost=Decimal('9.99'), start_date=date(2024, 1, 15), user=self.user)
+        jobs.enqueue_job(self.user, 'export_subscriptions')
+        jobs.run_pending_jobs()
+        job = Job.objects.get()
+        path = job.result_file.path
+        self.assertTrue(os.path.exists(path))
+
+        self.assertEqual(jobs.purge_finished_jobs(), 0)
+        Job.objects.update(finished_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(jobs.purge_finished_jobs(), 1)
+        self.assertFalse(Job.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+
+class BackupTest(TestCase):
+    """Tests for whole-account backups and restores."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other_user = User.objects.create_user(username='otheruser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.result_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.result_dir.cleanup)
+        settings_override = override_settings(JOB_RESULT_DIR=self.result_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.streaming = Category.objects.create(name='Streaming', user=self.user)
+        Currency.objects.create(code='JPY', name='Japanese Yen', symbol='¥', user=self.user)
+        Currency.objects.filter(user=self.user).update(is_default=False)
+        Currency.objects.filter(user=self.user, code='USD').update(is_default=True)
+        Subscription.objects.create(
+            user=self.user, name='Netflix', category=self.streaming, cost=Decimal('9.99'), currency='GBP',
+            renewal_period='monthly', start_date=date(2024, 1, 15), url='https://netflix.com', notes='Family plan'
+        )
+        Subscription.objects.create(
+            user=self.user, name='Gym', cost=Decimal('30.00'), currency='GBP', renewal_period='monthly',
+            start_date=date(2023, 6, 1), status='cancelled', cancellation_date=date(2024, 2, 1)
+        )
+        Subscription.objects.create(
+            user=self.other_user, name='Private', cost=Decimal('1.00'), currency='GBP',
+            renewal_period='yearly', start_date=date(2024, 1, 1)
+        )
+
+    def make_backup(self, user):
+        return b''.join(backup.generate_backup(user))
+
+    def read_lines(self, archive, name):
+        return [json.loads(line) for line in archive.read(name).decode('utf-8').splitlines()]
+
+    def test_backup_view_streams_archive(self):
+        """Test that the backup is streamed as a zip of the user's records."""
+        response = self.client.get(reverse('backup'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertIn('attachment; filename="subcal-backup-', response['Content-Disposition'])
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.namelist(), ['manifest.json', 'currencies.ndjson', 'categories.ndjson', 'subscriptions.ndjson'])
+        manifest = json.loads(archive.read('manifest.json'))
+        self.assertEqual(manifest['counts'], {'currencies': 4, 'categories': 6, 'subscriptions': 2})
+
+        subscriptions = self.read_lines(archive, 'subscriptions.ndjson')
+        self.assertEqual(subscriptions[0], {
+            'name': 'Netflix', 'category_id': self.streaming.pk, 'cost': '9.99', 'currency': 'GBP',
+            'renewal_period': 'monthly', 'start_date': '2024-01-15', 'status': 'active',
+            'cancellation_date': None, 'url': 'https://netflix.com', 'notes': 'Family plan'
+        })
+        self.assertEqual(subscriptions[1]['cancellation_date'], '2024-02-01')
+        self.assertIn({'id': self.streaming.pk, 'name': 'Streaming'}, self.read_lines(archive, 'categories.ndjson'))
+        self.assertIn(
+            {'code': 'USD', 'name': 'US Dollar', 'symbol': '$', 'is_default': True},
+            self.read_lines(archive, 'currencies.ndjson')
+        )
+
+    def test_restore_remaps_categories(self):
+        """Test that a restore links subscriptions to the new account's categories and skips what exists."""
+        results = backup.restore_backup(self.other_user, io.BytesIO(self.make_backup(self.user)))
+        self.assertEqual({kind: (result.imported, result.skipped) for kind, result in results.items()}, {
+            'currencies': (1, 3), 'categories': (1, 5), 'subscriptions': (2, 0)
+        })
+
+        netflix = Subscription.objects.get(user=self.other_user, name='Netflix')
+        self.assertEqual(netflix.category, Category.objects.get(user=self.other_user, name='Streaming'))
+        self.assertEqual((netflix.cost, netflix.notes), (Decimal('9.99'), 'Family plan'))
+        gym = Subscription.objects.get(user=self.other_user, name='Gym')
+        self.assertIsNone(gym.category)
+        self.assertEqual((gym.status, gym.cancellation_date), ('cancelled', date(2024, 2, 1)))
+        self.assertEqual(Currency.objects.get(user=self.other_user, is_default=True).code, 'USD')
+        self.assertEqual(
+            backup.restore_message(results),
+            'Restored 1 currencies, 1 categories, 2 subscriptions. Skipped 8 entries that already existed.'
+        )
+
+    def test_restore_bumps_data_version_once(self):
+        """Test that a restore bumps the user's data version once, even if it only changes the default currency."""
+        archive = self.make_backup(self.user)
+        version = get_data_version(self.other_user)
+        backup.restore_backup(self.other_user, io.BytesIO(archive))
+        self.assertEqual(get_data_version(self.other_user), version + 1)
+
+        Currency.objects.filter(user=self.user).update(is_default=False)
+        Currency.objects.filter(user=self.user, code='GBP').update(is_default=True)
+        version = get_data_version(self.user)
+        results = backup.restore_backup(self.user, io.BytesIO(archive))
+        self.assertEqual(sum(result.imported for result in results.values()), 0)
+        self.assertEqual(Currency.objects.get(user=self.user, is_default=True).code, 'USD')
+        self.assertEqual(get_data_version(self.user), version + 1)
+
+    def test_restore_twice_copies_nothing(self):
+        """Test that restoring a backup into the account it came from skips every record."""
+        results = backup.restore_backup(self.user, io.BytesIO(self.make_backup(self.user)))
+        self.assertEqual(sum(result.imported for result in results.values()), 0)
+        self.assertEqual(Subscription.objects.filter(user=self.user).count(), 2)
+
+    def test_restore_invalid_backup_changes_nothing(self):
+        """Test that a backup with a corrupt file is rejected without restoring any of it."""
+        source = zipfile.ZipFile(io.BytesIO(self.make_backup(self.user)))
+        archive_file = io.BytesIO()
+        with zipfile.ZipFile(archive_file, 'w') as archive:
+            for name in source.namelist():
+                content = source.read(name)
+                if name == 'subscriptions.ndjson':
+                    content += b'{"name": "Broken\n'
+                archive.writestr(name, content)
+
+        with self.assertRaisesMessage(ValueError, 'Line 3 of subscriptions.ndjson is not valid JSON.'):
+            backup.restore_backup(self.other_user, archive_file)
+        self.assertFalse(Category.objects.filter(user=self.other_user, name='Streaming').exists())
+        self.assertEqual(list(Subscription.objects.filter(user=self.other_user).values_list('name', flat=True)), ['Private'])
+
+    def test_restore_rejects_files_that_are_not_backups(self):
+        """Test that files other than backups are rejected with a message."""
+        with self.assertRaisesMessage(ValueError, 'This file is not a SubCal backup.'):
+            backup.restore_backup(self.other_user, io.BytesIO(b'name\nTravel\n'))
+
+        archive_file = io.BytesIO()
+        with zipfile.ZipFile(archive_file, 'w') as archive:
+            archive.writestr('manifest.json', json.dumps({'format': 'subcal-backup', 'version': 99}))
+        with self.assertRaisesMessage(ValueError, "Backups of version 99 can't be restored"):
+            backup.restore_backup(self.other_user, archive_file)
+
+    def test_restore_view_queues_job(self):
+        """Test that an uploaded backup is restored by a background job and then deleted."""
+        backup_file = io.BytesIO(self.make_backup(self.other_user))
+        backup_file.name = 'backup.zip'
+        response = self.client.post(reverse('restore-backup'), {'backup_file': backup_file})
+
+        job = Job.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('job-detail', args=[job.pk]), fetch_redirect_response=False)
+        self.assertEqual((job.kind, job.total), ('restore_backup', 9))
+        self.assertTrue(job_result_storage().exists(job.payload['archive']))
+
+        jobs.run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual(job.result['message'], 'Restored 0 currencies, 0 categories, 1 subscriptions. Skipped 8 entries that already existed.')
+        self.assertTrue(Subscription.objects.filter(user=self.user, name='Private').exists())
+        self.assertFalse(job_result_storage().exists(job.payload['archive']))
+
+    def test_restore_view_rejects_invalid_upload(self):
+        """Test that an upload that isn't a backup is rejected before a job is queued."""
+        backup_file = io.BytesIO(b'not a zip file')
+        backup_file.name = 'backup.zip'
+        response = self.client.post(reverse('restore-backup'), {'backup_file': backup_file})
+        self.assertRedirects(response, reverse('settings'), fetch_redirect_response=False)
+        message_texts = [str(message) for message in get_messages(response.wsgi_request)]
+        self.assertEqual(message_texts, ['This file is not a SubCal backup.'])
+        self.assertFalse(Job.objects.exists())
+
+
+@skipIf(connection.vendor != 'sqlite', 'Query plans are checked with SQLite\'s EXPLAIN QUERY PLAN')
+class NextBillingDateTest(TestCase):
+    """Tests for the stored next billing date and its rollover."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.url = reverse('subscription-list')
+        self.today = date.today()
+
+    def create_subscription(self, name, start_date, renewal_period='monthly', **kwargs):
+        return Subscription.objects.create(
+            user=self.user,
+            name=name,
+            cost=9.99,
+            currency='GBP',
+            renewal_period=renewal_period,
+            start_date=start_date,
+            **kwargs
+        )
+
+    def test_stored_on_save(self):
+        """Test that saving, cancelling and reactivating store the next billing date."""
+        subscription = self.create_subscription('Netflix', date(2023, 1, 1))
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.next_billing_date, get_next_billing_date(subscription))
+        self.assertGreaterEqual(subscription.next_billing_date, self.today)
+
+        subscription.cancel(self.today - timedelta(days=1))
+        subscription.refresh_from_db()
+        self.assertIsNone(subscription.next_billing_date)
+
+        subscription.reactivate()
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.next_billing_date, get_next_billing_date(subscription))
+
+    def test_roll_next_billing_dates(self):
+        """Test that only dates before today are moved on, and cancelled subscriptions are cleared."""
+        monthly = self.create_subscription('Monthly', date(2024, 1, 15))
+        yearly = self.create_subscription('Yearly', date(2024, 6, 1), renewal_period='yearly')
+        cancelled = self.create_subscription(
+            'Cancelled', date(2024, 1, 10), status='cancelled', cancellation_date=date(2099, 1, 1)
+        )
+        Subscription.objects.filter(pk=monthly.pk).update(next_billing_date=date(2024, 2, 15))
+        Subscription.objects.filter(pk=yearly.pk).update(next_billing_date=date(2025, 6, 1))
+        Subscription.objects.filter(pk=cancelled.pk).update(cancellation_date=date(2024, 3, 1), next_billing_date=date(2024, 2, 10))
+
+        updated = Subscription.objects.roll_next_billing_dates(today=date(2024, 4, 20))
+
+        self.assertEqual(updated, 2)
+        next_dates = dict(Subscription.objects.values_list('name', 'next_billing_date'))
+        self.assertEqual(next_dates, {
+            'Monthly': date(2024, 5, 15),
+            'Yearly': date(2025, 6, 1),
+            'Cancelled': None,
+        })
+        self.assertEqual(Subscription.objects.roll_next_billing_dates(today=date(2024, 4, 20)), 0)
+
+    def test_roll_next_billing_dates_command(self):
+        """Test that the command rolls every user's passed dates."""
+        subscription = self.create_subscription('Netflix', date(2023, 1, 1))
+        Subscription.objects.filter(pk=subscription.pk).update(next_billing_date=date(2023, 2, 1))
+
+        out = io.StringIO()
+        call_command('roll_next_billing_dates', stdout=out)
+
+        self.assertIn('Advanced 1 next billing dates.', out.getvalue())
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.next_billing_date, get_next_billing_date(subscription))
+
+    def test_list_shows_passed_dates_without_saving(self):
+        """Test that the list works out dates the nightly rollover missed, without writing them."""
+        subscription = self.create_subscription('Netflix', self.today - relativedelta(years=2) + timedelta(days=3), renewal_period='yearly')
+        Subscription.objects.filter(pk=subscription.pk).update(next_billing_date=self.today - relativedelta(years=1) + timedelta(days=3))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+        self.assertEqual(response.context['active_subscriptions'][0].next_billing_date, get_next_billing_date(subscription))
+        subscription.refresh_from_db()
+        self.assertLess(subscription.next_billing_date, self.today)
+
+        response = self.client.get(self.url, {'renewing': 'week'})
+        self.assertEqual([s.name for s in response.context['page_obj']], ['Netflix'])
+
+    def test_list_sorted_by_next_billing_date(self):
+        """Test that sorting by next billing date is done in SQL, with no date last either way."""
+        later = self.create_subscription('Later', self.today - relativedelta(years=1) + timedelta(days=20), renewal_period='yearly')
+        sooner = self.create_subscription('Sooner', self.today - relativedelta(years=1) + timedelta(days=5), renewal_period='yearly')
+        ended = self.create_subscription(
+            'Ended', date(2023, 1, 1), status='cancelled', cancellation_date=self.today - timedelta(days=1)
+        )
+
+        response = self.client.get(self.url, {'sort': 'next_billing_date'})
+        self.assertEqual(list(response.context['page_obj']), [sooner, later, ended])
+
+        response = self.client.get(self.url, {'sort': 'next_billing_date', 'direction': 'desc'})
+        self.assertEqual(list(response.context['page_obj']), [later, sooner, ended])
+
+    def test_list_renewing_filter(self):
+        """Test that the renewing filter shows active subscriptions renewing within the window."""
+        self.create_subscription('This Week', self.today - relativedelta(years=1) + timedelta(days=3), renewal_period='yearly')
+        self.create_subscription('This Month', self.today - relativedelta(years=1) + timedelta(days=20), renewal_period='yearly')
+        self.create_subscription('Later', self.today - relativedelta(years=1) + timedelta(days=60), renewal_period='yearly')
+        self.create_subscription(
+            'Cancelled', self.today - relativedelta(years=1) + timedelta(days=3), renewal_period='yearly',
+            status='cancelled', cancellation_date=self.today + timedelta(days=30)
+        )
+
+        response = self.client.get(self.url, {'renewing': 'week'})
+        self.assertEqual([s.name for s in response.context['page_obj']], ['This Week'])
+        self.assertEqual(response.context['renewing'], 'week')
+        self.assertContains(response, 'renewing=week')
+
+        response = self.client.get(self.url, {'renewing': 'month'})
+        self.assertEqual([s.name for s in response.context['page_obj']], ['This Month', 'This Week'])
+
+        response = self.client.get(self.url, {'renewing': 'fortnight'})
+        self.assertEqual(len(response.context['page_obj']), 4)
+        self.assertEqual(response.context['renewing'], '')
+
+
+@override_settings(SUBSCRIPTION_LIST_PAGE_SIZE=2)
+class SubscriptionListPaginationTest(TestCase):
+    """Tests for keyset pagination, filtering and totals of the subscription list."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.url = reverse('subscription-list')
+        self.food = Category.objects.get(user=self.user, name='Food')
+        for name, cost, currency, renewal_period in [
+            ('Delta', '5.00', 'GBP', 'monthly'),
+            ('alpha', '10.00', 'GBP', 'yearly'),
+            ('Charlie', '5.00', 'USD', 'monthly'),
+            ('bravo', '5.00', 'GBP', 'monthly'),
+            ('Echo', '20.00', 'GBP', 'monthly'),
+        ]:
+            Subscription.objects.create(
+                user=self.user, name=name, cost=cost, currency=currency, renewal_period=renewal_period,
+                start_date=date(2023, 1, 1), category=self.food if currency == 'GBP' else None
+            )
+
+    def walk_pages(self, **params):
+        """Follow the next page links from the first page, returning the names on each page."""
+        pages = []
+        cursor = None
+        while True:
+            response = self.client.get(self.url, dict(params, after=cursor) if cursor else params)
+            page = response.context['page_obj']
+            pages.append([subscription.name for subscription in page])
+            if not page.has_next():
+                return pages
+            cursor = page.next_cursor
+
+    def test_pages_follow_sort_order(self):
+        """Test that following next links reads every subscription once, in sort order."""
+        self.assertEqual(self.walk_pages(), [['alpha', 'bravo'], ['Charlie', 'Delta'], ['Echo']])
+        self.assertEqual(
+            self.walk_pages(sort='name', direction='desc'),
+            [['Echo', 'Delta'], ['Charlie', 'bravo'], ['alpha']]
+        )
+
+    def test_ties_broken_by_primary_key(self):
+        """Test that subscriptions with the same sort value aren't skipped or repeated across pages."""
+        pages = self.walk_pages(sort='cost')
+        self.assertEqual(pages, [['Delta', 'Charlie'], ['bravo', 'alpha'], ['Echo']])
+
+        pages = self.walk_pages(sort='cost', direction='desc')
+        self.assertEqual(pages, [['Echo', 'alpha'], ['bravo', 'Charlie'], ['Delta']])
+
+    def test_previous_page(self):
+        """Test that the previous link leads back to the page before."""
+        first = self.client.get(self.url, {'sort': 'cost'}).context['page_obj']
+        self.assertFalse(first.has_previous())
+        second = self.client.get(self.url, {'sort': 'cost', 'after': first.next_cursor}).context['page_obj']
+        self.assertTrue(second.has_previous())
+
+        response = self.client.get(self.url, {'sort': 'cost', 'before': second.previous_cursor})
+        previous = response.context['page_obj']
+        self.assertEqual(list(previous), list(first))
+        self.assertFalse(previous.has_previous())
+        self.assertTrue(previous.has_next())
+
+    def test_next_billing_date_pages_end_with_no_date(self):
+        """Test that subscriptions without a next billing date come last, across pages and back again."""
+        Subscription.objects.filter(name__in=['alpha', 'Charlie']).update(next_billing_date=None)
+
+        pages = self.walk_pages(sort='next_billing_date')
+        self.assertEqual([name for page in pages for name in page][-2:], ['alpha', 'Charlie'])
+        pages = self.walk_pages(sort='next_billing_date', direction='desc')
+        self.assertEqual([name for page in pages for name in page][-2:], ['Charlie', 'alpha'])
+
+        # Going back from the page of subscriptions without a date
+        second = self.client.get(self.url, {'sort': 'next_billing_date', 'after': self.client.get(
+            self.url, {'sort': 'next_billing_date'}
+        ).context['page_obj'].next_cursor}).context['page_obj']
+        first = self.client.get(self.url, {'sort': 'next_billing_date', 'before': second.previous_cursor})
+        self.assertEqual(len(first.context['page_obj']), 2)
+
+    def test_filters(self):
+        """Test that the status, category, currency and renewal period filters run in the database."""
+        Subscription.objects.get(name='Echo').cancel(date(2024, 1, 1))
+
+        def names(**params):
+            return sorted(name for page in self.walk_pages(**params) for name in page)
+
+        self.assertEqual(names(status='cancelled'), ['Echo'])
+        self.assertEqual(names(status='active', currency='GBP'), ['Delta', 'alpha', 'bravo'])
+        self.assertEqual(names(category=self.food.pk, renewal_period='monthly'), ['Delta', 'Echo', 'bravo'])
+        self.assertEqual(names(currency='USD'), ['Charlie'])
+
+        # Unknown filter values are ignored
+        self.assertEqual(len(names(status='paused', renewal_period='daily', category='food')), 5)
+
+    def test_filters_kept_in_links(self):
+        """Test that sort and page links keep the chosen filters."""
+        response = self.client.get(self.url, {'currency': 'GBP', 'renewal_period': 'monthly'})
+        self.assertEqual(response.context['filters'], {'currency': 'GBP', 'renewal_period': 'monthly'})
+        self.assertContains(response, '&currency=GBP&amp;renewal_period=monthly&after=')
+        self.assertContains(response, '?sort=cost&direction=asc&currency=GBP&amp;renewal_period=monthly')
+
+    def test_totals_cover_every_page(self):
+        """Test that the count and annual totals cover every filtered subscription, not just the page."""
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.assertEqual(response.context['subscription_count'], 5)
+        self.assertEqual(response.context['annual_totals']['GBP']['total'], Decimal('370.00'))
+        self.assertEqual(response.context['annual_totals']['USD']['total'], Decimal('60.00'))
+
+        response = self.client.get(self.url, {'currency': 'USD'})
+        self.assertEqual(response.context['subscription_count'], 1)
+        self.assertNotIn('GBP', response.context['annual_totals'])
+
+    def test_totals_cached_until_data_changes(self):
+        """Test that the totals are read from the cache until a subscription changes."""
+        cursor = self.client.get(self.url).context['page_obj'].next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'after': cursor})
+        self.assertEqual(response.context['subscription_count'], 5)
+        self.assertFalse([query for query in queries.captured_queries if 'SUM(' in query['sql']])
+
+        Subscription.objects.create(
+            user=self.user, name='Foxtrot', cost='1.00', currency='USD', start_date=date(2023, 1, 1)
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['subscription_count'], 6)
+        self.assertEqual(response.context['annual_totals']['USD']['total'], Decimal('72.00'))
+
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor gets a 404 rather than an error."""
+        self.assertEqual(self.client.get(self.url, {'after': 'not a cursor'}).status_code, 404)
+        bad_date = pagination.encode_cursor('soon', 1)
+        self.assertEqual(self.client.get(self.url, {'sort': 'start_date', 'after': bad_date}).status_code, 404)
+
+
+class SearchTest(TestCase):
+    """Tests for full-text search of subscriptions."""
+
+    def setUp(self):
+        """Set up test data."""
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.url = reverse('subscription-list')
+        self.category = Category.objects.get(user=self.user, name='Computer')
+        self.netflix = self.create_subscription('Netflix', notes='Family plan', url='https://www.netflix.com/')
+        self.music = self.create_subscription('Spotify', notes='Shared with netflix account holder')
+        self.backup = self.create_subscription('Backblaze', category=self.category)
+
+    def create_subscription(self, name, user=None, **kwargs):
+        return Subscription.objects.create(
+            user=user or self.user, name=name, cost='9.99', currency='GBP', start_date=date(2024, 1, 1), **kwargs
+        )
+
+    def search(self, query, user=None):
+        queryset = Subscription.objects.filter(user=user or self.user)
+        queryset, relevance = search_subscriptions(queryset, query, user=user or self.user)
+        if relevance is not None:
+            queryset = queryset.annotate(search_rank=relevance).order_by('search_rank', 'pk')
+        return [subscription.name for subscription in queryset]
+
+    def test_prefix_matching_and_ranking(self):
+        """Test that words match as prefixes and name matches rank above notes matches."""
+        self.assertEqual(self.search('netf'), ['Netflix', 'Spotify'])
+        self.assertEqual(self.search('NETFLIX family'), ['Netflix'])
+        self.assertEqual(self.search('comp'), ['Backblaze'])
+        self.assertEqual(self.search('netflix.com'), ['Netflix'])
+        self.assertEqual(self.search('amazon'), [])
+
+    def test_index_kept_in_sync(self):
+        """Test that inserts, updates, bulk writes, category renames and deletes reach the search index."""
+        self.netflix.name = 'Disney Plus'
+        self.netflix.save()
+        self.assertEqual(self.search('disney'), ['Disney Plus'])
+        self.assertEqual(self.search('family'), ['Disney Plus'])
+
+        Subscription.objects.bulk_create([
+            Subscription(user=self.user, name='Dropbox', cost='5.00', currency='GBP', start_date=date(2024, 1, 1))
+        ])
+        Subscription.objects.filter(name='Spotify').update(notes='Duo plan')
+        self.assertEqual(self.search('dropbox'), ['Dropbox'])
+        self.assertEqual(self.search('duo'), ['Spotify'])
+
+        self.category.name = 'Storage'
+        self.category.save()
+        self.assertEqual(self.search('storage'), ['Backblaze'])
+        self.category.delete()
+        self.assertEqual(self.search('storage'), [])
+
+        self.backup.delete()
+        self.assertEqual(self.search('backblaze'), [])
+
+    def test_only_own_subscriptions(self):
+        """Test that searches only find the searching user's subscriptions."""
+        other_user = User.objects.create_user(username='otheruser', password='testpass123')
+        self.create_subscription('Netflix', user=other_user)
+
+        self.assertEqual(self.search('netflix'), ['Netflix', 'Spotify'])
+        self.assertEqual(self.search('netflix', user=other_user), ['Netflix'])
+        self.assertEqual(self.search(str(self.user.pk)), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        """Test that FTS5 operators and quotes in a search are just words."""
+        self.assertEqual(self.search('netflix OR spotify'), [])
+        self.assertEqual(self.search('"netf* NEAR( name:'), [])
+        self.assertEqual(self.search('!!!'), ['Netflix', 'Spotify', 'Backblaze'])
+
+    def test_fallback_without_full_text_search(self):
+        """Test that databases without FTS5 search with substring filters."""
+        with mock.patch('subscriptions.search.fts_available', return_value=False):
+            queryset, relevance = search_subscriptions(Subscription.objects.filter(user=self.user), 'NETF')
+            self.assertIsNone(relevance)
+            self.assertEqual(sorted(subscription.name for subscription in queryset), ['Netflix', 'Spotify'])
+
+            response = self.client.get(self.url, {'q': 'comp'})
+            self.assertEqual([subscription.name for subscription in response.context['page_obj']], ['Backblaze'])
+            self.assertEqual(response.context['current_sort'], 'name')
+
+    def test_list_search(self):
+        """Test that the list searches, sorts by relevance and keeps the search in its links."""
+        response = self.client.get(self.url, {'q': 'netflix'})
+        self.assertEqual([subscription.name for subscription in response.context['page_obj']], ['Netflix', 'Spotify'])
+        self.assertEqual(response.context['current_sort'], 'relevance')
+        self.assertEqual(response.context['subscription_count'], 2)
+        self.assertContains(response, 'value="netflix"')
+        self.assertContains(response, '?sort=cost&direction=asc&q=netflix')
+
+        response = self.client.get(self.url, {'q': 'netflix', 'sort': 'name', 'direction': 'desc'})
+        self.assertEqual([subscription.name for subscription in response.context['page_obj']], ['Spotify', 'Netflix'])
+        self.assertContains(response, 'Sort by relevance')
+
+    @override_settings(SUBSCRIPTION_LIST_PAGE_SIZE=1)
+    def test_list_search_pages(self):
+        """Test that search results page by relevance."""
+        first = self.client.get(self.url, {'q': 'netflix'}).context['page_obj']
+        second = self.client.get(self.url, {'q': 'netflix', 'after': first.next_cursor}).context['page_obj']
+        self.assertEqual([subscription.name for subscription in first], ['Netflix'])
+        self.assertEqual([subscription.name for subscription in second], ['Spotify'])
+        self.assertFalse(second.has_next())
+
+    def test_search_uses_index(self):
+        """Test that a search reads the full-text index and looks matches up by primary key."""
+        queryset, _ = search_subscriptions(Subscription.objects.filter(user=self.user), 'netf', user=self.user)
+        plan = queryset.explain()
+        self.assertIn('VIRTUAL TABLE INDEX', plan)
+        self.assertIsNone(re.search(r'\bSCAN subscriptions_subscription$', plan, re.MULTILINE), plan)
+
+    def test_admin_search(self):
+        """Test that the admin searches the full-text index, best matches first."""
+        User.objects.create_superuser(username='admin', password='adminpass123', email='admin@example.com')
+        self.client.login(username='admin', password='adminpass123')
+
+        response = self.client.get(reverse('admin:subscriptions_subscription_changelist'), {'q': 'netf'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([subscription.name for subscription in response.context['cl'].result_list], ['Netflix', 'Spotify'])
+
+        response = self.client.get(reverse('admin:subscriptions_subscription_changelist'), {'q': 'netf', 'o': '1'})
+        self.assertEqual([subscription.name for subscription in response.context['cl'].result_list], ['Netflix', 'Spotify'])
+
+
+class QueryPlanTest(TestCase):
+    """Tests that the per-user queries of the busiest pages are answered from an index."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+
+    def assertUsesIndex(self, queryset, index_name):
+        """Assert the query searches index_name, without scanning a whole table or sorting afterwards."""
+        self.assertPlanUsesIndex(queryset.explain(), index_name)
+
+    def assertPlanUsesIndex(self, plan, index_name):
+        self.assertIsNone(re.search(r'\bSCAN \w+$', plan, re.MULTILINE), f'Full table scan:\n{plan}')
+        self.assertRegex(plan, rf'USING (COVERING )?INDEX {index_name}\b')
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def list_page_plans(self, **params):
+        """Get the response of the subscription list and the query plans of its page queries."""
+        self.client.login(username='testuser', password='testpass123')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('subscription-list'), params)
+        page_queries = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "subscriptions_subscription"' in query['sql']
+            and 'ORDER BY' in query['sql'] and 'LIMIT' in query['sql']
+        ]
+        self.assertTrue(page_queries)
+        plans = []
+        with connection.cursor() as cursor:
+            for sql in page_queries:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plans.append('\n'.join(row[-1] for row in cursor.fetchall()))
+        return response, plans
+
+    def assertListPagesUseIndex(self, index_name, **params):
+        """Assert the queries for the first page, the page after it and the page back use index_name."""
+        if not Subscription.objects.filter(user=self.user).exists():
+            for i in range(5):
+                Subscription.objects.create(
+                    user=self.user, name=f'Service {i}', cost=i, currency='GBP', start_date=date(2024, 1, 1)
+                )
+
+        with override_settings(SUBSCRIPTION_LIST_PAGE_SIZE=2):
+            response, plans = self.list_page_plans(**params)
+            response, next_plans = self.list_page_plans(**params, after=response.context['page_obj'].next_cursor)
+            _, previous_plans = self.list_page_plans(**params, before=response.context['page_obj'].previous_cursor)
+
+        for plan in plans + next_plans + previous_plans:
+            self.assertPlanUsesIndex(plan, index_name)
+
+    def test_subscription_list_sorted_by_name(self):
+        """Test that the list sorted by name, either way, reads the (user, lower(name)) index in order."""
+        self.assertListPagesUseIndex('subscription_user_name_idx', sort='name')
+        self.assertListPagesUseIndex('subscription_user_name_idx', sort='name', direction='desc')
+        self.assertUsesIndex(Subscription.objects.filter(user=self.user).order_by(Lower('name')), 'subscription_user_name_idx')
+
+    def test_subscription_list_sorted_by_other_keys(self):
+        """Test that the list sorted by cost, start date or renewal period reads their indexes in order."""
+        self.assertListPagesUseIndex('subscription_user_cost_idx', sort='cost', direction='desc')
+        self.assertListPagesUseIndex('subscription_user_start_idx', sort='start_date')
+        self.assertListPagesUseIndex('subscription_user_renewal_idx', sort='renewal_period')
+
+    def test_subscription_list_by_next_billing_date(self):
+        """Test that the list sorted or filtered by next billing date uses the (user, next_billing_date) index."""
+        self.assertListPagesUseIndex('subscription_user_next_idx', sort='next_billing_date')
+        self.assertListPagesUseIndex('subscription_user_next_idx', sort='next_billing_date', direction='desc')
+        _, plans = self.list_page_plans(sort='next_billing_date', renewing='week')
+        for plan in plans:
+            self.assertPlanUsesIndex(plan, 'subscription_user_next_idx')
+
+    def test_subscriptions_by_status(self):
+        """Test that a user's active or cancelled subscriptions are found with the (user, status) index."""
+        self.assertUsesIndex(Subscription.objects.filter(user=self.user, status='active'), 'subscription_user_status_idx')
+        self.assertUsesIndex(Subscription.objects.filter(user=self.user, status='cancelled'), 'subscription_user_status_idx')
+
+    def test_default_currency(self):
+        """Test that a user's default currency is found with the (user, is_default) index."""
+        self.assertUsesIndex(Currency.objects.filter(user=self.user, is_default=True), 'currency_user_default_idx')
+
+    def test_fingerprint_lookup(self):
+        """Test that import duplicate checks are answered from the (user, fingerprint) index."""
+        self.assertUsesIndex(
+            Subscription.objects.filter(user=self.user, fingerprint__in=['a', 'b']).values_list('fingerprint', flat=True),
+            'subscription_fingerprint_idx'
+        )
+
+    def test_upcoming_renewals(self):
+        """Test that the home page's renewals are read from the (user, date) occurrence index."""
+        occurrences = RenewalOccurrence.objects.filter(
+            user=self.user,
+            date__range=(date(2024, 1, 1), date(2024, 1, 14)),
+            subscription__status='active'
+        ).order_by('date', 'subscription_id').values_list('subscription_id', 'date')
+        plan = occurrences.explain()
+        self.assertIsNone(re.search(r'\bSCAN \w+$', plan, re.MULTILINE), f'Full table scan:\n{plan}')
+        self.assertIn('SEARCH subscriptions_renewaloccurrence USING INDEX', plan)
+
+
+class SqliteTuningTest(TestCase):
+    """Test the SQLite backend's connection pragmas"""
+
+    def connect(self, pragmas):
+        """Open a connection to a new database file with the given pragmas"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper = SqliteDatabaseWrapper({
+            **connection.settings_dict,
+            'NAME': os.path.join(directory.name, 'db.sqlite3'),
+            'OPTIONS': {'pragmas': pragmas, 'transaction_mode': 'IMMEDIATE'},
+        }, alias='tuning')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_settings_apply_to_connection(self):
+        """Test the configured pragmas and transaction mode are set on the default connection"""
+        options = settings.DATABASES['default']['OPTIONS']
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], int(options['pragmas']['busy_timeout']))
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], int(options['pragmas']['cache_size']))
+        self.assertEqual(connection.transaction_mode, options['transaction_mode'])
+
+    def test_pragmas(self):
+        """Test a file database is opened in WAL mode with the other pragmas set"""
+        wrapper = self.connect({
+            'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 2500, 'temp_store': 'MEMORY',
+        })
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 2500)
+        self.assertEqual(self.pragma(wrapper, 'temp_store'), 2)
+
+    def test_empty_pragma_keeps_default(self):
+        """Test an empty value leaves SQLite's default"""
+        wrapper = self.connect({'journal_mode': '', 'synchronous': ' '})
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'delete')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 2)
+
+    def test_invalid_pragma(self):
+        """Test unknown pragmas and values that aren't a keyword or number are rejected"""
+        for pragmas in [{'journal_mode': 'WAL; DROP TABLE auth_user'}, {'key': 'secret'}]:
+            with self.subTest(pragmas=pragmas), self.assertRaises(ImproperlyConfigured):
+                self.connect(pragmas)
+
+
 # URL Tests
 class UrlsTest(TestCase):
     """Tests for URL routing."""
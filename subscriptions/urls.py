@@ -34,4 +34,15 @@ urlpatterns = [
     path('categories/import/csv/', views.import_categories_csv, name='import-categories-csv'),
     path('currencies/export/csv/', views.export_currencies_csv, name='export-currencies-csv'),
     path('currencies/import/csv/', views.import_currencies_csv, name='import-currencies-csv'),
+    path('imports/<uuid:import_id>/', views.import_preview, name='import-preview'),
+    path('subscriptions/export/csv/job/', views.export_subscriptions_job, name='export-subscriptions-job'),
+
+    # Whole-account backup and restore
+    path('settings/backup/', views.backup, name='backup'),
+    path('settings/backup/restore/', views.restore_backup, name='restore-backup'),
+
+    # Background jobs
+    path('jobs/<int:pk>/', views.job_detail, name='job-detail'),
+    path('jobs/<int:pk>/progress/', views.job_progress, name='job-progress'),
+    path('jobs/<int:pk>/download/', views.job_download, name='job-download'),
 ]
@@ -1,8 +1,432 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from dateutil.relativedelta import relativedelta
+from django.conf import settings
 import calendar
 import csv
+import heapq
 import io
+from contextlib import contextmanager
+from itertools import islice, repeat
+from operator import itemgetter
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - the scalar functions are used instead
+    np = None
+
+# Number of days between renewals for day-based renewal periods
+RENEWAL_PERIOD_DAYS = {
+    'weekly': 7,
+}
+
+# Number of months between renewals for month-based renewal periods
+RENEWAL_PERIOD_MONTHS = {
+    'monthly': 1,
+    'quarterly': 3,
+    'yearly': 12,
+    'biennial': 24,
+}
+
+# Integer codes for renewal periods used by the batch (NumPy) functions
+RENEWAL_PERIOD_CODES = {
+    'weekly': 0,
+    'monthly': 1,
+    'quarterly': 2,
+    'yearly': 3,
+    'biennial': 4,
+}
+
+# Minimum number of subscriptions before occurrences_between uses the batch path
+BATCH_RENEWAL_THRESHOLD = 500
+
+# Number of rows fetched from the database at a time when exporting CSV files
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _month_index(value):
+    """
+    Return the number of months between year 0 and the month of a date.
+    """
+    return value.year * 12 + value.month - 1
+
+
+def _renewal_in_month(anchor_day, month_index):
+    """
+    Return the renewal date for an anchor day in the month with the given index.
+
+    If the anchor day doesn't exist in that month (e.g., February 30th),
+    the last valid date of the month is used for that occurrence only.
+    """
+    year, month = divmod(month_index, 12)
+    last_day = calendar.monthrange(year, month + 1)[1]
+    return date(year, month + 1, min(anchor_day, last_day))
+
+
+def next_renewal_on_or_after(start_date, renewal_period, on_or_after):
+    """
+    Return the first renewal date that falls on or after a given date.
+
+    The result is computed arithmetically from the start date, so the cost does
+    not depend on how long ago the subscription started.
+
+    Args:
+        start_date: The start date of the subscription
+        renewal_period: One of the Subscription.RENEWAL_CHOICES keys
+        on_or_after: The earliest date to consider
+
+    Returns:
+        A datetime.date object, or None if the renewal period is unknown
+    """
+    if renewal_period in RENEWAL_PERIOD_DAYS:
+        step = RENEWAL_PERIOD_DAYS[renewal_period]
+        if on_or_after <= start_date:
+            return start_date
+
+        # Round the number of elapsed periods up to the next whole period
+        periods = -(-(on_or_after - start_date).days // step)
+        return start_date + timedelta(days=periods * step)
+
+    if renewal_period in RENEWAL_PERIOD_MONTHS:
+        step = RENEWAL_PERIOD_MONTHS[renewal_period]
+        if on_or_after <= start_date:
+            return start_date
+
+        # Jump straight to the first renewal month on or after the target month
+        start_index = _month_index(start_date)
+        periods = -(-(_month_index(on_or_after) - start_index) // step)
+        renewal_date = _renewal_in_month(start_date.day, start_index + periods * step)
+
+        # The renewal in the target month may already have passed
+        if renewal_date < on_or_after:
+            renewal_date = _renewal_in_month(start_date.day, start_index + (periods + 1) * step)
+
+        return renewal_date
+
+    return None
+
+
+def iter_renewal_dates(start_date, renewal_period, on_or_after, until=None):
+    """
+    Yield renewal dates in ascending order, starting on or after a given date.
+
+    Args:
+        start_date: The start date of the subscription
+        renewal_period: One of the Subscription.RENEWAL_CHOICES keys
+        on_or_after: The earliest date to yield
+        until: The last date to yield (inclusive), or None to yield indefinitely
+
+    Yields:
+        datetime.date objects
+    """
+    first_date = next_renewal_on_or_after(start_date, renewal_period, on_or_after)
+    if first_date is None:
+        return
+
+    if renewal_period in RENEWAL_PERIOD_DAYS:
+        step = timedelta(days=RENEWAL_PERIOD_DAYS[renewal_period])
+        renewal_date = first_date
+        while until is None or renewal_date <= until:
+            yield renewal_date
+            renewal_date += step
+    else:
+        # Always clamp from the original anchor day, so a 31st subscription that
+        # falls on 30th April still renews on 31st May
+        step = RENEWAL_PERIOD_MONTHS[renewal_period]
+        month_index = _month_index(first_date)
+        renewal_date = first_date
+        while until is None or renewal_date <= until:
+            yield renewal_date
+            month_index += step
+            renewal_date = _renewal_in_month(start_date.day, month_index)
+
+
+def renewal_dates_between(start_date, renewal_period, first_date, last_date):
+    """
+    Return all renewal dates between two dates (inclusive).
+
+    Args:
+        start_date: The start date of the subscription
+        renewal_period: One of the Subscription.RENEWAL_CHOICES keys
+        first_date: The first date of the range
+        last_date: The last date of the range
+
+    Returns:
+        A list of datetime.date objects in ascending order
+    """
+    return list(iter_renewal_dates(start_date, renewal_period, first_date, last_date))
+
+
+def is_renewal_on(start_date, renewal_period, check_date):
+    """
+    Check if a renewal falls on a specific date.
+
+    Args:
+        start_date: The start date of the subscription
+        renewal_period: One of the Subscription.RENEWAL_CHOICES keys
+        check_date: The date to check
+
+    Returns:
+        True if a renewal falls on check_date, False otherwise
+    """
+    return next_renewal_on_or_after(start_date, renewal_period, check_date) == check_date
+
+
+def iter_subscription_renewals(subscription, on_or_after, until=None):
+    """
+    Yield the renewal dates of a subscription in ascending order.
+
+    If the subscription is cancelled, no renewal dates after the cancellation
+    date are yielded.
+
+    Args:
+        subscription: The subscription to expand
+        on_or_after: The earliest date to yield
+        until: The last date to yield (inclusive), or None to yield indefinitely
+
+    Returns:
+        An iterator of datetime.date objects
+    """
+    if hasattr(subscription, 'status') and subscription.status == 'cancelled' and subscription.cancellation_date:
+        if until is None or until > subscription.cancellation_date:
+            until = subscription.cancellation_date
+
+    return iter_renewal_dates(subscription.start_date, subscription.renewal_period, on_or_after, until)
+
+
+def occurrences_between(subscriptions, first_date, last_date, first_only=False):
+    """
+    Yield every renewal of a group of subscriptions between two dates in date order.
+
+    Each subscription contributes a lazy iterator of its own renewal dates, and
+    the iterators are combined with a heap merge, so the cost depends on the
+    number of renewals in the range rather than the number of days in it.
+    Renewals on the same date are yielded in the order of the subscriptions.
+
+    Args:
+        subscriptions: An iterable of Subscription objects
+        first_date: The first date of the range
+        last_date: The last date of the range (inclusive)
+        first_only: If True, only yield the first renewal of each subscription
+
+    Returns:
+        An iterator of (subscription, renewal_date) tuples
+    """
+    if np is not None and not first_only:
+        subscriptions = list(subscriptions)
+        if len(subscriptions) >= BATCH_RENEWAL_THRESHOLD:
+            return _batch_occurrences_between(subscriptions, first_date, last_date)
+
+    iterators = []
+    for subscription in subscriptions:
+        renewal_dates = iter_subscription_renewals(subscription, first_date, last_date)
+        if first_only:
+            renewal_dates = islice(renewal_dates, 1)
+        iterators.append(zip(repeat(subscription), renewal_dates))
+
+    return heapq.merge(*iterators, key=itemgetter(1))
+
+
+def get_occurrence_horizon(today=None, margin_months=0):
+    """
+    Return the date range covered by the materialized RenewalOccurrence table.
+
+    Args:
+        today: The date the horizon is centred on, defaults to today
+        margin_months: Number of months to trim from both ends of the horizon, so
+            that readers still trust the table if a nightly roll is missed
+
+    Returns:
+        A tuple (first_date, last_date)
+    """
+    today = today or date.today()
+    first_date = today - relativedelta(months=settings.RENEWAL_OCCURRENCE_MONTHS_BACK - margin_months)
+    last_date = today + relativedelta(months=settings.RENEWAL_OCCURRENCE_MONTHS_FORWARD - margin_months)
+    return first_date, last_date
+
+
+def renewal_occurrences(user, first_date, last_date, first_only=False, **subscription_filters):
+    """
+    Return a user's renewals between two dates in date order.
+
+    Ranges inside the materialized horizon are answered with one indexed query
+    on RenewalOccurrence (user, date), plus one query to load the subscriptions
+    that renew. Ranges outside it, or past the date the roll_renewal_occurrences
+    command last expanded the table to, fall back to expanding the
+    subscriptions with occurrences_between.
+
+    Args:
+        user: The user whose renewals to return
+        first_date: The first date of the range
+        last_date: The last date of the range (inclusive)
+        first_only: If True, only return the first renewal of each subscription
+        **subscription_filters: Extra Subscription field lookups, e.g. status='active'
+
+    Returns:
+        A list of (subscription, renewal_date) tuples
+    """
+    from .models import RenewalOccurrence, RenewalOccurrenceHorizon, Subscription
+
+    horizon_first, horizon_last = get_occurrence_horizon(margin_months=1)
+    rolled_to = RenewalOccurrenceHorizon.get_last_date()
+    if first_date < horizon_first or last_date > horizon_last or rolled_to is None or rolled_to < last_date:
+        subscriptions = Subscription.objects.filter(user=user, **subscription_filters).order_by('pk')
+        return list(occurrences_between(subscriptions, first_date, last_date, first_only=first_only))
+
+    occurrences = RenewalOccurrence.objects.filter(
+        user=user,
+        date__range=(first_date, last_date),
+        **{f'subscription__{lookup}': value for lookup, value in subscription_filters.items()}
+    ).order_by('date', 'subscription_id').values_list('subscription_id', 'date')
+
+    renewals = []
+    seen = set()
+    for subscription_id, renewal_date in occurrences:
+        if first_only:
+            if subscription_id in seen:
+                continue
+            seen.add(subscription_id)
+        renewals.append((subscription_id, renewal_date))
+
+    # Load each subscription once, rather than once per occurrence
+    subscriptions = Subscription.objects.in_bulk({subscription_id for subscription_id, _ in renewals})
+    return [(subscriptions[subscription_id], renewal_date) for subscription_id, renewal_date in renewals]
+
+
+def subscription_columns(subscriptions):
+    """
+    Convert subscriptions into the column arrays used by batch_renewal_dates.
+
+    Args:
+        subscriptions: A list of Subscription objects
+
+    Returns:
+        A dictionary with 'start_dates', 'period_codes', 'anchor_days' and
+        'until_dates' NumPy arrays, one element per subscription. Unknown
+        renewal periods get the code -1, and subscriptions that are not
+        cancelled get NaT as their until date.
+    """
+    start_dates = np.array([subscription.start_date for subscription in subscriptions], dtype='datetime64[D]')
+    until_dates = np.array([
+        subscription.cancellation_date
+        if getattr(subscription, 'status', None) == 'cancelled' and subscription.cancellation_date
+        else None
+        for subscription in subscriptions
+    ], dtype='datetime64[D]')
+
+    return {
+        'start_dates': start_dates,
+        'period_codes': np.array(
+            [RENEWAL_PERIOD_CODES.get(subscription.renewal_period, -1) for subscription in subscriptions],
+            dtype=np.int64
+        ),
+        'anchor_days': np.array([subscription.start_date.day for subscription in subscriptions], dtype=np.int64),
+        'until_dates': until_dates,
+    }
+
+
+def _expand_periods(rows, first_periods, last_periods):
+    """
+    Expand each row into one element per period index in [first, last].
+
+    Returns the repeated row indices and the matching period indices.
+    """
+    counts = np.maximum(last_periods - first_periods + 1, 0)
+    total = int(counts.sum())
+    if total == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+
+    row_indices = np.repeat(rows, counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return row_indices, np.repeat(first_periods, counts) + offsets
+
+
+def batch_renewal_dates(start_dates, period_codes, anchor_days, first_date, last_date, until_dates=None):
+    """
+    Return every renewal date of many subscriptions between two dates using NumPy.
+
+    This is the vectorized equivalent of calling renewal_dates_between for each
+    subscription, including the end-of-month clamping rule.
+
+    Args:
+        start_dates: datetime64[D] array of start dates
+        period_codes: Integer array of RENEWAL_PERIOD_CODES values
+        anchor_days: Integer array of the day of the month each subscription renews on
+        first_date: The first date of the range
+        last_date: The last date of the range (inclusive)
+        until_dates: Optional datetime64[D] array of last renewal dates, NaT for none
+
+    Returns:
+        A tuple (indices, dates) of NumPy arrays, sorted by date and then by
+        index, where indices are positions in the input arrays and dates are
+        datetime64[D] renewal dates.
+    """
+    start_dates = np.asarray(start_dates, dtype='datetime64[D]')
+    period_codes = np.asarray(period_codes, dtype=np.int64)
+    anchor_days = np.asarray(anchor_days, dtype=np.int64)
+    first = np.datetime64(first_date, 'D')
+    last = np.datetime64(last_date, 'D')
+
+    # Weekly renewals are a fixed number of days apart
+    weekly_rows = np.flatnonzero(period_codes == RENEWAL_PERIOD_CODES['weekly'])
+    weekly_starts = start_dates[weekly_rows]
+    step = RENEWAL_PERIOD_DAYS['weekly']
+    first_weeks = np.maximum(-(-(first - weekly_starts).astype(np.int64) // step), 0)
+    last_weeks = (last - weekly_starts).astype(np.int64) // step
+    weekly_indices, weeks = _expand_periods(weekly_rows, first_weeks, last_weeks)
+    weekly_dates = start_dates[weekly_indices] + (weeks * step).astype('timedelta64[D]')
+
+    # Month-based renewals are a fixed number of months apart, clamped to the month end
+    month_steps = np.zeros(len(period_codes), dtype=np.int64)
+    for renewal_period, months in RENEWAL_PERIOD_MONTHS.items():
+        month_steps[period_codes == RENEWAL_PERIOD_CODES[renewal_period]] = months
+    monthly_rows = np.flatnonzero(month_steps > 0)
+    steps = month_steps[monthly_rows]
+    start_months = start_dates[monthly_rows].astype('datetime64[M]').astype(np.int64)
+    first_month = first.astype('datetime64[M]').astype(np.int64)
+    last_month = last.astype('datetime64[M]').astype(np.int64)
+    first_periods = np.maximum(-(-(first_month - start_months) // steps), 0)
+    last_periods = (last_month - start_months) // steps
+    monthly_positions, periods = _expand_periods(np.arange(len(monthly_rows)), first_periods, last_periods)
+    monthly_indices = monthly_rows[monthly_positions]
+
+    months = (start_months[monthly_positions] + periods * steps[monthly_positions]).astype('datetime64[M]')
+    days_in_month = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64)
+    days = np.minimum(anchor_days[monthly_indices], days_in_month)
+    monthly_dates = months.astype('datetime64[D]') + (days - 1).astype('timedelta64[D]')
+
+    indices = np.concatenate([weekly_indices, monthly_indices])
+    dates = np.concatenate([weekly_dates, monthly_dates])
+
+    # Clamping can move the first or last renewal of a month outside the range
+    keep = (dates >= first) & (dates <= last) & (dates >= start_dates[indices])
+    if until_dates is not None:
+        until = np.asarray(until_dates, dtype='datetime64[D]')[indices]
+        keep &= np.isnat(until) | (dates <= until)
+    indices = indices[keep]
+    dates = dates[keep]
+
+    order = np.lexsort((indices, dates))
+    return indices[order], dates[order]
+
+
+def _batch_occurrences_between(subscriptions, first_date, last_date):
+    """
+    Yield (subscription, renewal_date) pairs in date order using batch_renewal_dates.
+    """
+    columns = subscription_columns(subscriptions)
+    indices, dates = batch_renewal_dates(
+        columns['start_dates'],
+        columns['period_codes'],
+        columns['anchor_days'],
+        first_date,
+        last_date,
+        until_dates=columns['until_dates']
+    )
+
+    for index, renewal_date in zip(indices.tolist(), dates.astype(object)):
+        yield subscriptions[index], renewal_date
+
 
 def calculate_next_renewal_date(start_date, renewal_period, target_year, target_month):
     """
@@ -14,99 +438,20 @@ def calculate_next_renewal_date(start_date, renewal_period, target_year, target_
 
     Args:
         start_date: The start date of the subscription
-        renewal_period: The renewal period ('weekly', 'monthly', 'quarterly', 'yearly')
+        renewal_period: The renewal period ('weekly', 'monthly', 'quarterly', 'yearly', 'biennial')
         target_year: The year to calculate the renewal date for
         target_month: The month to calculate the renewal date for
 
     Returns:
         A list of datetime.date objects representing the renewal dates in the target month
     """
-    renewal_dates = []
-
-    if renewal_period == 'weekly':
-        # For weekly, calculate all renewal dates in the month
-        current_date = start_date
-        while current_date.year < target_year or (current_date.year == target_year and current_date.month < target_month):
-            current_date += timedelta(days=7)
-
-        while current_date.year == target_year and current_date.month == target_month:
-            renewal_dates.append(current_date)
-            current_date += timedelta(days=7)
-
-    elif renewal_period == 'monthly':
-        # For monthly, check if the start day is in this month
-        day = start_date.day
-        # Get the last day of the target month
-        last_day = calendar.monthrange(target_year, target_month)[1]
-
-        # If the start day is greater than the last day of the target month,
-        # use the last day of the target month
-        if day > last_day:
-            renewal_date = datetime(target_year, target_month, last_day).date()
-        else:
-            renewal_date = datetime(target_year, target_month, day).date()
-
-        # Only add the renewal date if it's after the start date
-        if renewal_date >= start_date:
-            renewal_dates.append(renewal_date)
-
-    elif renewal_period == 'quarterly':
-        # For quarterly, check if this month is a quarterly renewal month
-        months_since_start = (target_year - start_date.year) * 12 + target_month - start_date.month
-        if months_since_start % 3 == 0:
-            day = start_date.day
-            # Get the last day of the target month
-            last_day = calendar.monthrange(target_year, target_month)[1]
-
-            # If the start day is greater than the last day of the target month,
-            # use the last day of the target month
-            if day > last_day:
-                renewal_date = datetime(target_year, target_month, last_day).date()
-            else:
-                renewal_date = datetime(target_year, target_month, day).date()
-
-            # Only add the renewal date if it's after the start date
-            if renewal_date >= start_date:
-                renewal_dates.append(renewal_date)
-
-    elif renewal_period == 'yearly':
-        # For yearly, check if the start month is this month
-        if start_date.month == target_month:
-            day = start_date.day
-            # Get the last day of the target month
-            last_day = calendar.monthrange(target_year, target_month)[1]
-
-            # If the start day is greater than the last day of the target month,
-            # use the last day of the target month
-            if day > last_day:
-                renewal_date = datetime(target_year, target_month, last_day).date()
-            else:
-                renewal_date = datetime(target_year, target_month, day).date()
-
-            # Only add the renewal date if it's after the start date
-            if renewal_date >= start_date:
-                renewal_dates.append(renewal_date)
-
-    elif renewal_period == 'biennial':
-        # For biennial, check if the start month is this month and if this is a biennial year
-        years_since_start = target_year - start_date.year
-        if start_date.month == target_month and years_since_start % 2 == 0:
-            day = start_date.day
-            # Get the last day of the target month
-            last_day = calendar.monthrange(target_year, target_month)[1]
-
-            # If the start day is greater than the last day of the target month,
-            # use the last day of the target month
-            if day > last_day:
-                renewal_date = datetime(target_year, target_month, last_day).date()
-            else:
-                renewal_date = datetime(target_year, target_month, day).date()
-
-            # Only add the renewal date if it's after the start date
-            if renewal_date >= start_date:
-                renewal_dates.append(renewal_date)
-
-    return renewal_dates
+    last_day = calendar.monthrange(target_year, target_month)[1]
+    return renewal_dates_between(
+        start_date,
+        renewal_period,
+        date(target_year, target_month, 1),
+        date(target_year, target_month, last_day)
+    )
 
 def is_renewal_date(subscription, check_date):
     """
@@ -126,143 +471,71 @@ def is_renewal_date(subscription, check_date):
     Returns:
         True if the subscription renews on the check_date, False otherwise
     """
-    start_date = subscription.start_date
-    renewal_period = subscription.renewal_period
-
     # If the subscription is cancelled and check_date is after the cancellation date, return False
     if hasattr(subscription, 'status') and subscription.status == 'cancelled' and subscription.cancellation_date:
         if check_date > subscription.cancellation_date:
             return False
 
-    if renewal_period == 'weekly':
-        # For weekly, check if this day is a renewal date
-        current_date = start_date
-        while current_date <= check_date:
-            if current_date == check_date:
-                return True
-            current_date += timedelta(days=7)
-        return False
-
-    elif renewal_period == 'monthly':
-        # For monthly, check if the day of the month matches
-        if start_date.day == check_date.day and check_date >= start_date:
-            return True
-
-        # Check if it's the last day of the month and the subscription's day doesn't exist in this month
-        last_day_current_month = calendar.monthrange(check_date.year, check_date.month)[1]
-        if check_date.day == last_day_current_month and check_date >= start_date:
-            # If the start day is greater than the last day of the current month,
-            # this is a renewal date
-            if start_date.day > last_day_current_month:
-                return True
-
-        return False
-
-    elif renewal_period == 'quarterly':
-        # For quarterly, check if this is a quarterly renewal date
-        months_since_start = (check_date.year - start_date.year) * 12 + check_date.month - start_date.month
-
-        if months_since_start % 3 == 0:
-            # Check if the day of the month matches
-            if start_date.day == check_date.day and check_date >= start_date:
-                return True
-
-            # Check if it's the last day of the month and the subscription's day doesn't exist in this month
-            last_day_current_month = calendar.monthrange(check_date.year, check_date.month)[1]
-            if check_date.day == last_day_current_month and check_date >= start_date:
-                # If the start day is greater than the last day of the current month,
-                # this is a renewal date
-                if start_date.day > last_day_current_month:
-                    return True
-
-        return False
-
-    elif renewal_period == 'yearly':
-        # For yearly, check if the month and day match
-        if start_date.month == check_date.month:
-            # Check if the day of the month matches
-            if start_date.day == check_date.day and check_date >= start_date:
-                return True
-
-            # Check if it's the last day of the month and the subscription's day doesn't exist in this month
-            last_day = calendar.monthrange(check_date.year, check_date.month)[1]
-            if check_date.day == last_day and check_date >= start_date:
-                # If the start day is greater than the last day of this month,
-                # this is a renewal date
-                if start_date.day > last_day:
-                    return True
-
-        return False
-
-    elif renewal_period == 'biennial':
-        # For biennial, check if the month and day match and if this is a biennial year
-        years_since_start = check_date.year - start_date.year
-        if years_since_start % 2 == 0 and start_date.month == check_date.month:
-            # Check if the day of the month matches
-            if start_date.day == check_date.day and check_date >= start_date:
-                return True
-
-            # Check if it's the last day of the month and the subscription's day doesn't exist in this month
-            last_day = calendar.monthrange(check_date.year, check_date.month)[1]
-            if check_date.day == last_day and check_date >= start_date:
-                # If the start day is greater than the last day of this month,
-                # this is a renewal date
-                if start_date.day > last_day:
-                    return True
-
-        return False
-
-    return False
-
-def generate_subscriptions_csv(subscriptions):
-    """
-    Generate a CSV file from a queryset of subscriptions.
+    return is_renewal_on(subscription.start_date, subscription.renewal_period, check_date)
+
+class Echo:
+    """
+    A file-like object that hands back what is written to it, so csv.writer
+    can produce one line at a time for a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+def generate_subscriptions_csv(subscriptions, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Generate a CSV file from a queryset of subscriptions, one line at a time.
+
+    Rows are read with a single query through values_list().iterator(), so
+    memory use doesn't grow with the number of subscriptions.
 
     Args:
         subscriptions: A queryset of Subscription objects
+        chunk_size: Number of rows fetched from the database at a time
 
     Returns:
-        A string containing the CSV data
+        An iterator of CSV lines
     """
-    output = io.StringIO()
-    writer = csv.writer(output)
+    writer = csv.writer(Echo())
 
     # Write header row
-    writer.writerow(['name', 'category', 'cost', 'currency', 'renewal_period', 'start_date', 'url', 'notes', 'status', 'cancellation_date'])
+    yield writer.writerow(['name', 'category', 'cost', 'currency', 'renewal_period', 'start_date', 'url', 'notes', 'status', 'cancellation_date'])
 
     # Write data rows
-    for subscription in subscriptions:
-        category_name = subscription.category.name if subscription.category else ''
-        cancellation_date = subscription.cancellation_date.isoformat() if subscription.cancellation_date else ''
-        writer.writerow([
-            subscription.name,
-            category_name,
-            subscription.cost,
-            subscription.currency,
-            subscription.renewal_period,
-            subscription.start_date.isoformat(),
-            subscription.url or '',
-            subscription.notes or '',
-            subscription.status,
-            cancellation_date
+    rows = subscriptions.values_list(
+        'name', 'category__name', 'cost', 'currency', 'renewal_period', 'start_date',
+        'url', 'notes', 'status', 'cancellation_date'
+    )
+    for name, category_name, cost, currency, renewal_period, start_date, url, notes, status, cancellation_date in rows.iterator(chunk_size=chunk_size):
+        yield writer.writerow([
+            name,
+            category_name or '',
+            cost,
+            currency,
+            renewal_period,
+            start_date.isoformat(),
+            url or '',
+            notes or '',
+            status,
+            cancellation_date.isoformat() if cancellation_date else ''
         ])
 
-    return output.getvalue()
-
 def parse_subscriptions_csv(csv_file):
     """
-    Parse a CSV file containing subscription data.
+    Parse a CSV file containing subscription data, one row at a time.
 
     Args:
-        csv_file: A file-like object containing CSV data
+        csv_file: A text file-like object containing CSV data, e.g. from open_csv_upload()
 
-    Returns:
-        A list of dictionaries, each representing a subscription
+    Yields:
+        Dictionaries, each representing a subscription
     """
-    reader = csv.DictReader(csv_file)
-    subscriptions = []
-
-    for row in reader:
+    for row in csv.DictReader(csv_file):
         # Convert empty strings to None
         for key, value in row.items():
             if value == '':
@@ -284,96 +557,77 @@ def parse_subscriptions_csv(csv_file):
                 # If date parsing fails, set to None
                 row['cancellation_date'] = None
 
-        subscriptions.append(row)
+        yield row
 
-    return subscriptions
-
-def generate_categories_csv(categories):
+def generate_categories_csv(categories, chunk_size=EXPORT_CHUNK_SIZE):
     """
-    Generate a CSV file from a queryset of categories.
+    Generate a CSV file from a queryset of categories, one line at a time.
 
     Args:
         categories: A queryset of Category objects
+        chunk_size: Number of rows fetched from the database at a time
 
     Returns:
-        A string containing the CSV data
+        An iterator of CSV lines
     """
-    output = io.StringIO()
-    writer = csv.writer(output)
+    writer = csv.writer(Echo())
 
     # Write header row
-    writer.writerow(['name'])
+    yield writer.writerow(['name'])
 
     # Write data rows
-    for category in categories:
-        writer.writerow([category.name])
-
-    return output.getvalue()
+    for name in categories.values_list('name', flat=True).iterator(chunk_size=chunk_size):
+        yield writer.writerow([name])
 
 def parse_categories_csv(csv_file):
     """
-    Parse a CSV file containing category data.
+    Parse a CSV file containing category data, one row at a time.
 
     Args:
-        csv_file: A file-like object containing CSV data
+        csv_file: A text file-like object containing CSV data, e.g. from open_csv_upload()
 
-    Returns:
-        A list of dictionaries, each representing a category
+    Yields:
+        Dictionaries, each representing a category
     """
-    reader = csv.DictReader(csv_file)
-    categories = []
-
-    for row in reader:
+    for row in csv.DictReader(csv_file):
         # Convert empty strings to None
         for key, value in row.items():
             if value == '':
                 row[key] = None
 
-        categories.append(row)
-
-    return categories
+        yield row
 
-def generate_currencies_csv(currencies):
+def generate_currencies_csv(currencies, chunk_size=EXPORT_CHUNK_SIZE):
     """
-    Generate a CSV file from a queryset of currencies.
+    Generate a CSV file from a queryset of currencies, one line at a time.
 
     Args:
         currencies: A queryset of Currency objects
+        chunk_size: Number of rows fetched from the database at a time
 
     Returns:
-        A string containing the CSV data
+        An iterator of CSV lines
     """
-    output = io.StringIO()
-    writer = csv.writer(output)
+    writer = csv.writer(Echo())
 
     # Write header row
-    writer.writerow(['code', 'name', 'symbol', 'is_default'])
+    yield writer.writerow(['code', 'name', 'symbol', 'is_default'])
 
     # Write data rows
-    for currency in currencies:
-        writer.writerow([
-            currency.code,
-            currency.name,
-            currency.symbol,
-            currency.is_default
-        ])
-
-    return output.getvalue()
+    for row in currencies.values_list('code', 'name', 'symbol', 'is_default').iterator(chunk_size=chunk_size):
+        yield writer.writerow(row)
 
 def parse_currencies_csv(csv_file):
     """
-    Parse a CSV file containing currency data.
+    Parse a CSV file containing currency data, one row at a time.
 
     Args:
-        csv_file: A file-like object containing CSV data
+        csv_file: A text file-like object containing CSV data, e.g. from open_csv_upload()
 
-    Returns:
-        A list of dictionaries, each representing a currency
+    Yields:
+        Dictionaries, each representing a currency
     """
-    reader = csv.DictReader(csv_file)
-    currencies = []
-
-    for row in reader:
+    for row in csv.DictReader(csv_file):
         # Convert empty strings to None
         for key, value in row.items():
             if value == '':
@@ -386,136 +640,56 @@ def parse_currencies_csv(csv_file):
             else:
                 row['is_default'] = False
 
-        currencies.append(row)
+        yield row
+
+@contextmanager
+def open_csv_upload(uploaded_file, encoding='utf-8'):
+    """
+    Open an uploaded file as text for the CSV parsers.
+
+    The file is decoded as it is read, a chunk at a time, from Django's
+    temporary upload file (or memory, for small uploads), so it is never
+    held in memory as a whole.
 
-    return currencies
+    Args:
+        uploaded_file: An UploadedFile from request.FILES
+        encoding: The file's text encoding
 
-def get_next_billing_date(subscription):
+    Yields:
+        A text file-like object
+    """
+    uploaded_file.seek(0)
+    text_file = io.TextIOWrapper(uploaded_file.file, encoding=encoding, newline='')
+    try:
+        yield text_file
+    finally:
+        # Leave closing the upload itself to Django
+        text_file.detach()
+
+def get_next_billing_date(subscription, today=None):
     """
     Calculate the next billing date for a subscription from today.
     If the subscription is cancelled, returns None if today is after the cancellation date.
 
     Args:
         subscription: A Subscription object
+        today: The date to calculate from (default: today)
 
     Returns:
         A datetime.date object representing the next billing date, or None if the subscription is cancelled
         and today is after the cancellation date.
     """
-    from datetime import date
-    today = date.today()
-    start_date = subscription.start_date
-    renewal_period = subscription.renewal_period
+    today = today or date.today()
 
     # If the subscription is cancelled and today is after the cancellation date, return None
     if hasattr(subscription, 'status') and subscription.status == 'cancelled' and subscription.cancellation_date:
         if today > subscription.cancellation_date:
             return None
 
-    if renewal_period == 'weekly':
-        # For weekly, find the next weekly date from today
-        days_since_start = (today - start_date).days
-        days_until_next = 7 - (days_since_start % 7)
-        if days_until_next == 7:
-            days_until_next = 0
-        return today + timedelta(days=days_until_next)
+    next_date = next_renewal_on_or_after(subscription.start_date, subscription.renewal_period, today)
 
-    elif renewal_period == 'monthly':
-        # For monthly, find the next occurrence of the start day
-        next_date = today.replace(day=1)  # Start from the first day of the current month
+    # Default fallback for unknown renewal periods
+    if next_date is None:
+        return subscription.start_date
 
-        while True:
-            # Try to set the day to the start day
-            try:
-                next_date = next_date.replace(day=start_date.day)
-            except ValueError:
-                # If the day doesn't exist in this month, use the last day
-                last_day = calendar.monthrange(next_date.year, next_date.month)[1]
-                next_date = next_date.replace(day=last_day)
-
-            # If the date is in the future, we found our next billing date
-            if next_date >= today:
-                return next_date
-
-            # Otherwise, move to the next month
-            if next_date.month == 12:
-                next_date = next_date.replace(year=next_date.year + 1, month=1, day=1)
-            else:
-                next_date = next_date.replace(month=next_date.month + 1, day=1)
-
-    elif renewal_period == 'quarterly':
-        # For quarterly, find the next quarterly date from the start date
-        next_date = today.replace(day=1)  # Start from the first day of the current month
-
-        while True:
-            # Calculate months since start
-            months_since_start = (next_date.year - start_date.year) * 12 + next_date.month - start_date.month
-
-            # If this is a quarterly month (0, 3, 6, 9 months from start)
-            if months_since_start % 3 == 0:
-                # Try to set the day to the start day
-                try:
-                    next_date = next_date.replace(day=start_date.day)
-                except ValueError:
-                    # If the day doesn't exist in this month, use the last day
-                    last_day = calendar.monthrange(next_date.year, next_date.month)[1]
-                    next_date = next_date.replace(day=last_day)
-
-                # If the date is in the future, we found our next billing date
-                if next_date >= today:
-                    return next_date
-
-            # Move to the next month
-            if next_date.month == 12:
-                next_date = next_date.replace(year=next_date.year + 1, month=1, day=1)
-            else:
-                next_date = next_date.replace(month=next_date.month + 1, day=1)
-
-    elif renewal_period == 'yearly':
-        # For yearly, find the next yearly date from the start date
-        next_date = today.replace(month=start_date.month, day=1)
-
-        # If we're already past this year's date, move to next year
-        if today.month > start_date.month or (today.month == start_date.month and today.day > start_date.day):
-            next_date = next_date.replace(year=today.year + 1)
-        else:
-            next_date = next_date.replace(year=today.year)
-
-        # Try to set the day to the start day
-        try:
-            next_date = next_date.replace(day=start_date.day)
-        except ValueError:
-            # If the day doesn't exist in this month, use the last day
-            last_day = calendar.monthrange(next_date.year, next_date.month)[1]
-            next_date = next_date.replace(day=last_day)
-
-        return next_date
-
-    elif renewal_period == 'biennial':
-        # For biennial, find the next biennial date from the start date
-        next_date = today.replace(month=start_date.month, day=1)
-
-        # Calculate years since start
-        years_since_start = today.year - start_date.year
-
-        # If we're in a biennial year but haven't reached the date yet
-        if years_since_start % 2 == 0 and (today.month < start_date.month or 
-                                          (today.month == start_date.month and today.day < start_date.day)):
-            next_date = next_date.replace(year=today.year)
-        else:
-            # Move to the next biennial year - always add 2 years to ensure biennial renewals
-            next_year = today.year + (2 - (years_since_start % 2))
-            next_date = next_date.replace(year=next_year)
-
-        # Try to set the day to the start day
-        try:
-            next_date = next_date.replace(day=start_date.day)
-        except ValueError:
-            # If the day doesn't exist in this month, use the last day
-            last_day = calendar.monthrange(next_date.year, next_date.month)[1]
-            next_date = next_date.replace(day=last_day)
-
-        return next_date
-
-    # Default fallback
-    return start_date
+    return next_date
@@ -0,0 +1,101 @@
+"""
+Per-user data versions for cache invalidation.
+
+Saving or deleting a Subscription, Category or Currency bumps the owner's
+UserDataVersion (see signals.py). Anything cached from a user's data should
+use user_cache_key(), which embeds the current version, so stale entries are
+never read again and simply expire from the cache. Nothing needs to be
+deleted or scanned, which works with any cache backend.
+
+Bulk changes that bypass model signals, such as bulk_create() or update(),
+must run inside bulk_data_change() or call bump_data_version() themselves.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db.models import F
+from django.utils import timezone
+
+from .models import UserDataVersion
+
+_state = threading.local()
+
+
+def get_data_version(user):
+    """
+    Get the current data version of a user.
+
+    Args:
+        user: The user, or their primary key
+
+    Returns:
+        The user's data version as an integer
+    """
+    user_id = getattr(user, 'pk', user)
+    data_version, _ = UserDataVersion.objects.get_or_create(user_id=user_id)
+    return data_version.version
+
+
+def bump_data_version(user_id):
+    """
+    Increase the data version of a user, invalidating their cached pages.
+
+    Inside bulk_data_change() the bump is postponed until the block ends.
+    If the user has no version yet, nothing can have been cached for them,
+    so nothing is written.
+
+    Args:
+        user_id: The primary key of the user whose data changed
+    """
+    if user_id is None:
+        return
+
+    pending = getattr(_state, 'pending', None)
+    if pending is not None:
+        pending.add(user_id)
+        return
+
+    UserDataVersion.objects.filter(user_id=user_id).update(
+        version=F('version') + 1,
+        updated_at=timezone.now()
+    )
+
+
+@contextmanager
+def bulk_data_change():
+    """
+    Bump each affected user's data version once, when the block ends.
+
+    Use it around imports and other bulk changes, either as a context manager
+    or as a view decorator. Blocks can be nested; the bumps happen when the
+    outermost block ends.
+    """
+    if getattr(_state, 'pending', None) is not None:
+        yield
+        return
+
+    _state.pending = set()
+    try:
+        yield
+    finally:
+        pending, _state.pending = _state.pending, None
+        for user_id in pending:
+            bump_data_version(user_id)
+
+
+def user_cache_key(prefix, user, *parts, version=None):
+    """
+    Build a cache key for data derived from a user's subscriptions.
+
+    Args:
+        prefix: Name of the cached thing, e.g. 'calendar-month'
+        user: The user the data belongs to
+        *parts: Anything else the cached value depends on
+        version: The user's data version, if already known
+
+    Returns:
+        A cache key that changes whenever the user's data changes
+    """
+    if version is None:
+        version = get_data_version(user)
+    return ':'.join(str(part) for part in (prefix, user.pk, version, *parts))
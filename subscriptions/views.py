@@ -1,92 +1,162 @@
-from django.shortcuts import render, redirect
-from django.urls import reverse_lazy
+from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse, reverse_lazy
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
-from .models import Subscription, Category, Currency
+from .models import Subscription, Category, Currency, Job, job_result_storage
 from .mixins import UserDataMixin, ObjectAccessMixin
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.utils.decorators import method_decorator
 from django.contrib import messages
 from django import forms
 import calendar
-import io
+import uuid
+import zipfile
 import requests
 import json
+from urllib.parse import urlencode
 from decimal import Decimal
 from datetime import datetime, timedelta, date
 from dateutil.relativedelta import relativedelta
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.core.paginator import Paginator
+from django.conf import settings
+from django.core.cache import cache
 from django.db.models.functions import Lower
-from django.db.models import Sum
-from .utils import calculate_next_renewal_date, is_renewal_date, generate_subscriptions_csv, parse_subscriptions_csv, generate_categories_csv, parse_categories_csv, generate_currencies_csv, parse_currencies_csv
+from django.db.models import F, Sum
+from .versioning import bulk_data_change, user_cache_key
+from .backup import generate_backup, read_manifest
+from .importers import existing_subscription_rows, stage_import, staged_import
+from .jobs import enqueue_job, get_progress
+from .pagination import KeysetPaginator
+from .search import search_subscriptions, search_words
+from .conditional import conditional_on_data
+from .calendar_cache import get_month_calendar_data, get_year_calendar_data
+from .utils import renewal_occurrences, generate_subscriptions_csv, parse_subscriptions_csv, generate_categories_csv, parse_categories_csv, generate_currencies_csv, parse_currencies_csv, open_csv_upload
+
+# Number of days the home page can look ahead for upcoming renewals
+UPCOMING_WINDOW_CHOICES = [7, 14, 30, 90]
+DEFAULT_UPCOMING_WINDOW = 14
+
+# Number of days each "renewing" filter of the subscription list looks ahead
+RENEWING_WINDOWS = {'week': 7, 'month': 30}
+
+# Seconds the subscription list's totals stay cached; they're keyed on the user's data version anyway
+LIST_TOTALS_CACHE_TIMEOUT = 24 * 60 * 60
+
 
 # Create your views here.
+@method_decorator(conditional_on_data(), name='get')
 class SubscriptionListView(UserDataMixin, ListView):
     model = Subscription
     template_name = 'subscriptions/subscription_list.html'
     context_object_name = 'subscriptions'
 
+    # Sort keys the list can be ordered by, each read in order from a (user, key) index
+    SORT_KEYS = {
+        'name': Lower('name'),
+        'cost': F('cost'),
+        'renewal_period': F('renewal_period'),
+        'start_date': F('start_date'),
+        'next_billing_date': F('next_billing_date'),
+    }
+
+    def get_filters(self):
+        """
+        Get the filters chosen in the request, leaving out any that aren't valid.
+        """
+        params = self.request.GET
+        filters = {}
+        if search_words(params.get('q')):
+            filters['q'] = params['q'].strip()
+        if params.get('status') in dict(Subscription.STATUS_CHOICES):
+            filters['status'] = params['status']
+        if params.get('category', '').isdigit():
+            filters['category'] = params['category']
+        if params.get('currency') in dict(Subscription.CURRENCY_CHOICES):
+            filters['currency'] = params['currency']
+        if params.get('renewal_period') in dict(Subscription.RENEWAL_CHOICES):
+            filters['renewal_period'] = params['renewal_period']
+        if params.get('renewing') in RENEWING_WINDOWS:
+            filters['renewing'] = params['renewing']
+        return filters
+
     def get_queryset(self):
         queryset = super().get_queryset()
+        filters = self.get_filters()
+
+        # Search the full-text index, which also gives the matches' relevance to sort by
+        self.relevance = None
+        if 'q' in filters:
+            queryset, self.relevance = search_subscriptions(queryset, filters['q'], user=self.request.user)
+
+        for field in ['status', 'category', 'currency', 'renewal_period']:
+            if field in filters:
+                queryset = queryset.filter(**{field: filters[field]})
+
+        # Only show active subscriptions renewing within the chosen window
+        if 'renewing' in filters:
+            today = date.today()
+            queryset = queryset.filter(status='active').renewing_between(
+                today, today + timedelta(days=RENEWING_WINDOWS[filters['renewing']] - 1)
+            )
 
-        # Get sort parameters from request
-        sort_by = self.request.GET.get('sort', 'name')
-        direction = self.request.GET.get('direction', 'asc')
-
-        # Map frontend field names to model field names if needed
-        field_mapping = {
-            'name': 'name',
-            'cost': 'cost',
-            'renewal_period': 'renewal_period',
-            'start_date': 'start_date',
-            'next_billing_date': 'next_billing_date'  # This will be handled specially
-        }
-
-        # Apply ordering
-        order_field = field_mapping.get(sort_by, 'name')
-
-        # Special handling for next_billing_date since it's not a model field
-        if order_field == 'next_billing_date':
-            # We'll handle this in get_context_data by sorting the queryset there
-            return queryset
-        # Use case-insensitive sorting for name field
-        elif order_field == 'name':
-            if direction == 'desc':
-                return queryset.order_by(Lower(order_field).desc())
-            else:
-                return queryset.order_by(Lower(order_field))
-        else:
-            if direction == 'desc':
-                order_field = f'-{order_field}'
-            return queryset.order_by(order_field)
+        return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-
-        # Get current sort parameters to pass to template
-        sort_by = self.request.GET.get('sort', 'name')
-        direction = self.request.GET.get('direction', 'asc')
+        queryset = context['subscriptions']
+        filters = self.get_filters()
+
+        # Searches sort the best matches first unless another order is chosen
+        sort_keys = dict(self.SORT_KEYS)
+        if self.relevance is not None:
+            sort_keys['relevance'] = self.relevance
+        default_sort = 'relevance' if 'relevance' in sort_keys else 'name'
+
+        # Get current sort and filter parameters to pass to template
+        sort_by = self.request.GET.get('sort') or default_sort
+        if sort_by not in sort_keys:
+            sort_by = default_sort
+        direction = 'desc' if self.request.GET.get('direction') == 'desc' else 'asc'
         context['current_sort'] = sort_by
         context['current_direction'] = direction
-
-        # Get all subscriptions and calculate next billing date
-        subscriptions_list = list(context['subscriptions'])
-        from .utils import get_next_billing_date
-
-        for subscription in subscriptions_list:
-            subscription.next_billing_date = get_next_billing_date(subscription)
-
-        # Sort by next_billing_date if requested
-        if sort_by == 'next_billing_date':
-            subscriptions_list.sort(
-                key=lambda x: x.next_billing_date,
-                reverse=(direction == 'desc')
-            )
+        context['default_sort'] = default_sort
+        context['filters'] = filters
+        context['renewing'] = filters.get('renewing', '')
+        context['filter_query'] = urlencode(filters)
+        context['categories'] = Category.objects.filter(user=self.request.user).order_by(Lower('name'))
+        context['status_choices'] = Subscription.STATUS_CHOICES
+        context['currency_choices'] = Subscription.CURRENCY_CHOICES
+        context['renewal_choices'] = Subscription.RENEWAL_CHOICES
+
+        # Get the page after or before the cursor, which the database seeks to through the sort key's index
+        paginator = KeysetPaginator(
+            queryset,
+            sort_keys[sort_by],
+            per_page=settings.SUBSCRIPTION_LIST_PAGE_SIZE,
+            descending=direction == 'desc',
+            # The renewing filter only keeps subscriptions that have a next billing date
+            nullable=sort_by == 'next_billing_date' and 'renewing' not in filters,
+        )
+        try:
+            page = paginator.page(after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+        except ValueError:
+            raise Http404('Invalid page.')
+        context['page_obj'] = page
+        context['is_paginated'] = page.has_other_pages()
+        context['is_first_page'] = not (self.request.GET.get('after') or self.request.GET.get('before'))
 
         # Separate active and cancelled subscriptions
         active_subscriptions = []
         cancelled_subscriptions = []
+        today = date.today()
+
+        for subscription in page:
+            # Show the right date for rows the nightly rollover hasn't moved on yet, without saving it
+            if subscription.next_billing_date and subscription.next_billing_date < today:
+                subscription.next_billing_date = subscription.compute_next_billing_date(today)
 
-        for subscription in subscriptions_list:
             if hasattr(subscription, 'status') and subscription.status == 'cancelled':
                 cancelled_subscriptions.append(subscription)
             else:
@@ -97,41 +167,31 @@ class SubscriptionListView(UserDataMixin, ListView):
         context['cancelled_subscriptions'] = cancelled_subscriptions
 
         # Keep the original list for backward compatibility
-        context['subscriptions'] = subscriptions_list
+        context['subscriptions'] = page.object_list
 
-        # Calculate annual cost for each subscription and group by currency
-        annual_totals = {}
+        context.update(self.get_totals(queryset, filters))
+        return context
 
-        for subscription in subscriptions_list:
-            # Skip cancelled subscriptions for annual cost calculation
-            if hasattr(subscription, 'status') and subscription.status == 'cancelled':
-                continue
-
-            currency = subscription.currency
-            annual_cost = subscription.cost
-
-            # Calculate annual cost based on renewal period
-            if subscription.renewal_period == 'weekly':
-                annual_cost = annual_cost * 52  # 52 weeks in a year
-            elif subscription.renewal_period == 'monthly':
-                annual_cost = annual_cost * 12  # 12 months in a year
-            elif subscription.renewal_period == 'quarterly':
-                annual_cost = annual_cost * 4   # 4 quarters in a year
-            elif subscription.renewal_period == 'biennial':
-                annual_cost = annual_cost / 2   # Cost is every 2 years
-            # For yearly, the cost is already annual
-
-            # Add to the appropriate currency total
-            if currency not in annual_totals:
-                annual_totals[currency] = {
-                    'total': 0,
-                    'symbol': subscription.get_currency_symbol()
+    def get_totals(self, queryset, filters):
+        """
+        Count and total every filtered subscription, not just those on the page.
+
+        The aggregates read all of the user's matching subscriptions, so they're
+        cached until the user's data changes and page after page costs the same.
+        """
+        key = user_cache_key('subscription-list-totals', self.request.user, urlencode(filters), date.today().isoformat())
+        totals = cache.get(key)
+        if totals is None:
+            # Sum annual costs by currency, skipping cancelled subscriptions
+            annual_totals = {}
+            for currency_totals in queryset.exclude(status='cancelled').cost_totals('currency'):
+                annual_totals[currency_totals['currency']] = {
+                    'total': currency_totals['annual_total'],
+                    'symbol': Subscription.CURRENCY_SYMBOLS.get(currency_totals['currency'], '$')
                 }
-
-            annual_totals[currency]['total'] += annual_cost
-
-        context['annual_totals'] = annual_totals
-        return context
+            totals = {'subscription_count': queryset.count(), 'annual_totals': annual_totals}
+            cache.set(key, totals, LIST_TOTALS_CACHE_TIMEOUT)
+        return totals
 
 class SubscriptionDetailView(ObjectAccessMixin, DetailView):
     model = Subscription
@@ -149,7 +209,7 @@ class SubscriptionCreateView(UserDataMixin, CreateView):
         form.fields['category'].queryset = Category.objects.filter(user=self.request.user).order_by(Lower('name'))
 
         # Set default currency if one exists
-        default_currency = Currency.objects.filter(is_default=True).first()
+        default_currency = Currency.objects.filter(user=self.request.user, is_default=True).first()
         if default_currency:
             form.fields['currency'].initial = default_currency.code
 
@@ -208,39 +268,39 @@ class SubscriptionDeleteView(ObjectAccessMixin, DeleteView):
 
 @login_required
 def home(request):
-    # Get all active subscriptions for the current user
-    subscriptions = Subscription.objects.filter(status='active', user=request.user)
+    # Get the number of days to look ahead, falling back to 2 weeks
+    try:
+        upcoming_days = int(request.GET.get('days', DEFAULT_UPCOMING_WINDOW))
+    except ValueError:
+        upcoming_days = DEFAULT_UPCOMING_WINDOW
+    if upcoming_days not in UPCOMING_WINDOW_CHOICES:
+        upcoming_days = DEFAULT_UPCOMING_WINDOW
 
-    # Get current date and date 2 weeks from now
+    # Get current date and the end of the upcoming window
     today = datetime.now().date()
-    two_weeks_from_now = today + timedelta(days=14)
-
-    # Find subscriptions that are upcoming within the next 2 weeks
-    upcoming_subscriptions = []
-
-    for subscription in subscriptions:
-        # Check each day in the next 2 weeks
-        current_date = today
-        while current_date <= two_weeks_from_now:
-            if is_renewal_date(subscription, current_date):
-                # Add subscription with its renewal date to the list
-                upcoming_subscriptions.append({
-                    'subscription': subscription,
-                    'renewal_date': current_date
-                })
-                break  # Only add the first renewal date for each subscription
-            current_date += timedelta(days=1)
-
-    # Sort upcoming subscriptions by renewal date
-    upcoming_subscriptions.sort(key=lambda x: x['renewal_date'])
+    window_end = today + timedelta(days=upcoming_days)
+
+    # Find the first renewal of each active subscription within the window, in date order
+    upcoming_subscriptions = [
+        {
+            'subscription': subscription,
+            'renewal_date': renewal_date
+        }
+        for subscription, renewal_date in renewal_occurrences(
+            request.user, today, window_end, first_only=True, status='active'
+        )
+    ]
 
     context = {
-        'upcoming_subscriptions': upcoming_subscriptions
+        'upcoming_subscriptions': upcoming_subscriptions,
+        'upcoming_days': upcoming_days,
+        'upcoming_window_choices': UPCOMING_WINDOW_CHOICES,
     }
 
     return render(request, 'subscriptions/home.html', context)
 
 @login_required
+@conditional_on_data()
 def calendar_view(request):
     # Get current month, year, and view type
     now = datetime.now()
@@ -253,54 +313,17 @@ def calendar_view(request):
     current_month = now.month
     current_year = now.year
 
-    # Get all subscriptions for the current user
+    # Renewals of all subscriptions for the current user are used
     # For past dates, include all subscriptions (including cancelled ones for historical view)
     # For future dates, only include active subscriptions
-    subscriptions = Subscription.objects.filter(user=request.user)
-
-    # Create a wrapper class to hold subscription and is_past flag
-    class SubscriptionWrapper:
-        def __init__(self, subscription, is_past):
-            self.subscription = subscription
-            self.is_past = is_past
-
-        def __getattr__(self, name):
-            # Delegate attribute access to the wrapped subscription
-            return getattr(self.subscription, name)
-
-        def __eq__(self, other):
-            # Allow comparison with the wrapped subscription
-            if isinstance(other, SubscriptionWrapper):
-                return self.subscription == other.subscription
-            return self.subscription == other
 
     if view_type == 'month':
         # Create a calendar for the current month
         cal = calendar.monthcalendar(year, month)
         month_name = calendar.month_name[month]
 
-        # Calculate renewal dates for each subscription
-        calendar_data = {}
-        for day_idx, week in enumerate(cal):
-            for weekday_idx, day in enumerate(week):
-                if day != 0:  # Skip days that are not part of the month
-                    calendar_data.setdefault(day, [])
-
-        for subscription in subscriptions:
-            start_date = subscription.start_date
-            renewal_dates = calculate_next_renewal_date(start_date, subscription.renewal_period, year, month)
-
-            for renewal_date in renewal_dates:
-                if renewal_date.day in calendar_data:
-                    # Create a wrapper with the subscription and is_past flag
-                    is_past = renewal_date < now.date()
-
-                    # Skip cancelled subscriptions for future dates
-                    if not is_past and hasattr(subscription, 'status') and subscription.status == 'cancelled':
-                        continue
-
-                    subscription_wrapper = SubscriptionWrapper(subscription, is_past)
-                    calendar_data[renewal_date.day].append(subscription_wrapper)
+        # Get the renewal entries for each day, cached until the user's data changes or the day rolls over
+        calendar_data = get_month_calendar_data(request.user, year, month, now.date())
 
         # Previous and next month links
         prev_month = month - 1
@@ -335,39 +358,19 @@ def calendar_view(request):
             'view_type': view_type,
         }
     else:  # Year view
+        # Get the renewal entries for each day of each month, assembled from the cached months
+        year_calendar_data = get_year_calendar_data(request.user, year, now.date())
+
         # Create a calendar for each month of the year
-        year_calendar = []
-        year_calendar_data = {}
-
-        for month_num in range(1, 13):
-            month_cal = calendar.monthcalendar(year, month_num)
-            month_name = calendar.month_name[month_num]
-
-            # Initialize calendar data for this month
-            month_data = {}
-            for week in month_cal:
-                for day in week:
-                    if day != 0:  # Skip days that are not part of the month
-                        month_data.setdefault(day, [])
-
-            # Calculate renewal dates for each subscription for this month
-            for subscription in subscriptions:
-                start_date = subscription.start_date
-                renewal_dates = calculate_next_renewal_date(start_date, subscription.renewal_period, year, month_num)
-
-                for renewal_date in renewal_dates:
-                    if renewal_date.day in month_data:
-                        # Create a wrapper with the subscription and is_past flag
-                        is_past = renewal_date < now.date()
-                        subscription_wrapper = SubscriptionWrapper(subscription, is_past)
-                        month_data[renewal_date.day].append(subscription_wrapper)
-
-            year_calendar.append({
+        year_calendar = [
+            {
                 'month_num': month_num,
-                'month_name': month_name,
-                'calendar': month_cal,
-                'calendar_data': month_data
-            })
+                'month_name': calendar.month_name[month_num],
+                'calendar': calendar.monthcalendar(year, month_num),
+                'calendar_data': year_calendar_data[month_num]
+            }
+            for month_num in range(1, 13)
+        ]
 
         # Previous and next year links
         prev_year = year - 1
@@ -397,19 +400,15 @@ def day_view(request, year, month, day):
     now = datetime.now().date()
     is_past = selected_date < now
 
-    # Get all subscriptions for the current user
-    subscriptions = Subscription.objects.filter(user=request.user)
-
     # Calculate subscriptions that renew on this day
     day_subscriptions = []
 
-    for subscription in subscriptions:
+    for subscription, renewal_date in renewal_occurrences(request.user, selected_date, selected_date):
         # Skip cancelled subscriptions for future dates
         if not is_past and hasattr(subscription, 'status') and subscription.status == 'cancelled':
             continue
 
-        if is_renewal_date(subscription, selected_date):
-            day_subscriptions.append(subscription)
+        day_subscriptions.append(subscription)
 
     # Format the date for display
     date_display = selected_date.strftime('%A, %B %d, %Y')
@@ -557,6 +556,7 @@ def set_currency_default(request, pk):
 
 
 @login_required
+@conditional_on_data()
 def export_subscriptions_csv(request):
     """
     Export all subscriptions to a CSV file.
@@ -564,51 +564,195 @@ def export_subscriptions_csv(request):
     # Get all subscriptions for the current user
     subscriptions = Subscription.objects.filter(user=request.user).order_by(Lower('name'))
 
-    # Generate CSV data
-    csv_data = generate_subscriptions_csv(subscriptions)
-
-    # Create HTTP response with CSV data
-    response = HttpResponse(csv_data, content_type='text/csv')
+    # Stream the CSV data as it is generated
+    response = StreamingHttpResponse(generate_subscriptions_csv(subscriptions), content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="subscriptions.csv"'
 
     return response
 
 
+@login_required
+@conditional_on_data()
 def export_categories_csv(request):
     """
     Export all categories to a CSV file.
     """
-    # Get all categories
-    categories = Category.objects.all().order_by(Lower('name'))
-
-    # Generate CSV data
-    csv_data = generate_categories_csv(categories)
+    # Get all categories for the current user
+    categories = Category.objects.filter(user=request.user).order_by(Lower('name'))
 
-    # Create HTTP response with CSV data
-    response = HttpResponse(csv_data, content_type='text/csv')
+    # Stream the CSV data as it is generated
+    response = StreamingHttpResponse(generate_categories_csv(categories), content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="categories.csv"'
 
     return response
 
 
+@login_required
+@conditional_on_data()
 def export_currencies_csv(request):
     """
     Export all currencies to a CSV file.
     """
-    # Get all currencies
-    currencies = Currency.objects.all().order_by('code')
-
-    # Generate CSV data
-    csv_data = generate_currencies_csv(currencies)
+    # Get all currencies for the current user
+    currencies = Currency.objects.filter(user=request.user).order_by('code')
 
-    # Create HTTP response with CSV data
-    response = HttpResponse(csv_data, content_type='text/csv')
+    # Stream the CSV data as it is generated
+    response = StreamingHttpResponse(generate_currencies_csv(currencies), content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename="currencies.csv"'
 
     return response
 
+# Preview template and context name for each kind of staged import
+STAGED_IMPORT_PREVIEWS = {
+    'subscriptions': ('subscriptions/import_preview.html', 'subscriptions'),
+    'categories': ('subscriptions/import_categories_preview.html', 'categories'),
+    'currencies': ('subscriptions/import_currencies_preview.html', 'currencies'),
+}
+
+
+def selected_row_numbers(selected_values):
+    """
+    Get the row numbers picked on an import preview page, leaving out invalid values.
+    """
+    row_numbers = []
+    for value in selected_values:
+        try:
+            row_numbers.append(int(value))
+        except ValueError:
+            continue
+    return row_numbers
+
+
+def stage_uploaded_csv(request, kind, parse_csv, item_name):
+    """
+    Parse an uploaded CSV file and stage its rows for the import preview.
+
+    Args:
+        request: The upload request
+        kind: What the file contains, one of StagedImport.KIND_CHOICES
+        parse_csv: Function parsing the CSV data into row dictionaries
+        item_name: Singular name of the rows, used in error messages
+
+    Returns:
+        A redirect to the import preview, or back to settings on errors
+    """
+    # Check if a file was uploaded
+    if 'csv_file' not in request.FILES:
+        messages.error(request, 'Please select a CSV file to import.')
+        return redirect('settings')
+
+    csv_file = request.FILES['csv_file']
+
+    # Check if it's a CSV file
+    if not csv_file.name.endswith('.csv'):
+        messages.error(request, 'Please upload a CSV file.')
+        return redirect('settings')
+
+    # Parse the CSV file as it is read, staging its valid rows
+    try:
+        with open_csv_upload(csv_file) as csv_data:
+            import_id, staged = stage_import(request.user, kind, parse_csv(csv_data))
+    except Exception as e:
+        messages.error(request, f'Error importing CSV file: {str(e)}')
+        return redirect('settings')
+
+    # Report rows that can't be imported
+    if staged.error_count:
+        messages.warning(request, f'{staged.error_count} rows will not be imported: {staged.error_summary()}')
+
+    # If no rows were found, show an error
+    if not staged.imported:
+        messages.error(request, f'No valid {item_name} data found in the CSV file.')
+        return redirect('settings')
+
+    # Show a preview of the rows to import
+    return redirect('import-preview', import_id=import_id)
+
+
+def confirm_staged_import(request, kind, noun, selected_field):
+    """
+    Queue the import of the staged rows the user confirmed on the import preview page.
+
+    Args:
+        request: The confirmation request, with the import_id of the staged import
+        kind: What the staged rows are, one of StagedImport.KIND_CHOICES
+        noun: Plural name of the rows, used in messages
+        selected_field: Name of the checkboxes of the selected rows
+
+    Returns:
+        A redirect to the import job's status page, or back to settings
+    """
+    try:
+        import_id = uuid.UUID(request.POST.get('import_id', ''))
+    except ValueError:
+        import_id = None
+
+    staged = staged_import(request.user, import_id).filter(kind=kind)
+    if import_id is None or not staged.exists():
+        messages.error(request, 'This import has expired. Please upload the CSV file again.')
+        return redirect('settings')
+
+    # Pick the rows to import
+    if 'import_all' in request.POST:
+        row_numbers = None
+    elif 'import_selected' in request.POST:
+        row_numbers = selected_row_numbers(request.POST.getlist(selected_field))
+
+        if not row_numbers:
+            messages.error(request, f'No {noun} selected for import.')
+            return redirect('settings')
+
+        staged = staged.filter(row_number__in=row_numbers)
+    else:
+        return redirect('settings')
+
+    # Queue the import, which discards the staged rows once it's done
+    job = enqueue_job(
+        request.user,
+        f'import_{kind}',
+        {'import_id': str(import_id), 'row_numbers': row_numbers},
+        total=staged.count()
+    )
+    return redirect('job-detail', pk=job.pk)
+
 
 @login_required
+def import_preview(request, import_id):
+    """
+    Show a page of the rows staged from a CSV file, for the user to pick
+    the ones to import.
+    """
+    staged = staged_import(request.user, import_id)
+    paginator = Paginator(staged, settings.IMPORT_PREVIEW_PAGE_SIZE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    staged_page = list(page_obj)
+
+    if not staged_page:
+        messages.error(request, 'This import has expired. Please upload the CSV file again.')
+        return redirect('settings')
+
+    kind = staged_page[0].kind
+    rows = [dict(row.data, row_number=row.row_number) for row in staged_page]
+
+    # Mark the subscriptions the user already has, which won't be imported again
+    existing = set()
+    if kind == 'subscriptions':
+        existing = existing_subscription_rows(request.user, ((row.row_number, row.data) for row in staged_page))
+        for row in rows:
+            row['exists'] = row['row_number'] in existing
+
+    template_name, context_name = STAGED_IMPORT_PREVIEWS[kind]
+    return render(request, template_name, {
+        context_name: rows,
+        'import_id': import_id,
+        'page_obj': page_obj,
+        'total_rows': paginator.count,
+        'existing_count': len(existing),
+    })
+
+
+@login_required
+@bulk_data_change()
 def import_subscriptions_csv(request):
     """
     Import subscriptions from a CSV file.
@@ -616,162 +760,17 @@ def import_subscriptions_csv(request):
     if request.method == 'POST':
         # Check if we're processing a form submission from the preview page
         if 'from_preview' in request.POST:
-            # Get the data from the session
-            subscriptions_data = []
-            session_data = request.session.get('import_preview_data', [])
-
-            for sub in session_data:
-                # Convert the stored data back to the format expected by the import code
-                subscription = {
-                    'name': sub.get('name', ''),
-                    'category': sub.get('category', ''),
-                    'cost': sub.get('cost', ''),
-                    'currency': sub.get('currency', ''),
-                    'renewal_period': sub.get('renewal_period', ''),
-                    'url': sub.get('url', ''),
-                    'notes': sub.get('notes', ''),
-                    'status': sub.get('status', 'active'),
-                    'cancellation_date': sub.get('cancellation_date', None)
-                }
-
-                # Convert the date string back to a date object
-                if sub.get('start_date'):
-                    try:
-                        subscription['start_date'] = datetime.fromisoformat(sub['start_date']).date()
-                    except ValueError:
-                        subscription['start_date'] = datetime.now().date()
-                else:
-                    subscription['start_date'] = datetime.now().date()
-
-                subscriptions_data.append(subscription)
-
-            # Clear the session data
-            if 'import_preview_data' in request.session:
-                del request.session['import_preview_data']
-
-            # Process the import
-            if 'import_all' in request.POST:
-                imported_count = 0
-                for subscription_data in subscriptions_data:
-                    # Get or create category if provided
-                    category = None
-                    if subscription_data.get('category'):
-                        category, _ = Category.objects.get_or_create(name=subscription_data['category'], user=request.user)
-
-                    # Create subscription
-                    Subscription.objects.create(
-                        name=subscription_data['name'],
-                        category=category,
-                        cost=subscription_data['cost'],
-                        currency=subscription_data['currency'],
-                        renewal_period=subscription_data['renewal_period'],
-                        start_date=subscription_data['start_date'],
-                        url=subscription_data['url'],
-                        notes=subscription_data['notes'],
-                        status=subscription_data['status'],
-                        cancellation_date=subscription_data['cancellation_date'],
-                        user=request.user
-                    )
-                    imported_count += 1
-
-                messages.success(request, f'Successfully imported {imported_count} subscriptions.')
-                return redirect('settings')
-
-            # If 'import_selected' is in POST, import only selected subscriptions
-            elif 'import_selected' in request.POST:
-                selected_indices = request.POST.getlist('selected_subscriptions')
-
-                if not selected_indices:
-                    messages.error(request, 'No subscriptions selected for import.')
-                    return redirect('settings')
-
-                imported_count = 0
-                for index in selected_indices:
-                    try:
-                        subscription_data = subscriptions_data[int(index)]
-
-                        # Get or create category if provided
-                        category = None
-                        if subscription_data.get('category'):
-                            category, _ = Category.objects.get_or_create(name=subscription_data['category'], user=request.user)
-
-                        # Create subscription
-                        Subscription.objects.create(
-                            name=subscription_data['name'],
-                            category=category,
-                            cost=subscription_data['cost'],
-                            currency=subscription_data['currency'],
-                            renewal_period=subscription_data['renewal_period'],
-                            start_date=subscription_data['start_date'],
-                            url=subscription_data['url'],
-                            notes=subscription_data['notes'],
-                            status=subscription_data['status'],
-                            cancellation_date=subscription_data['cancellation_date'],
-                            user=request.user
-                        )
-                        imported_count += 1
-                    except (IndexError, ValueError):
-                        continue
-
-                messages.success(request, f'Successfully imported {imported_count} subscriptions.')
-                return redirect('settings')
+            return confirm_staged_import(request, 'subscriptions', 'subscriptions', 'selected_subscriptions')
 
         # Handle initial file upload
-        else:
-            # Check if a file was uploaded
-            if 'csv_file' not in request.FILES:
-                messages.error(request, 'Please select a CSV file to import.')
-                return redirect('settings')
-
-            csv_file = request.FILES['csv_file']
-
-            # Check if it's a CSV file
-            if not csv_file.name.endswith('.csv'):
-                messages.error(request, 'Please upload a CSV file.')
-                return redirect('settings')
-
-            # Parse the CSV file
-            try:
-                # Decode the file content
-                file_data = csv_file.read().decode('utf-8')
-                csv_data = io.StringIO(file_data)
-                subscriptions_data = parse_subscriptions_csv(csv_data)
-
-                # If no subscriptions were found, show an error
-                if not subscriptions_data:
-                    messages.error(request, 'No valid subscription data found in the CSV file.')
-                    return redirect('settings')
-
-                # Store the parsed data in the session for later use
-                request.session['import_preview_data'] = [
-                    {
-                        'name': sub.get('name', ''),
-                        'category': sub.get('category', ''),
-                        'cost': str(sub.get('cost', '')),
-                        'currency': sub.get('currency', ''),
-                        'renewal_period': sub.get('renewal_period', ''),
-                        'start_date': sub.get('start_date').isoformat() if sub.get('start_date') else '',
-                        'url': sub.get('url', ''),
-                        'notes': sub.get('notes', ''),
-                        'status': sub.get('status', 'active'),
-                        'cancellation_date': sub.get('cancellation_date').isoformat() if sub.get('cancellation_date') else None
-                    }
-                    for sub in subscriptions_data
-                ]
-
-                # Show a preview of the subscriptions to import
-                return render(request, 'subscriptions/import_preview.html', {
-                    'subscriptions': subscriptions_data
-                })
-
-            except Exception as e:
-                messages.error(request, f'Error importing CSV file: {str(e)}')
-                return redirect('settings')
+        return stage_uploaded_csv(request, 'subscriptions', parse_subscriptions_csv, 'subscription')
 
     # If not a POST request, redirect to settings
     return redirect('settings')
 
 
+@login_required
+@bulk_data_change()
 def import_categories_csv(request):
     """
     Import categories from a CSV file.
@@ -779,125 +778,17 @@ def import_categories_csv(request):
     if request.method == 'POST':
         # Check if we're processing a form submission from the preview page
         if 'from_preview' in request.POST:
-            # Get the data from the session
-            categories_data = []
-            session_data = request.session.get('import_categories_preview_data', [])
-
-            for cat in session_data:
-                # Convert the stored data back to the format expected by the import code
-                category = {
-                    'name': cat.get('name', '')
-                }
-                categories_data.append(category)
-
-            # Clear the session data
-            if 'import_categories_preview_data' in request.session:
-                del request.session['import_categories_preview_data']
-
-            # Process the import
-            if 'import_all' in request.POST:
-                imported_count = 0
-                skipped_count = 0
-                for category_data in categories_data:
-                    # Skip if category with this name already exists for this user
-                    if Category.objects.filter(name=category_data['name'], user=request.user).exists():
-                        skipped_count += 1
-                        continue
-
-                    # Create category
-                    Category.objects.create(
-                        name=category_data['name'],
-                        user=request.user
-                    )
-                    imported_count += 1
-
-                if skipped_count > 0:
-                    messages.success(request, f'Successfully imported {imported_count} categories. Skipped {skipped_count} duplicate entries.')
-                else:
-                    messages.success(request, f'Successfully imported {imported_count} categories.')
-                return redirect('settings')
-
-            # If 'import_selected' is in POST, import only selected categories
-            elif 'import_selected' in request.POST:
-                selected_indices = request.POST.getlist('selected_categories')
-
-                if not selected_indices:
-                    messages.error(request, 'No categories selected for import.')
-                    return redirect('settings')
-
-                imported_count = 0
-                skipped_count = 0
-                for index in selected_indices:
-                    try:
-                        category_data = categories_data[int(index)]
-
-                        # Skip if category with this name already exists for this user
-                        if Category.objects.filter(name=category_data['name'], user=request.user).exists():
-                            skipped_count += 1
-                            continue
-
-                        # Create category
-                        Category.objects.create(
-                            name=category_data['name'],
-                            user=request.user
-                        )
-                        imported_count += 1
-                    except (IndexError, ValueError):
-                        continue
-
-                if skipped_count > 0:
-                    messages.success(request, f'Successfully imported {imported_count} categories. Skipped {skipped_count} duplicate entries.')
-                else:
-                    messages.success(request, f'Successfully imported {imported_count} categories.')
-                return redirect('settings')
+            return confirm_staged_import(request, 'categories', 'categories', 'selected_categories')
 
         # Handle initial file upload
-        else:
-            # Check if a file was uploaded
-            if 'csv_file' not in request.FILES:
-                messages.error(request, 'Please select a CSV file to import.')
-                return redirect('settings')
-
-            csv_file = request.FILES['csv_file']
-
-            # Check if it's a CSV file
-            if not csv_file.name.endswith('.csv'):
-                messages.error(request, 'Please upload a CSV file.')
-                return redirect('settings')
-
-            # Parse the CSV file
-            try:
-                # Decode the file content
-                file_data = csv_file.read().decode('utf-8')
-                csv_data = io.StringIO(file_data)
-                categories_data = parse_categories_csv(csv_data)
-
-                # If no categories were found, show an error
-                if not categories_data:
-                    messages.error(request, 'No valid category data found in the CSV file.')
-                    return redirect('settings')
-
-                # Store the parsed data in the session for later use
-                request.session['import_categories_preview_data'] = [
-                    {
-                        'name': cat.get('name', '')
-                    }
-                    for cat in categories_data
-                ]
-
-                # Show a preview of the categories to import
-                return render(request, 'subscriptions/import_categories_preview.html', {
-                    'categories': categories_data
-                })
-
-            except Exception as e:
-                messages.error(request, f'Error importing CSV file: {str(e)}')
-                return redirect('settings')
+        return stage_uploaded_csv(request, 'categories', parse_categories_csv, 'category')
 
     # If not a POST request, redirect to settings
     return redirect('settings')
 
 
+@login_required
+@bulk_data_change()
 def import_currencies_csv(request):
     """
     Import currencies from a CSV file.
@@ -905,130 +796,134 @@ def import_currencies_csv(request):
     if request.method == 'POST':
         # Check if we're processing a form submission from the preview page
         if 'from_preview' in request.POST:
-            # Get the data from the session
-            currencies_data = []
-            session_data = request.session.get('import_currencies_preview_data', [])
-
-            for curr in session_data:
-                # Convert the stored data back to the format expected by the import code
-                currency = {
-                    'code': curr.get('code', ''),
-                    'name': curr.get('name', ''),
-                    'symbol': curr.get('symbol', ''),
-                    'is_default': curr.get('is_default', False)
-                }
-                currencies_data.append(currency)
-
-            # Clear the session data
-            if 'import_currencies_preview_data' in request.session:
-                del request.session['import_currencies_preview_data']
-
-            # Process the import
-            if 'import_all' in request.POST:
-                imported_count = 0
-                skipped_count = 0
-                for currency_data in currencies_data:
-                    # Skip if currency with this code already exists
-                    if Currency.objects.filter(code=currency_data['code']).exists():
-                        skipped_count += 1
-                        continue
-
-                    # Create currency
-                    Currency.objects.create(
-                        code=currency_data['code'],
-                        name=currency_data['name'],
-                        symbol=currency_data['symbol'],
-                        is_default=currency_data['is_default']
-                    )
-                    imported_count += 1
-
-                if skipped_count > 0:
-                    messages.success(request, f'Successfully imported {imported_count} currencies. Skipped {skipped_count} duplicate entries.')
-                else:
-                    messages.success(request, f'Successfully imported {imported_count} currencies.')
-                return redirect('settings')
-
-            # If 'import_selected' is in POST, import only selected currencies
-            elif 'import_selected' in request.POST:
-                selected_indices = request.POST.getlist('selected_currencies')
-
-                if not selected_indices:
-                    messages.error(request, 'No currencies selected for import.')
-                    return redirect('settings')
-
-                imported_count = 0
-                skipped_count = 0
-                for index in selected_indices:
-                    try:
-                        currency_data = currencies_data[int(index)]
-
-                        # Skip if currency with this code already exists
-                        if Currency.objects.filter(code=currency_data['code']).exists():
-                            skipped_count += 1
-                            continue
-
-                        # Create currency
-                        Currency.objects.create(
-                            code=currency_data['code'],
-                            name=currency_data['name'],
-                            symbol=currency_data['symbol'],
-                            is_default=currency_data['is_default']
-                        )
-                        imported_count += 1
-                    except (IndexError, ValueError):
-                        continue
-
-                if skipped_count > 0:
-                    messages.success(request, f'Successfully imported {imported_count} currencies. Skipped {skipped_count} duplicate entries.')
-                else:
-                    messages.success(request, f'Successfully imported {imported_count} currencies.')
-                return redirect('settings')
+            return confirm_staged_import(request, 'currencies', 'currencies', 'selected_currencies')
 
         # Handle initial file upload
-        else:
-            # Check if a file was uploaded
-            if 'csv_file' not in request.FILES:
-                messages.error(request, 'Please select a CSV file to import.')
-                return redirect('settings')
-
-            csv_file = request.FILES['csv_file']
-
-            # Check if it's a CSV file
-            if not csv_file.name.endswith('.csv'):
-                messages.error(request, 'Please upload a CSV file.')
-                return redirect('settings')
-
-            # Parse the CSV file
-            try:
-                # Decode the file content
-                file_data = csv_file.read().decode('utf-8')
-                csv_data = io.StringIO(file_data)
-                currencies_data = parse_currencies_csv(csv_data)
-
-                # If no currencies were found, show an error
-                if not currencies_data:
-                    messages.error(request, 'No valid currency data found in the CSV file.')
-                    return redirect('settings')
-
-                # Store the parsed data in the session for later use
-                request.session['import_currencies_preview_data'] = [
-                    {
-                        'code': curr.get('code', ''),
-                        'name': curr.get('name', ''),
-                        'symbol': curr.get('symbol', ''),
-                        'is_default': curr.get('is_default', False)
-                    }
-                    for curr in currencies_data
-                ]
-
-                # Show a preview of the currencies to import
-                return render(request, 'subscriptions/import_currencies_preview.html', {
-                    'currencies': currencies_data
-                })
-
-            except Exception as e:
-                messages.error(request, f'Error importing CSV file: {str(e)}')
-                return redirect('settings')
+        return stage_uploaded_csv(request, 'currencies', parse_currencies_csv, 'currency')
 
     # If not a POST request, redirect to settings
     return redirect('settings')
+
+
+@login_required
+def export_subscriptions_job(request):
+    """
+    Queue an export of all subscriptions to a CSV file, to download once it's ready.
+    """
+    if request.method != 'POST':
+        return redirect('settings')
+
+    job = enqueue_job(request.user, 'export_subscriptions')
+    return redirect('job-detail', pk=job.pk)
+
+
+@login_required
+def backup(request):
+    """
+    Download a backup of all the user's currencies, categories and subscriptions.
+    """
+    # Stream the archive as it is built
+    response = StreamingHttpResponse(generate_backup(request.user), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="subcal-backup-{date.today().isoformat()}.zip"'
+
+    return response
+
+
+@login_required
+def restore_backup(request):
+    """
+    Queue the restore of an uploaded backup archive.
+    """
+    if request.method != 'POST':
+        return redirect('settings')
+
+    # Check if a file was uploaded
+    if 'backup_file' not in request.FILES:
+        messages.error(request, 'Please select a backup file to restore.')
+        return redirect('settings')
+
+    backup_file = request.FILES['backup_file']
+
+    # Check it's a backup before queueing it
+    try:
+        with zipfile.ZipFile(backup_file) as archive:
+            manifest = read_manifest(archive)
+    except zipfile.BadZipFile:
+        messages.error(request, 'This file is not a SubCal backup.')
+        return redirect('settings')
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect('settings')
+
+    # Keep the archive for the worker, which deletes it once restored
+    archive_name = job_result_storage().save(f'restores/{uuid.uuid4()}.zip', backup_file)
+    counts = manifest.get('counts') or {}
+    job = enqueue_job(
+        request.user,
+        'restore_backup',
+        {'archive': archive_name},
+        total=sum(count for count in counts.values() if isinstance(count, int)) or None
+    )
+    return redirect('job-detail', pk=job.pk)
+
+
+def job_status(job):
+    """
+    Describe a job's state for the status page and the progress endpoint.
+    """
+    progress, total = get_progress(job)
+    if job.status == 'succeeded':
+        percent = 100
+    elif total:
+        percent = min(100, progress * 100 // total)
+    else:
+        percent = None
+
+    return {
+        'id': job.pk,
+        'kind': job.get_kind_display(),
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress': progress,
+        'total': total,
+        'percent': percent,
+        'finished': job.is_finished(),
+        'message': job.result.get('message', ''),
+        'warning': job.result.get('warning', ''),
+        'error': job.error,
+        'download_url': reverse('job-download', args=[job.pk]) if job.result_file else None,
+    }
+
+
+@login_required
+def job_detail(request, pk):
+    """
+    Show the status of a background job, polling its progress until it finishes.
+    """
+    job = get_object_or_404(Job, pk=pk, user=request.user)
+    return render(request, 'subscriptions/job_detail.html', {
+        'job': job,
+        'status': job_status(job),
+    })
+
+
+@login_required
+def job_progress(request, pk):
+    """
+    Return the status of a background job as JSON, for the status page to poll.
+    """
+    job = get_object_or_404(Job, pk=pk, user=request.user)
+    response = JsonResponse(job_status(job))
+    patch_cache_control(response, no_store=True)
+    return response
+
+
+@login_required
+def job_download(request, pk):
+    """
+    Download the file produced by a finished export job.
+    """
+    job = get_object_or_404(Job, pk=pk, user=request.user, status='succeeded')
+    if not job.result_file:
+        raise Http404('This job has no file to download.')
+    return FileResponse(job.result_file.open('rb'), as_attachment=True, filename='subscriptions.csv', content_type='text/csv')
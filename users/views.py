@@ -8,6 +8,7 @@ from django.contrib.auth.views import LoginView, LogoutView, PasswordChangeView,
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
 from django.views.generic import CreateView, UpdateView, DetailView, TemplateView
+from django.db.models import Count, Q
 
 from subscriptions.mixins import AdminRequiredMixin
 from .forms import (
@@ -147,7 +148,6 @@ class UserProfileView(LoginRequiredMixin, DetailView):
 
         # Import here to avoid circular imports
         from subscriptions.models import Subscription
-        from decimal import Decimal
 
         # Get active and cancelled subscriptions for the current user
         user = self.request.user
@@ -158,42 +158,14 @@ class UserProfileView(LoginRequiredMixin, DetailView):
         user_profile = context['user_profile']
         user_profile.subscription_count = user.subscriptions.count()
 
-        # Calculate monthly costs by currency
-        monthly_costs = {}
-        for subscription in context['active_subscriptions']:
-            currency = subscription.currency
-            monthly_cost = self.calculate_monthly_cost(subscription)
-
-            if currency not in monthly_costs:
-                monthly_costs[currency] = Decimal('0.0')
-
-            monthly_costs[currency] += monthly_cost
-
-        user_profile.total_monthly_cost = monthly_costs
+        # Sum monthly costs by currency
+        user_profile.total_monthly_cost = {
+            totals['currency']: totals['monthly_total']
+            for totals in context['active_subscriptions'].cost_totals('currency')
+        }
 
         return context
 
-    def calculate_monthly_cost(self, subscription):
-        """
-        Calculate monthly cost based on renewal period.
-        """
-        from decimal import Decimal
-
-        cost = subscription.cost
-
-        if subscription.renewal_period == 'weekly':
-            return cost * Decimal('4.33')  # Average weeks in a month (52/12)
-        elif subscription.renewal_period == 'monthly':
-            return cost
-        elif subscription.renewal_period == 'quarterly':
-            return cost / Decimal('3')  # 3 months in a quarter
-        elif subscription.renewal_period == 'yearly':
-            return cost / Decimal('12')  # 12 months in a year
-        elif subscription.renewal_period == 'biennial':
-            return cost / Decimal('24')  # 24 months in 2 years
-        else:
-            return cost  # Default to the cost as is
-
 
 class UserProfileUpdateView(LoginRequiredMixin, UpdateView):
     """
@@ -240,8 +212,22 @@ class AdminDashboardView(AdminRequiredMixin, TemplateView):
 
         # Get subscription statistics
         from subscriptions.models import Subscription
-        context['total_subscriptions'] = Subscription.objects.count()
-        context['active_subscriptions'] = Subscription.objects.filter(status='active').count()
+        # Both counts cover every user's subscriptions, so count them in one pass
+        subscription_counts = Subscription.objects.aggregate(
+            total=Count('pk'),
+            active=Count('pk', filter=Q(status='active'))
+        )
+        context['total_subscriptions'] = subscription_counts['total']
+        context['active_subscriptions'] = subscription_counts['active']
+
+        # Get calendar cache statistics
+        from subscriptions.calendar_cache import calendar_cache_stats
+        context['calendar_cache_stats'] = calendar_cache_stats()
+
+        # Get background job counts by status
+        from subscriptions.models import Job
+        job_counts = dict(Job.objects.values_list('status').annotate(count=Count('pk')).order_by())
+        context['job_counts'] = {status: job_counts.get(status, 0) for status, _ in Job.STATUS_CHOICES}
 
         # Get recent users
         context['recent_users'] = User.objects.order_by('-date_joined')[:5]